@@ -0,0 +1,159 @@
+import asyncio
+import os
+import re
+
+import orjson
+
+from app.database import POOL_MAX
+from app.hashing import HASH_WORKERS
+
+# Control de admisión por clase de ruta: cada clase tiene su propio límite de
+# peticiones en curso y su propia cola acotada, así que una avalancha de
+# logins (bcrypt) o de listas largas no deja sin lugar a las lecturas
+# puntuales. Lo que no cabe en la cola, o espera más de ADMISION_ESPERA_MS,
+# recibe 503 con Retry-After en vez de quedar esperando indefinidamente.
+ADMISION_ESPERA_MS = float(os.getenv("ADMISION_ESPERA_MS", "1000"))
+ADMISION_RETRY_AFTER = os.getenv("ADMISION_RETRY_AFTER", "1")   # segundos
+
+
+def _entero(variable: str, defecto: int) -> int:
+    return int(os.getenv(variable, str(defecto)))
+
+
+class ClaseAdmision:
+    def __init__(self, nombre: str, concurrencia: int, cola: int):
+        self.nombre = nombre
+        self.concurrencia = max(1, concurrencia)
+        self.cola = max(0, cola)
+        self._semaforo = asyncio.Semaphore(self.concurrencia)
+        self.en_curso = 0
+        self.en_cola = 0
+        self.admitidas = 0
+        self.rechazos_cola = 0      # la cola estaba llena
+        self.rechazos_espera = 0    # esperó más de ADMISION_ESPERA_MS
+
+    async def entrar(self) -> bool:
+        if self._semaforo.locked():
+            if self.en_cola >= self.cola:
+                self.rechazos_cola += 1
+                return False
+            self.en_cola += 1
+            try:
+                await asyncio.wait_for(self._semaforo.acquire(), ADMISION_ESPERA_MS / 1000)
+            except asyncio.TimeoutError:
+                self.rechazos_espera += 1
+                return False
+            finally:
+                self.en_cola -= 1
+        else:
+            await self._semaforo.acquire()
+        self.en_curso += 1
+        self.admitidas += 1
+        return True
+
+    def salir(self):
+        self.en_curso -= 1
+        self._semaforo.release()
+
+    def estadisticas(self) -> dict:
+        return {
+            "concurrencia": self.concurrencia,
+            "cola": self.cola,
+            "en_curso": self.en_curso,
+            "en_cola": self.en_cola,
+            "admitidas": self.admitidas,
+            "rechazos_cola": self.rechazos_cola,
+            "rechazos_espera": self.rechazos_espera,
+        }
+
+
+# -------------------- CLASES Y RUTAS --------------------
+# Por defecto las listas pueden ocupar a lo más la mitad del pool y las
+# rutas con bcrypt el doble de los procesos de hashing
+CLASES = {
+    "hashing": ClaseAdmision(
+        "hashing", _entero("ADMISION_HASHING_CONCURRENCIA", HASH_WORKERS * 2),
+        _entero("ADMISION_HASHING_COLA", HASH_WORKERS * 8)
+    ),
+    "listas": ClaseAdmision(
+        "listas", _entero("ADMISION_LISTAS_CONCURRENCIA", max(1, POOL_MAX // 2)),
+        _entero("ADMISION_LISTAS_COLA", POOL_MAX)
+    ),
+    "puntuales": ClaseAdmision(
+        "puntuales", _entero("ADMISION_PUNTUALES_CONCURRENCIA", POOL_MAX * 2),
+        _entero("ADMISION_PUNTUALES_COLA", POOL_MAX * 4)
+    ),
+}
+
+# (clase, método, ruta); el resto (escrituras sin bcrypt, monitoreo) no se limita
+_RUTAS = [
+    ("hashing", "GET", r"/usuarios/login"),
+    ("hashing", "POST", r"/usuarios/registro-cliente"),
+    ("hashing", "POST", r"/usuarios/registro-trabajador(/importar)?"),
+    ("hashing", "POST", r"/usuarios/registro-administrador"),
+    ("hashing", "PUT", r"/usuarios/cambiar-clave"),
+    ("hashing", "PATCH", r"/usuarios/modificar-clave/[^/]+"),
+    ("listas", "GET", r"/pagos/?"),
+    ("listas", "GET", r"/pagos/exportar"),
+    ("listas", "GET", r"/pagos/analytics"),
+    ("listas", "GET", r"/usuarios/usuarios(/exportar)?"),
+    ("listas", "GET", r"/despacho/?"),
+    ("listas", "GET", r"/despacho/exportar"),
+    ("puntuales", "GET", r"/pagos/[^/]+(/resumen)?"),
+    ("puntuales", "GET", r"/despacho/usuario/[^/]+"),
+    ("puntuales", "GET", r"/usuarios/usuario/[^/]+"),
+    ("puntuales", "GET", r"/usuarios/buscar-usuario-por-email/?"),
+    ("puntuales", "GET", r"/usuarios/(comuna|administrador)"),
+]
+_PATRONES = [(clase, metodo, re.compile(ruta)) for clase, metodo, ruta in _RUTAS]
+
+
+def clasificar(metodo: str, ruta: str):
+    # El orden importa: /pagos/exportar y /pagos/analytics son listas aunque calcen con /pagos/{rut}
+    for clase, metodo_clase, patron in _PATRONES:
+        if metodo == metodo_clase and patron.fullmatch(ruta):
+            return CLASES[clase]
+    return None
+
+
+# -------------------- MIDDLEWARE --------------------
+_CUERPO_RECHAZO = orjson.dumps({"detail": "Servicio saturado, intente nuevamente"})
+
+
+class MiddlewareAdmision:
+    # Middleware ASGI puro: se decide antes de enrutar, así que una petición
+    # rechazada no toma conexión del pool ni pasa por las dependencias
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        clase = clasificar(scope["method"], scope["path"])
+        if clase is None:
+            return await self.app(scope, receive, send)
+
+        if not await clase.entrar():
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(_CUERPO_RECHAZO)).encode("ascii")),
+                    (b"retry-after", ADMISION_RETRY_AFTER.encode("ascii")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": _CUERPO_RECHAZO})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            clase.salir()
+
+
+# -------------------- ESTADÍSTICAS --------------------
+def estadisticas_admision() -> dict:
+    return {
+        "espera_max_ms": ADMISION_ESPERA_MS,
+        "clases": {nombre: clase.estadisticas() for nombre, clase in CLASES.items()},
+    }
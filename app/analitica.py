@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:     # opcional: sin pyarrow, /pagos/analytics responde 501
+    pa = pc = None
+
+# Analítica de pagos: los pagos del rango se traen en columnas (DataFrame de
+# python-oracledb, formato Arrow) y se agregan con pyarrow.compute, sin
+# armar un dict por fila. La agregación corre en un hilo (pyarrow libera el
+# GIL), así que el event loop sigue atendiendo mientras tanto. El resultado
+# se guarda por combinación de parámetros durante ANALITICA_TTL_S: los
+# tableros que repiten la misma consulta responden desde memoria.
+ANALITICA_TTL_S = float(os.getenv("ANALITICA_TTL_S", "60"))
+ANALITICA_MAX = int(os.getenv("ANALITICA_MAX", "100"))              # combinaciones guardadas
+ANALITICA_ARRAYSIZE = int(os.getenv("ANALITICA_ARRAYSIZE", "10000"))
+
+# intervalo de la API -> unidad de floor_temporal
+INTERVALOS = {"dia": "day", "semana": "week", "mes": "month"}
+
+_resultados = OrderedDict()     # clave -> (vence, resultado)
+_estadisticas = {"aciertos": 0, "fallos": 0, "filas": 0, "ultimo_calculo_ms": None}
+
+
+def disponible() -> bool:
+    return pa is not None
+
+
+# -------------------- AGREGACIÓN --------------------
+def _columnas(tabla):
+    # Oracle entrega los nombres en mayúsculas y NUMBER como double; se
+    # normalizan una vez para toda la tabla
+    tabla = tabla.rename_columns([nombre.lower() for nombre in tabla.column_names])
+    return {
+        "rut_usuario": tabla["rut_usuario"],
+        "id_tipo_pago": pc.cast(tabla["id_tipo_pago"], pa.int64()),
+        "id_comuna": pc.cast(tabla["id_comuna"], pa.int64()),
+        "monto": pc.cast(tabla["monto"], pa.float64()),
+        "fecha_pago": tabla["fecha_pago"],
+    }
+
+
+def _sumar(columnas: dict, clave: str, valores):
+    # [{clave: ..., "cantidad": n, "monto": total}, ...] por cada valor distinto de `valores`
+    agrupado = pa.table({clave: valores, "monto": columnas["monto"]}).group_by(clave).aggregate(
+        [("monto", "count"), ("monto", "sum")]
+    )
+    return agrupado.rename_columns([clave, "cantidad", "monto"])
+
+
+def agregar(tabla, intervalo: str, top: int) -> dict:
+    columnas = _columnas(tabla)
+    # Se agrupa por el instante truncado y solo los grupos pasan a texto
+    periodos = pc.floor_temporal(columnas["fecha_pago"], unit=INTERVALOS[intervalo], week_starts_monday=True)
+    por_periodo = _sumar(columnas, "periodo", periodos).sort_by("periodo")
+    por_periodo = por_periodo.set_column(0, "periodo", pc.strftime(por_periodo["periodo"], format="%Y-%m-%d"))
+    por_tipo = _sumar(columnas, "id_tipo_pago", columnas["id_tipo_pago"]).sort_by([("monto", "descending")])
+    por_comuna = _sumar(columnas, "id_comuna", columnas["id_comuna"]).sort_by([("monto", "descending")])
+    clientes = _sumar(columnas, "rut_usuario", columnas["rut_usuario"]).sort_by(
+        [("monto", "descending"), ("rut_usuario", "ascending")]
+    ).slice(0, top)
+    return {
+        "total": {"cantidad": len(tabla), "monto": pc.sum(columnas["monto"]).as_py() or 0},
+        "por_periodo": por_periodo.to_pylist(),
+        "por_tipo_pago": por_tipo.to_pylist(),
+        "por_comuna": por_comuna.to_pylist(),
+        "top_clientes": clientes.to_pylist(),
+    }
+
+
+async def calcular(cone, sql: str, binds: dict, intervalo: str, top: int) -> dict:
+    inicio = time.perf_counter()
+    datos = await cone.fetch_df_all(sql, binds, arraysize=ANALITICA_ARRAYSIZE)
+    tabla = pa.table(datos)
+    resultado = await asyncio.to_thread(agregar, tabla, intervalo, top)
+    _estadisticas["filas"] += len(tabla)
+    _estadisticas["ultimo_calculo_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+    return resultado
+
+
+# -------------------- RESULTADOS GUARDADOS --------------------
+def guardado(clave):
+    reciente = _resultados.get(clave)
+    if reciente is not None:
+        if reciente[0] > time.monotonic():
+            _estadisticas["aciertos"] += 1
+            return reciente[1]
+        del _resultados[clave]
+    return None
+
+
+def guardar(clave, resultado: dict):
+    _estadisticas["fallos"] += 1
+    _resultados[clave] = (time.monotonic() + ANALITICA_TTL_S, resultado)
+    _resultados.move_to_end(clave)
+    while len(_resultados) > ANALITICA_MAX:
+        _resultados.popitem(last=False)
+
+
+def estadisticas_analitica() -> dict:
+    return {
+        "pyarrow": disponible(),
+        "ttl_s": ANALITICA_TTL_S,
+        "guardadas": len(_resultados),
+        **_estadisticas,
+    }
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import time
+
+from app import cache_referencia
+from app.consultas import CONSULTAS, calientes
+from app.database import POOL_MIN, POOL_STMTCACHESIZE, calentar_pool, cargar_restricciones
+from app.hashing import calentar_executor
+from app.migraciones import VERIFICAR_PLANES, verificar_planes
+
+logger = logging.getLogger(__name__)
+
+# -------------------- CONFIGURACIÓN --------------------
+# Presupuesto para importar app.main (lo que tarda un worker nuevo antes de
+# poder siquiera ejecutar el lifespan)
+ARRANQUE_IMPORT_MAX_MS = float(os.getenv("ARRANQUE_IMPORT_MAX_MS", "1500"))
+ARRANQUE_CONEXIONES = int(os.getenv("ARRANQUE_CONEXIONES", str(POOL_MIN)))
+ARRANQUE_REINTENTO = int(os.getenv("ARRANQUE_REINTENTO", "5"))     # segundos
+
+_estado = {
+    "listo": False,
+    "importacion_ms": None,
+    "calentamiento_ms": None,
+    "pasos": {},        # paso -> {"ms", "resultado"} o {"ms", "error"}
+}
+_reintento = None
+
+
+# -------------------- IMPORTACIÓN --------------------
+def registrar_importacion(segundos: float):
+    _estado["importacion_ms"] = round(segundos * 1000, 1)
+    if _estado["importacion_ms"] > ARRANQUE_IMPORT_MAX_MS:
+        logger.warning("Importación sobre el presupuesto", extra={"campos": {
+            "importacion_ms": _estado["importacion_ms"], "presupuesto_ms": ARRANQUE_IMPORT_MAX_MS
+        }})
+
+
+# -------------------- CALENTAMIENTO --------------------
+def _pasos() -> dict:
+    return {
+        "pool": lambda: calentar_pool(calientes(), ARRANQUE_CONEXIONES),
+        "cache_referencia": cache_referencia.precargar,
+        "restricciones": cargar_restricciones,
+        "hashing": calentar_executor,
+    }
+
+
+async def _medir_paso(nombre, paso):
+    inicio = time.perf_counter()
+    try:
+        resultado = await paso()
+        _estado["pasos"][nombre] = {"ms": round((time.perf_counter() - inicio) * 1000, 1), "resultado": resultado}
+    except Exception as ex:
+        _estado["pasos"][nombre] = {"ms": round((time.perf_counter() - inicio) * 1000, 1), "error": str(ex)}
+        logger.warning("Paso de calentamiento fallido", extra={"campos": {"paso": nombre, "error": str(ex)}})
+
+
+def _pendientes() -> dict:
+    return {
+        nombre: paso for nombre, paso in _pasos().items()
+        if nombre not in _estado["pasos"] or "error" in _estado["pasos"][nombre]
+    }
+
+
+async def calentar():
+    # Los pasos son independientes y corren a la vez. El worker queda listo
+    # solo si todos terminan bien; si alguno falla se reintenta de fondo.
+    global _reintento
+    if len(CONSULTAS) > POOL_STMTCACHESIZE:
+        # Las sentencias que no caben se vuelven a parsear en cada uso
+        logger.warning("Hay más consultas registradas que espacio en el caché de sentencias", extra={"campos": {
+            "consultas": len(CONSULTAS), "stmtcachesize": POOL_STMTCACHESIZE
+        }})
+    inicio = time.perf_counter()
+    await asyncio.gather(*(_medir_paso(nombre, paso) for nombre, paso in _pendientes().items()))
+    _estado["calentamiento_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    if VERIFICAR_PLANES:
+        # Solo avisa: un índice faltante no debe impedir que el worker arranque
+        try:
+            await verificar_planes()
+        except Exception as ex:
+            logger.warning("No se pudieron verificar los planes de ejecución: %s", ex)
+
+    if _pendientes():
+        _reintento = asyncio.create_task(_reintentar())
+    else:
+        _marcar_listo()
+
+
+async def _reintentar():
+    while _pendientes():
+        await asyncio.sleep(ARRANQUE_REINTENTO)
+        await asyncio.gather(*(_medir_paso(nombre, paso) for nombre, paso in _pendientes().items()))
+    _marcar_listo()
+
+
+def _marcar_listo():
+    _estado["listo"] = True
+    logger.info("Worker listo", extra={"campos": {
+        "importacion_ms": _estado["importacion_ms"], "calentamiento_ms": _estado["calentamiento_ms"]
+    }})
+
+
+def detener():
+    global _reintento
+    _estado["listo"] = False
+    if _reintento is not None:
+        _reintento.cancel()
+        _reintento = None
+
+
+# -------------------- ESTADO --------------------
+def esta_listo() -> bool:
+    return _estado["listo"]
+
+
+def estado_arranque() -> dict:
+    return {**_estado, "presupuesto_importacion_ms": ARRANQUE_IMPORT_MAX_MS}
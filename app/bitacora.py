@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# -------------------- CONFIGURACIÓN --------------------
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+# Fracción de los eventos INFO/DEBUG que se escriben (1.0 = todos). WARNING y
+# superiores se escriben siempre.
+LOG_MUESTREO = float(os.getenv("LOG_MUESTREO", "1.0"))
+LOG_COLA_MAX = int(os.getenv("LOG_COLA_MAX", "10000"))
+
+_listener = None
+
+
+class _Muestreo(logging.Filter):
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or LOG_MUESTREO >= 1.0 or random.random() < LOG_MUESTREO
+
+
+class _FormatoJSON(logging.Formatter):
+    # Una línea JSON por evento. Los datos del evento van en extra={"campos": {...}}
+    def format(self, record):
+        evento = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        evento.update(getattr(record, "campos", {}))
+        if record.exc_info:
+            evento["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class _ColaSinBloqueo(QueueHandler):
+    # Si la cola está llena se descarta el evento en vez de frenar al handler
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+# -------------------- CICLO DE VIDA --------------------
+def iniciar_bitacora():
+    # Los handlers solo encolan; un hilo aparte formatea y escribe en stdout,
+    # así el event loop nunca espera por I/O de logs.
+    global _listener
+    if _listener is not None:
+        return
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(_FormatoJSON())
+    cola = queue.Queue(LOG_COLA_MAX)
+    encolar = _ColaSinBloqueo(cola)
+    encolar.addFilter(_Muestreo())
+
+    raiz = logging.getLogger("app")
+    raiz.setLevel(LOG_NIVEL)
+    raiz.handlers = [encolar]
+    raiz.propagate = False
+
+    _listener = QueueListener(cola, salida, respect_handler_level=True)
+    _listener.start()
+
+
+def detener_bitacora():
+    # Vacía la cola antes de salir
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
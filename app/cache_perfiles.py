@@ -0,0 +1,192 @@
+import os
+import time
+from collections import OrderedDict
+
+import orjson
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:     # opcional: solo lo usa PerfilesRedis
+    class WatchError(Exception):
+        pass
+
+# Perfiles de usuario (los datos de GET /usuarios/usuario/{rut} y de
+# buscar-usuario-por-email) guardados bajo dos claves: "rut:<rut>" y
+# "email:<email en minúsculas>". Las escrituras sobre usuario invalidan ambas.
+PERFILES_MAX = int(os.getenv("PERFILES_MAX", "10000"))
+PERFILES_TTL = int(os.getenv("PERFILES_TTL", "300"))     # segundos
+# Con varios workers, un Redis compartido hace que una invalidación se vea en
+# todos; sin él, cada worker tiene su propio caché y el TTL acota lo obsoleto.
+PERFILES_REDIS_URL = os.getenv("PERFILES_REDIS_URL", "")
+
+
+# -------------------- BACKENDS --------------------
+# Un backend implementa obtener(clave), generacion(), nueva_generacion(),
+# guardar(claves, perfil, leido_en) y borrar(claves). Cada invalidación sube
+# la generación, y guardar() no escribe si cambió desde leido_en: una lectura
+# que empezó antes de una escritura podría traer datos anteriores a ella. La
+# generación vive en el mismo almacén que los perfiles, así que con Redis vale
+# para todos los workers.
+class PerfilesLocal:
+    # LRU con TTL en memoria del worker
+    def __init__(self, maximo: int = PERFILES_MAX, ttl: int = PERFILES_TTL):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos = OrderedDict()     # clave -> (vence, perfil)
+        self._generacion = 0
+
+    async def obtener(self, clave: str):
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            return None
+        vence, perfil = entrada
+        if vence < time.monotonic():
+            del self._datos[clave]
+            return None
+        self._datos.move_to_end(clave)
+        return perfil
+
+    async def generacion(self) -> int:
+        return self._generacion
+
+    async def guardar(self, claves: list, perfil: dict, leido_en: int):
+        if leido_en != self._generacion:
+            return
+        vence = time.monotonic() + self.ttl
+        for clave in claves:
+            self._datos[clave] = (vence, perfil)
+            self._datos.move_to_end(clave)
+        while len(self._datos) > self.maximo:
+            self._datos.popitem(last=False)
+
+    async def nueva_generacion(self):
+        self._generacion += 1
+
+    async def borrar(self, claves: list):
+        for clave in claves:
+            self._datos.pop(clave, None)
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class PerfilesRedis:
+    # Caché compartido entre workers; requiere el paquete redis (pip install redis).
+    # cliente: un redis.asyncio.Redis ya creado (pruebas); si no, se crea desde url.
+    def __init__(self, url: str = "", ttl: int = PERFILES_TTL, prefijo: str = "perfil:", cliente=None):
+        if cliente is None:
+            import redis.asyncio
+            cliente = redis.asyncio.from_url(url)
+        self._redis = cliente
+        self.ttl = ttl
+        self.prefijo = prefijo
+        self._clave_generacion = prefijo + "generacion"
+
+    async def obtener(self, clave: str):
+        valor = await self._redis.get(self.prefijo + clave)
+        return orjson.loads(valor) if valor is not None else None
+
+    async def generacion(self) -> int:
+        return int(await self._redis.get(self._clave_generacion) or 0)
+
+    async def guardar(self, claves: list, perfil: dict, leido_en: int):
+        # WATCH + MULTI: si otro worker invalida entre la comparación y el
+        # EXEC, Redis descarta la escritura
+        valor = orjson.dumps(perfil)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(self._clave_generacion)
+                if int(await pipe.get(self._clave_generacion) or 0) != leido_en:
+                    return
+                pipe.multi()
+                for clave in claves:
+                    pipe.set(self.prefijo + clave, valor, ex=self.ttl)
+                await pipe.execute()
+            except WatchError:
+                pass
+
+    async def nueva_generacion(self):
+        await self._redis.incr(self._clave_generacion)
+
+    async def borrar(self, claves: list):
+        if claves:
+            await self._redis.delete(*(self.prefijo + clave for clave in claves))
+
+    def __len__(self):
+        return -1   # desconocido sin recorrer Redis
+
+
+_backend = PerfilesRedis(PERFILES_REDIS_URL) if PERFILES_REDIS_URL else PerfilesLocal()
+_estadisticas = {"aciertos": 0, "fallos": 0, "invalidaciones": 0}
+
+
+def configurar(backend):
+    # Reemplaza el backend (pruebas, u otro almacén compartido)
+    global _backend
+    _backend = backend
+
+
+# -------------------- API --------------------
+def _clave_rut(rut: str) -> str:
+    return f"rut:{rut}"
+
+
+def _clave_email(email: str) -> str:
+    # Igual que LOWER(email) = LOWER(:email) en la consulta
+    return f"email:{email.lower()}"
+
+
+async def _obtener(clave: str):
+    perfil = await _backend.obtener(clave)
+    if perfil is None:
+        _estadisticas["fallos"] += 1
+    else:
+        _estadisticas["aciertos"] += 1
+    return perfil
+
+
+async def por_rut(rut: str):
+    return await _obtener(_clave_rut(rut))
+
+
+async def por_email(email: str):
+    return await _obtener(_clave_email(email))
+
+
+async def generacion() -> int:
+    return await _backend.generacion()
+
+
+async def guardar(perfil: dict, leido_en: int):
+    # leido_en: generacion() tomada antes de consultar la base
+    await _backend.guardar([_clave_rut(perfil["rut"]), _clave_email(perfil["email"])], perfil, leido_en)
+
+
+async def invalidar(rut: str = None, email: str = None):
+    # Se llama después de confirmar la escritura. Se borran las dos claves del
+    # perfil aunque solo se conozca una (el email pudo cambiar en la escritura).
+    # Primero la generación: una lectura en curso ya no podrá guardar.
+    await _backend.nueva_generacion()
+    claves = set()
+    if rut:
+        claves.add(_clave_rut(rut))
+    if email:
+        claves.add(_clave_email(email))
+    for clave in list(claves):
+        perfil = await _backend.obtener(clave)
+        if perfil is not None:
+            claves.update((_clave_rut(perfil["rut"]), _clave_email(perfil["email"])))
+    await _backend.borrar(list(claves))
+    _estadisticas["invalidaciones"] += 1
+
+
+def estadisticas_perfiles() -> dict:
+    consultas = _estadisticas["aciertos"] + _estadisticas["fallos"]
+    return {
+        "backend": type(_backend).__name__,
+        "entradas": len(_backend),
+        "maximo": PERFILES_MAX,
+        "ttl_s": PERFILES_TTL,
+        **_estadisticas,
+        "tasa_aciertos": round(_estadisticas["aciertos"] / consultas, 3) if consultas else 0.0,
+    }
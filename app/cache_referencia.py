@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import os
+import time
+
+from app.consultas import registrar
+from app.database import conexion
+
+# Las tablas de referencia casi nunca cambian: se leen una vez y se
+# mantienen en memoria hasta que vence el TTL o se invalidan a mano.
+REFERENCIA_TTL = int(os.getenv("REFERENCIA_TTL", "3600"))    # segundos
+
+
+class TablaReferencia:
+    def __init__(self, nombre: str, sql: str):
+        self.nombre = nombre
+        self.sql = sql
+        self._datos = None
+        self._cargado_en = 0.0
+        self.version = None
+        self._lock = asyncio.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _vigente(self) -> bool:
+        return self._datos is not None and time.monotonic() - self._cargado_en < REFERENCIA_TTL
+
+    def en_memoria(self):
+        # Los datos si están vigentes, sin ceder el event loop; si no, None
+        if self._vigente():
+            self.aciertos += 1
+            return self._datos
+        return None
+
+    async def obtener(self) -> dict:
+        # Devuelve {id: descripcion}; solo una corrutina recarga a la vez
+        if self._vigente():
+            self.aciertos += 1
+            return self._datos
+        async with self._lock:
+            if self._vigente():
+                self.aciertos += 1
+                return self._datos
+            self.fallos += 1
+            async with conexion() as cone:
+                with cone.cursor() as cursor:
+                    await cursor.execute(self.sql)
+                    self._datos = dict(await cursor.fetchall())
+            # La versión depende solo del contenido, así que coincide entre
+            # workers y sirve como ETag estable
+            self.version = hashlib.sha1(repr(sorted(self._datos.items())).encode("utf-8")).hexdigest()
+            self._cargado_en = time.monotonic()
+        return self._datos
+
+    def invalidar(self):
+        self._datos = None
+
+    def estadisticas(self) -> dict:
+        return {
+            "filas": len(self._datos) if self._datos is not None else 0,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "edad_s": round(time.monotonic() - self._cargado_en, 1) if self._datos is not None else None,
+        }
+
+
+comunas = TablaReferencia("comuna", registrar(
+    "referencia.comuna", "SELECT id_comuna, descripcion FROM comuna ORDER BY id_comuna"
+))
+tipos_pago = TablaReferencia("tipo_pago", registrar(
+    "referencia.tipo_pago", "SELECT id_tipo_pago, descripcion FROM tipo_pago ORDER BY id_tipo_pago"
+))
+
+TABLAS = {tabla.nombre: tabla for tabla in (comunas, tipos_pago)}
+
+
+async def precargar():
+    for tabla in TABLAS.values():
+        await tabla.obtener()
+
+
+def invalidar(nombre: str = None):
+    for tabla in TABLAS.values():
+        if nombre is None or tabla.nombre == nombre:
+            tabla.invalidar()
+
+
+def estadisticas_referencia() -> dict:
+    return {nombre: tabla.estadisticas() for nombre, tabla in TABLAS.items()}
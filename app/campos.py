@@ -0,0 +1,71 @@
+from typing import Optional
+
+from fastapi import HTTPException, Query
+
+from app.consultas import registrar
+
+
+# -------------------- PROYECCIONES --------------------
+# `fields=` en las listas: el SELECT y los JOIN se recortan a los campos
+# pedidos. Cada endpoint declara su lista blanca (campo -> expresión SQL y
+# JOIN que necesita); nunca se interpola texto del cliente. Los campos se
+# ordenan según la lista blanca, así que cada combinación produce siempre el
+# mismo SQL: se arma y se registra la primera vez que se pide y después se
+# reutiliza (mismo texto para el shared pool y el caché de sentencias).
+class Proyeccion:
+    def __init__(self, nombre: str, columnas: dict, joins: dict, plantilla: str, variantes: dict,
+                 obligatorios: tuple = ()):
+        # columnas: campo -> (expresión, join o None)
+        # joins: join -> texto del JOIN
+        # plantilla: SQL con {columnas}, {joins} y {variante}
+        # variantes: sufijo del nombre -> texto de {variante} (p. ej. "_desde" para la página siguiente)
+        # obligatorios: campos que siempre se leen y se entregan (la clave del cursor)
+        self.nombre = nombre
+        self.columnas = columnas
+        self.joins = joins
+        self.plantilla = plantilla
+        self.variantes = variantes
+        self.obligatorios = obligatorios
+        self._sql = {}      # (campos, variante) -> sql registrado
+        # La proyección completa (sin fields=) queda registrada al importar y
+        # el arranque la deja parseada; las de fields= se parsean en su primer uso
+        for variante in variantes:
+            self.sql(tuple(columnas), variante)
+
+    def campos(self, pedidos: Optional[str]) -> tuple:
+        # "nombre,rut" -> ("rut", "nombre"); None = todos los campos
+        if not pedidos:
+            return tuple(self.columnas)
+        nombres = {campo.strip().lower() for campo in pedidos.split(",") if campo.strip()}
+        invalidos = nombres - self.columnas.keys()
+        if invalidos:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Campos inválidos: {', '.join(sorted(invalidos))}. Permitidos: {', '.join(self.columnas)}"
+            )
+        nombres.update(self.obligatorios)
+        return tuple(campo for campo in self.columnas if campo in nombres)
+
+    def sql(self, campos: tuple, variante: str = "") -> str:
+        sql = self._sql.get((campos, variante))
+        if sql is None:
+            necesarios = {self.columnas[campo][1] for campo in campos}
+            sql = self.plantilla.format(
+                columnas=", ".join(self.columnas[campo][0] for campo in campos),
+                joins="\n    ".join(texto for join, texto in self.joins.items() if join in necesarios),
+                variante=self.variantes[variante]
+            )
+            # Sin fields= se usa el nombre de siempre (p. ej. "pago.lista_desde")
+            nombre = self.nombre + variante
+            if campos != tuple(self.columnas):
+                nombre += f"[{','.join(campos)}]"
+            sql = self._sql[(campos, variante)] = registrar(nombre, sql, caliente=campos == tuple(self.columnas))
+        return sql
+
+
+def parametro_campos(proyeccion: Proyeccion):
+    return Query(
+        None, alias="fields",
+        description=f"Campos a incluir, separados por coma ({', '.join(proyeccion.columnas)}). "
+                    f"Siempre se entregan: {', '.join(proyeccion.obligatorios)}"
+    )
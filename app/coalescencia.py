@@ -0,0 +1,86 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+# Lecturas idénticas y simultáneas (misma ruta y mismos parámetros
+# normalizados) comparten una sola consulta: la primera la ejecuta y las
+# demás esperan su resultado. Con una ventana de micro-caché, el resultado
+# además se reutiliza durante unos milisegundos después de terminar.
+COALESCENCIA_VENTANA_MS = float(os.getenv("COALESCENCIA_VENTANA_MS", "0"))   # 0 = sin micro-caché
+COALESCENCIA_MAX = int(os.getenv("COALESCENCIA_MAX", "1000"))                # entradas de micro-caché
+
+_en_vuelo = {}                  # (nombre, clave) -> Future compartido
+_recientes = OrderedDict()      # (nombre, clave) -> (vence, resultado)
+_estadisticas = {}              # nombre -> {"ejecutadas", "agrupadas", "micro_cache"}
+
+
+def _contar(nombre: str, campo: str):
+    contadores = _estadisticas.get(nombre)
+    if contadores is None:
+        contadores = _estadisticas[nombre] = {"ejecutadas": 0, "agrupadas": 0, "micro_cache": 0}
+    contadores[campo] += 1
+
+
+# -------------------- LECTURAS COMPARTIDAS --------------------
+async def compartir(nombre: str, clave, cargar):
+    # nombre: etiqueta para las métricas (p. ej. "pagos.lista"); clave: tupla
+    # hashable con los parámetros ya normalizados; cargar: función async sin
+    # argumentos que hace la lectura. El resultado es compartido: quien lo
+    # recibe no debe modificarlo.
+    completa = (nombre, clave)
+    reciente = _recientes.get(completa)
+    if reciente is not None:
+        if reciente[0] > time.monotonic():
+            _contar(nombre, "micro_cache")
+            return reciente[1]
+        del _recientes[completa]
+
+    futuro = _en_vuelo.get(completa)
+    if futuro is not None:
+        _contar(nombre, "agrupadas")
+    else:
+        _contar(nombre, "ejecutadas")
+        # La lectura corre en su propia tarea: si la petición que la inició se
+        # cancela (el cliente corta), las que esperan igual reciben el resultado
+        futuro = _en_vuelo[completa] = asyncio.ensure_future(cargar())
+        futuro.add_done_callback(lambda f: _terminar(completa, f))
+    return await asyncio.shield(futuro)
+
+
+def _terminar(completa, futuro):
+    if _en_vuelo.get(completa) is futuro:
+        del _en_vuelo[completa]
+    # Los errores no se guardan: la siguiente petición vuelve a intentar
+    if COALESCENCIA_VENTANA_MS > 0 and not futuro.cancelled() and futuro.exception() is None:
+        _recientes[completa] = (time.monotonic() + COALESCENCIA_VENTANA_MS / 1000, futuro.result())
+        _recientes.move_to_end(completa)
+        while len(_recientes) > COALESCENCIA_MAX:
+            _recientes.popitem(last=False)
+
+
+def olvidar(nombre: str):
+    # Después de una escritura: las lecturas nuevas de `nombre` no reutilizan
+    # resultados anteriores ni se suman a consultas que empezaron antes
+    for completa in [c for c in _recientes if c[0] == nombre]:
+        del _recientes[completa]
+    for completa in [c for c in _en_vuelo if c[0] == nombre]:
+        del _en_vuelo[completa]
+
+
+# -------------------- ESTADÍSTICAS --------------------
+def estadisticas_coalescencia() -> dict:
+    return {
+        "ventana_ms": COALESCENCIA_VENTANA_MS,
+        "en_vuelo": len(_en_vuelo),
+        "micro_cache": len(_recientes),
+        "lecturas": {nombre: dict(contadores) for nombre, contadores in _estadisticas.items()},
+    }
+
+
+def totales_coalescencia() -> dict:
+    totales = {"ejecutadas": 0, "agrupadas": 0, "micro_cache": 0}
+    for contadores in _estadisticas.values():
+        for campo, cantidad in contadores.items():
+            totales[campo] += cantidad
+    return totales
@@ -0,0 +1,162 @@
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:     # opcional: sin el paquete `brotli` solo se ofrece gzip
+    brotli = None
+
+# Compresión negociada con Accept-Encoding: br si el cliente lo acepta y el
+# paquete está instalado, si no gzip. Solo se comprimen respuestas de texto
+# (JSON, NDJSON, CSV) de al menos COMPRESION_MINIMO bytes; las más chicas
+# cuestan más CPU de lo que ahorran. Las exportaciones en streaming se
+# comprimen por bloques, sin juntar el cuerpo completo.
+COMPRESION_MINIMO = int(os.getenv("COMPRESION_MINIMO", "1024"))     # bytes
+COMPRESION_NIVEL_GZIP = int(os.getenv("COMPRESION_NIVEL_GZIP", "4"))   # 1-9; más alto cuesta CPU del event loop
+COMPRESION_NIVEL_BR = int(os.getenv("COMPRESION_NIVEL_BR", "4"))    # 0-11; 4 es rápido para contenido dinámico
+
+_COMPRIMIBLES = (b"application/json", b"application/x-ndjson", b"text/")
+
+_respuestas = {"br": 0, "gzip": 0, "sin_comprimir": 0}
+_bytes = {"originales": 0, "enviados": 0}
+
+
+# -------------------- NEGOCIACIÓN --------------------
+def _aceptadas(accept_encoding: str) -> dict:
+    # "gzip, br;q=0.8, *;q=0" -> {"gzip": 1.0, "br": 0.8, "*": 0.0}
+    aceptadas = {}
+    for parte in accept_encoding.split(","):
+        codificacion, _, parametros = parte.strip().partition(";")
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        if codificacion:
+            aceptadas[codificacion.strip().lower()] = calidad
+    return aceptadas
+
+
+def elegir_codificacion(accept_encoding: str):
+    aceptadas = _aceptadas(accept_encoding)
+    comodin = aceptadas.get("*", 0.0)
+    candidatas = (["br"] if brotli is not None else []) + ["gzip"]
+    calidades = {c: aceptadas.get(c, comodin) for c in candidatas}
+    mejor = max(candidatas, key=lambda c: calidades[c])     # empate: br primero
+    return mejor if calidades[mejor] > 0 else None
+
+
+class _Compresor:
+    def __init__(self, codificacion: str):
+        if codificacion == "br":
+            self._br = brotli.Compressor(quality=COMPRESION_NIVEL_BR)
+            self._zlib = None
+        else:
+            self._br = None
+            self._zlib = zlib.compressobj(COMPRESION_NIVEL_GZIP, zlib.DEFLATED, 31)   # 31: formato gzip
+
+    def bloque(self, datos: bytes, final: bool) -> bytes:
+        # Sin flush entre bloques: el compresor entrega salida cuando junta
+        # suficiente, así los bloques chicos de un streaming no se comprimen
+        # (ni se envían) uno por uno
+        if self._br is not None:
+            salida = self._br.process(datos)
+            return salida + self._br.finish() if final else salida
+        salida = self._zlib.compress(datos)
+        return salida + self._zlib.flush() if final else salida
+
+
+def _con_vary(cabeceras: list) -> list:
+    # Agrega Accept-Encoding al Vary (respetando uno existente): los cachés
+    # intermedios no deben entregar la versión comprimida a quien no la pidió,
+    # ni la sin comprimir a quien sí
+    for posicion, (clave, valor) in enumerate(cabeceras):
+        if clave == b"vary":
+            if b"accept-encoding" in valor.lower() or valor.strip() == b"*":
+                return cabeceras
+            return cabeceras[:posicion] + [(clave, valor + b", Accept-Encoding")] + cabeceras[posicion + 1:]
+    return cabeceras + [(b"vary", b"Accept-Encoding")]
+
+
+# -------------------- MIDDLEWARE --------------------
+class MiddlewareCompresion:
+    # Middleware ASGI puro, como los demás: no copia el cuerpo a un
+    # Response intermedio y deja pasar sin tocar lo que no se comprime.
+    # Toda respuesta que podría haberse comprimido lleva Vary: Accept-Encoding,
+    # se haya comprimido o no (cliente sin Accept-Encoding, cuerpo chico, 304)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept_encoding = ""
+        for clave, valor in scope["headers"]:
+            if clave == b"accept-encoding":
+                accept_encoding = valor.decode("latin-1")
+                break
+        codificacion = elegir_codificacion(accept_encoding) if accept_encoding else None
+
+        inicio = None
+        compresor = None
+
+        async def enviar(mensaje):
+            nonlocal inicio, compresor
+            if mensaje["type"] == "http.response.start":
+                # Se retiene hasta ver el primer bloque del cuerpo
+                inicio = mensaje
+                return
+            if mensaje["type"] != "http.response.body" or inicio is None:
+                return await send(mensaje)
+
+            cuerpo = mensaje.get("body", b"")
+            mas = mensaje.get("more_body", False)
+            if compresor is None:
+                cabeceras = inicio.get("headers", [])
+                tipo = next((v for k, v in cabeceras if k == b"content-type"), b"")
+                ya_codificada = any(k == b"content-encoding" for k, _ in cabeceras)
+                estado = inicio["status"]
+                comprimible = not ya_codificada and (
+                    estado == 304 or (estado >= 200 and estado != 204 and tipo.startswith(_COMPRIMIBLES))
+                )
+                if comprimible:
+                    cabeceras = _con_vary(cabeceras)
+                if (not comprimible or codificacion is None or estado == 304
+                        or (not mas and len(cuerpo) < COMPRESION_MINIMO)):
+                    if codificacion is not None:
+                        _respuestas["sin_comprimir"] += 1
+                    await send({**inicio, "headers": cabeceras} if comprimible else inicio)
+                    inicio = None
+                    return await send(mensaje)
+                compresor = _Compresor(codificacion)
+                cabeceras = [(k, v) for k, v in cabeceras if k != b"content-length"]
+                cabeceras.append((b"content-encoding", codificacion.encode("ascii")))
+                comprimido = compresor.bloque(cuerpo, not mas)
+                if not mas:
+                    cabeceras.append((b"content-length", str(len(comprimido)).encode("ascii")))
+                _respuestas[codificacion] += 1
+                await send({**inicio, "headers": cabeceras})
+            else:
+                comprimido = compresor.bloque(cuerpo, not mas)
+            _bytes["originales"] += len(cuerpo)
+            _bytes["enviados"] += len(comprimido)
+            if comprimido or not mas:
+                await send({"type": "http.response.body", "body": comprimido, "more_body": mas})
+
+        await self.app(scope, receive, enviar)
+        if inicio is not None and compresor is None:
+            # Respuesta sin cuerpo (p. ej. HEAD)
+            await send(inicio)
+
+
+# -------------------- ESTADÍSTICAS --------------------
+def estadisticas_compresion() -> dict:
+    return {
+        "brotli_disponible": brotli is not None,
+        "minimo_bytes": COMPRESION_MINIMO,
+        "respuestas": dict(_respuestas),
+        "bytes_originales": _bytes["originales"],
+        "bytes_enviados": _bytes["enviados"],
+    }
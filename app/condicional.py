@@ -0,0 +1,39 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+# -------------------- POLÍTICAS DE CACHÉ --------------------
+# Datos públicos que casi no cambian: el navegador puede reutilizarlos un rato
+CACHE_REFERENCIA = "public, max-age=300"
+# Datos de usuario: se pueden guardar, pero siempre se revalidan con ETag
+CACHE_PRIVADO = "private, no-cache"
+
+
+def calcular_etag(*partes) -> str:
+    # ETag débil: identifica el contenido lógico, no los bytes exactos
+    resumen = hashlib.sha1("|".join(str(p) for p in partes).encode("utf-8")).hexdigest()
+    return f'W/"{resumen}"'
+
+
+def _coincide(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparación débil (RFC 9110 §13.1.2): se ignora el prefijo W/
+    valor = etag.removeprefix("W/")
+    return any(candidato.strip().removeprefix("W/") == valor for candidato in if_none_match.split(","))
+
+
+def no_modificado(request: Request, etag: str, cache_control: str) -> Optional[Response]:
+    # Devuelve un 304 listo si el cliente ya tiene esta versión; así el
+    # handler puede cortar antes de consultar y armar el payload.
+    if _coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    return None
+
+
+def aplicar_validadores(response: Response, etag: str, cache_control: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
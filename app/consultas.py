@@ -0,0 +1,64 @@
+# -------------------- CONSULTAS REGISTRADAS --------------------
+# Todo el SQL de los routers se declara aquí con nombre, a nivel de módulo, y
+# nunca se arma por petición: cada nombre es siempre el mismo texto, así que
+# Oracle lo parsea una vez (shared pool) y el caché de sentencias del driver
+# (stmtcachesize) lo reutiliza en cada conexión.
+CONSULTAS = {}          # nombre -> sql
+_VERIFICAR = set()      # nombres cuyo plan revisa app.migraciones
+_CALIENTES = set()      # nombres que el arranque deja parseados (app.arranque)
+_por_texto = {}         # sql -> nombre
+_ejecuciones = {}       # nombre -> [veces, segundos]
+
+SIN_REGISTRAR = "sin_registrar"
+
+
+def registrar(nombre: str, sql: str, verificar_plan: bool = False, caliente: bool = False) -> str:
+    # verificar_plan: lecturas puntuales que deben ir por índice; al iniciar
+    # se revisa con EXPLAIN PLAN que no recorran tablas completas.
+    # caliente: sentencias de casi toda petición (login, listas, lecturas por
+    # clave); el arranque las parsea en cada conexión y el resto se parsea en
+    # su primer uso, así el calentamiento no llena el caché de sentencias.
+    if CONSULTAS.get(nombre, sql) != sql:
+        raise ValueError(f"La consulta {nombre} ya está registrada con otro SQL")
+    CONSULTAS[nombre] = sql
+    _por_texto[sql] = nombre
+    if verificar_plan:
+        _VERIFICAR.add(nombre)
+    if caliente:
+        _CALIENTES.add(nombre)
+    return sql
+
+
+def para_verificar() -> dict:
+    return {nombre: CONSULTAS[nombre] for nombre in _VERIFICAR}
+
+
+def calientes() -> dict:
+    return {nombre: CONSULTAS[nombre] for nombre in sorted(_CALIENTES)}
+
+
+# -------------------- EJECUCIONES --------------------
+def contar(sql: str, segundos: float):
+    # Lo llama el cursor medido (app.metricas) en cada execute/executemany
+    nombre = _por_texto.get(sql, SIN_REGISTRAR)
+    ejecucion = _ejecuciones.get(nombre)
+    if ejecucion is None:
+        ejecucion = _ejecuciones[nombre] = [0, 0.0]
+    ejecucion[0] += 1
+    ejecucion[1] += segundos
+
+
+def ejecuciones() -> dict:
+    return {nombre: (veces, segundos) for nombre, (veces, segundos) in _ejecuciones.items()}
+
+
+def estadisticas_consultas() -> dict:
+    return {
+        "registradas": len(CONSULTAS),
+        "calientes": len(_CALIENTES),
+        "ejecuciones": {
+            nombre: {"veces": veces, "total_ms": round(segundos * 1000, 3),
+                     "promedio_ms": round(segundos / veces * 1000, 3)}
+            for nombre, (veces, segundos) in sorted(_ejecuciones.items(), key=lambda e: -e[1][0])
+        },
+    }
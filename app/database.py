@@ -1,12 +1,425 @@
-import oracledb 
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import oracledb
 from fastapi import HTTPException
-def get_conexion():
-    try:
-        conexion = oracledb.connect(
-            user="api_sitioferremas",
-            password="api_sitioferremas",
-            dsn="localhost:1521/XE"
+
+from app.consultas import registrar as registrar_consulta
+from app.metricas import ConexionMedida, registrar
+
+logger = logging.getLogger(__name__)
+
+# -------------------- CONFIGURACIÓN DEL POOL --------------------
+DB_USER = os.getenv("DB_USER", "api_sitioferremas")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "api_sitioferremas")
+DB_DSN = os.getenv("DB_DSN", "localhost:1521/XE")
+
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_INCREMENT = int(os.getenv("DB_POOL_INCREMENT", "1"))
+# Debe cubrir las consultas registradas más las variantes de fields= (ver app/consultas.py)
+POOL_STMTCACHESIZE = int(os.getenv("DB_POOL_STMTCACHESIZE", "128"))
+POOL_PING_INTERVAL = int(os.getenv("DB_POOL_PING_INTERVAL", "60"))      # segundos
+POOL_WAIT_TIMEOUT = int(os.getenv("DB_POOL_WAIT_TIMEOUT", "5000"))      # milisegundos
+POOL_RETRY_AFTER = os.getenv("DB_POOL_RETRY_AFTER", "1")                # segundos
+# Pool sin conexión libre dentro de wait_timeout: DPY-4005 en modo thin,
+# ORA-24457 en modo thick
+_POOL_AGOTADO = {"DPY-4005", "ORA-24457"}
+
+# -------------------- RÉPLICA DE LECTURA --------------------
+# Opcional: un pool de solo lectura (p. ej. un standby Active Data Guard)
+# para los GET. Sin DB_REPLICA_DSN todo va al primario.
+DB_REPLICA_DSN = os.getenv("DB_REPLICA_DSN", "")
+DB_REPLICA_USER = os.getenv("DB_REPLICA_USER", DB_USER)
+DB_REPLICA_PASSWORD = os.getenv("DB_REPLICA_PASSWORD", DB_PASSWORD)
+REPLICA_POOL_MIN = int(os.getenv("DB_REPLICA_POOL_MIN", str(POOL_MIN)))
+REPLICA_POOL_MAX = int(os.getenv("DB_REPLICA_POOL_MAX", str(POOL_MAX)))
+REPLICA_RETRASO_MAX = float(os.getenv("DB_REPLICA_RETRASO_MAX", "5"))       # segundos
+REPLICA_CHEQUEO = float(os.getenv("DB_REPLICA_CHEQUEO", "5"))               # segundos
+# Retraso de aplicación del standby en segundos; sin filas (una base que no
+# es standby) cuenta como 0
+REPLICA_RETRASO_SQL = os.getenv("DB_REPLICA_RETRASO_SQL", """
+    SELECT NVL(MAX(
+        EXTRACT(DAY FROM TO_DSINTERVAL(value)) * 86400 + EXTRACT(HOUR FROM TO_DSINTERVAL(value)) * 3600
+        + EXTRACT(MINUTE FROM TO_DSINTERVAL(value)) * 60 + EXTRACT(SECOND FROM TO_DSINTERVAL(value))
+    ), 0)
+    FROM v$dataguard_stats
+    WHERE name = 'apply lag'
+""")
+# Una sesión que acaba de escribir lee del primario durante esta ventana
+LECTURA_PROPIA_S = float(os.getenv("LECTURA_PROPIA_S", str(max(REPLICA_RETRASO_MAX, 1) * 2)))
+
+_pool = None
+_pool_lectura = None
+_vigilancia = None
+_replica = {
+    "disponible": False,
+    "retraso_s": None,
+    "chequeado_en": None,
+    "lecturas": 0,          # conexiones de lectura servidas por la réplica
+    "al_primario": 0,       # lecturas que fueron al primario (réplica caída, atrasada o lectura propia)
+    "errores": 0,
+}
+_solo_primario = ContextVar("solo_primario", default=False)
+_estadisticas = {
+    "adquisiciones": 0,
+    "errores": 0,
+    "agotadas": 0,          # esperas que superaron DB_POOL_WAIT_TIMEOUT (503)
+    "espera_total": 0.0,
+    "espera_max": 0.0,
+}
+
+
+# -------------------- CICLO DE VIDA DEL POOL --------------------
+def crear_pool():
+    # create_pool_async no es una corrutina: las conexiones se abren de fondo
+    # y cada acquire() se espera con await dentro del event loop.
+    global _pool
+    if _pool is None:
+        _pool = oracledb.create_pool_async(
+            user=DB_USER,
+            password=DB_PASSWORD,
+            dsn=DB_DSN,
+            min=POOL_MIN,
+            max=POOL_MAX,
+            increment=POOL_INCREMENT,
+            stmtcachesize=POOL_STMTCACHESIZE,
+            ping_interval=POOL_PING_INTERVAL,
+            getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+            wait_timeout=POOL_WAIT_TIMEOUT,
+        )
+    return _pool
+
+
+async def cerrar_pool():
+    global _pool, _pool_lectura, _vigilancia
+    if _vigilancia is not None:
+        _vigilancia.cancel()
+        _vigilancia = None
+    if _pool_lectura is not None:
+        await _pool_lectura.close(force=True)
+        _pool_lectura = None
+        _replica["disponible"] = False
+    if _pool is not None:
+        await _pool.close(force=True)
+        _pool = None
+
+
+def crear_pool_lectura():
+    global _pool_lectura
+    if DB_REPLICA_DSN and _pool_lectura is None:
+        _pool_lectura = oracledb.create_pool_async(
+            user=DB_REPLICA_USER,
+            password=DB_REPLICA_PASSWORD,
+            dsn=DB_REPLICA_DSN,
+            min=REPLICA_POOL_MIN,
+            max=REPLICA_POOL_MAX,
+            increment=POOL_INCREMENT,
+            stmtcachesize=POOL_STMTCACHESIZE,
+            ping_interval=POOL_PING_INTERVAL,
+            getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+            wait_timeout=POOL_WAIT_TIMEOUT,
         )
-        return conexion
+    return _pool_lectura
+
+
+async def _medir_retraso():
+    # Marca la réplica disponible solo si responde y su retraso está dentro
+    # de REPLICA_RETRASO_MAX; cualquier error la deja fuera hasta el próximo chequeo
+    try:
+        cone = await _pool_lectura.acquire()
+        try:
+            with cone.cursor() as cursor:
+                await cursor.execute(REPLICA_RETRASO_SQL)
+                (retraso,) = await cursor.fetchone()
+        finally:
+            await _pool_lectura.release(cone)
+        _replica["retraso_s"] = float(retraso)
+        disponible = _replica["retraso_s"] <= REPLICA_RETRASO_MAX
+    except Exception as ex:
+        _replica["retraso_s"] = None
+        disponible = False
+        logger.warning("Réplica de lectura sin respuesta", extra={"campos": {"error": str(ex)}})
+    if disponible != _replica["disponible"]:
+        logger.warning("Réplica de lectura %s", "disponible" if disponible else "fuera de servicio",
+                       extra={"campos": {"retraso_s": _replica["retraso_s"]}})
+    _replica["disponible"] = disponible
+    _replica["chequeado_en"] = time.time()
+
+
+async def _vigilar_replica():
+    while True:
+        await _medir_retraso()
+        await asyncio.sleep(REPLICA_CHEQUEO)
+
+
+def iniciar_vigilancia_replica():
+    # Desde el lifespan: crea el pool de la réplica y revisa su retraso de fondo
+    global _vigilancia
+    if crear_pool_lectura() is not None and _vigilancia is None:
+        _vigilancia = asyncio.create_task(_vigilar_replica())
+
+
+# -------------------- LECTURA PROPIA --------------------
+# Claves de sesión (el token) que escribieron hace poco; ver app/lectura_propia.py
+_escrituras_recientes = OrderedDict()     # clave -> monotonic de la última escritura
+_ESCRITURAS_MAX = 10000
+
+
+def marcar_escritura(clave: str):
+    _escrituras_recientes[clave] = time.monotonic()
+    _escrituras_recientes.move_to_end(clave)
+    while len(_escrituras_recientes) > _ESCRITURAS_MAX:
+        _escrituras_recientes.popitem(last=False)
+
+
+def escribio_hace_poco(clave: str) -> bool:
+    momento = _escrituras_recientes.get(clave)
+    return momento is not None and time.monotonic() - momento < LECTURA_PROPIA_S
+
+
+def leer_del_primario():
+    # Para el resto de la petición actual, las lecturas van al primario;
+    # devuelve el token para restablecer_lectura()
+    return _solo_primario.set(True)
+
+
+def restablecer_lectura(token):
+    _solo_primario.reset(token)
+
+
+def lee_del_primario() -> bool:
+    return _pool_lectura is None or not _replica["disponible"] or _solo_primario.get()
+
+
+# -------------------- CONEXIONES DEL POOL --------------------
+@asynccontextmanager
+async def conexion(lectura: bool = False):
+    # Toma una conexión del pool y la devuelve siempre, incluso si el bloque
+    # que la usa lanza una excepción. Con lectura=True se usa la réplica si
+    # está disponible, al día y la sesión no acaba de escribir.
+    if lectura and _pool_lectura is not None:
+        if lee_del_primario():
+            _replica["al_primario"] += 1
+        else:
+            inicio = time.perf_counter()
+            try:
+                cone = await _pool_lectura.acquire()
+            except oracledb.DatabaseError as e:
+                # Se vuelve al primario y la réplica queda fuera hasta el próximo chequeo
+                _replica["errores"] += 1
+                _replica["al_primario"] += 1
+                _replica["disponible"] = False
+                logger.warning("Réplica de lectura fuera de servicio", extra={"campos": {"error": str(e)}})
+            else:
+                registrar("conexion", time.perf_counter() - inicio)
+                _replica["lecturas"] += 1
+                try:
+                    yield ConexionMedida(cone)
+                finally:
+                    await _pool_lectura.release(cone)
+                return
+
+    if _pool is None:
+        raise HTTPException(status_code=503, detail="El pool de conexiones no está inicializado")
+
+    inicio = time.perf_counter()
+    try:
+        cone = await _pool.acquire()
     except oracledb.DatabaseError as e:
-        raise HTTPException(status_code=500, detail=f"Error al conectar a la base de datos: {e}")
\ No newline at end of file
+        _estadisticas["errores"] += 1
+        if getattr(e.args[0], "full_code", None) in _POOL_AGOTADO:
+            # Saturación pasajera, como en hashing y admisión: 503 para que el
+            # cliente reintente, sin el mensaje del driver
+            _estadisticas["agotadas"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Base de datos ocupada, intente nuevamente",
+                headers={"Retry-After": POOL_RETRY_AFTER}
+            )
+        raise HTTPException(status_code=500, detail=f"Error al conectar a la base de datos: {e}")
+    espera = time.perf_counter() - inicio
+    _estadisticas["adquisiciones"] += 1
+    _estadisticas["espera_total"] += espera
+    _estadisticas["espera_max"] = max(_estadisticas["espera_max"], espera)
+    registrar("conexion", espera)
+
+    try:
+        # El envoltorio mide consultas y fetch para Server-Timing y /metrics
+        yield ConexionMedida(cone)
+    finally:
+        # Al liberar, el pool hace rollback de cualquier transacción pendiente.
+        # autocommit se restaura porque las escrituras de un solo viaje lo activan.
+        cone.autocommit = False
+        await _pool.release(cone)
+
+
+async def get_conexion():
+    # Dependencia de FastAPI para los handlers
+    async with conexion() as cone:
+        yield cone
+
+
+async def get_conexion_lectura():
+    # Para los GET: réplica de lectura si hay, si no el primario
+    async with conexion(lectura=True) as cone:
+        yield cone
+
+
+# Errores de parse que dependen de la sentencia y no de la conexión: tabla,
+# vista o columna inexistente (p. ej. una migración sin aplicar)
+_ORA_SENTENCIA_INVALIDA = {900, 904, 942, 4043}
+
+
+async def calentar_pool(sentencias: dict, conexiones: int = POOL_MIN) -> dict:
+    # Abre `conexiones` conexiones a la vez (el pool las crea de fondo y la
+    # primera petición pagaría el login) y deja cada sentencia (nombre -> sql)
+    # parseada en el caché de sentencias de cada una. Una sentencia inválida
+    # se registra en el log y se omite: la ruta que la usa fallará, pero el
+    # worker no queda fuera del balanceador por ella.
+    omitidas = {}
+
+    async def una():
+        async with conexion() as cone:
+            with cone.cursor() as cursor:
+                for nombre, sql in sentencias.items():
+                    if nombre in omitidas:
+                        continue
+                    try:
+                        await cursor.parse(sql)
+                    except oracledb.DatabaseError as ex:
+                        if ex.args[0].code not in _ORA_SENTENCIA_INVALIDA:
+                            raise
+                        omitidas[nombre] = ex.args[0].message
+
+    await asyncio.gather(*(una() for _ in range(conexiones)))
+    for nombre, error in omitidas.items():
+        logger.warning("Sentencia no parseada al calentar", extra={"campos": {"consulta": nombre, "error": error}})
+    return {"parseadas": len(sentencias) - len(omitidas), "conexiones": conexiones, "omitidas": sorted(omitidas)}
+
+
+# -------------------- ERRORES DE INTEGRIDAD --------------------
+# Las escrituras de un solo viaje no consultan antes de insertar o actualizar:
+# dejan que Oracle rechace la fila y traducen el error a la respuesta HTTP.
+# Las reglas se eligen por el nombre de la restricción o por sus columnas; las
+# columnas se leen del diccionario al iniciar (cargar_restricciones), así una
+# restricción creada con otro nombre (p. ej. SYS_C0012345) igual se reconoce.
+ORA_UNICA = 1                 # ORA-00001: restricción única violada
+ORA_PADRE_NO_EXISTE = 2291    # ORA-02291: no se encontró la clave padre
+
+_restricciones = None       # nombre -> (tipo, tabla, columnas); None hasta leerlas
+
+_SQL_RESTRICCIONES = registrar_consulta("esquema.restricciones_columnas", """
+    SELECT c.constraint_name, c.constraint_type, c.table_name, cc.column_name
+    FROM user_constraints c
+    JOIN user_cons_columns cc ON cc.constraint_name = c.constraint_name
+    WHERE c.table_name IN ('USUARIO', 'PAGO', 'TIPO_DESPACHO')
+    AND c.constraint_type IN ('P', 'U', 'R')
+    ORDER BY c.constraint_name, cc.position
+""")
+
+
+async def cargar_restricciones() -> int:
+    # Paso de arranque: nombre -> columnas de las restricciones de la API
+    global _restricciones
+    restricciones = {}
+    async with conexion() as cone:
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_RESTRICCIONES)
+            for nombre, tipo, tabla, columna in await cursor.fetchall():
+                restricciones.setdefault(nombre.upper(), (tipo, tabla.upper(), []))[2].append(columna.upper())
+    _restricciones = {nombre: (tipo, tabla, tuple(columnas)) for nombre, (tipo, tabla, columnas) in restricciones.items()}
+    if not unica_en("USUARIO", "EMAIL"):
+        logger.warning("usuario.email no tiene restricción única: los registros consultarán el email antes de "
+                       "insertar (agréguela con python -m app.migraciones aplicar)")
+    return len(_restricciones)
+
+
+def unica_en(tabla: str, columna: str) -> bool:
+    # ¿Hay una clave primaria o única formada solo por esa columna? Mientras
+    # no se hayan leído las restricciones se responde False (lo prudente)
+    if _restricciones is None:
+        return False
+    return any(
+        tipo in ("P", "U") and tabla_ == tabla and columnas == (columna,)
+        for tipo, tabla_, columnas in _restricciones.values()
+    )
+
+
+def _restriccion(mensaje: str) -> str:
+    # "ORA-00001: unique constraint (ESQUEMA.UK_USUARIO_EMAIL) violated" -> "UK_USUARIO_EMAIL"
+    inicio, fin = mensaje.find("("), mensaje.find(")")
+    if inicio == -1 or fin < inicio:
+        return ""
+    return mensaje[inicio + 1:fin].rsplit(".", 1)[-1].upper()
+
+
+def regla_integridad(error, reglas: list):
+    # error: el _Error del driver (de una excepción o de getbatcherrors());
+    # devuelve (status, detalle) de la primera regla que coincide, o None.
+    # El fragmento se busca en el nombre de la restricción y en sus columnas.
+    nombre = _restriccion(error.message)
+    columnas = (_restricciones or {}).get(nombre, (None, None, ()))[2]
+    textos = (nombre, *columnas)
+    for codigo, fragmento, status, detalle in reglas:
+        if error.code == codigo and (fragmento is None or any(fragmento in texto for texto in textos)):
+            return status, detalle
+    return None
+
+
+def error_integridad(ex: oracledb.IntegrityError, reglas: list) -> HTTPException:
+    # reglas: [(codigo_ora, fragmento_del_nombre_o_columna_o_None, status, detalle)];
+    # gana la primera que coincide. Sin coincidencia se responde 500.
+    regla = regla_integridad(ex.args[0], reglas)
+    if regla is None:
+        return HTTPException(status_code=500, detail=str(ex))
+    return HTTPException(status_code=regla[0], detail=regla[1])
+
+
+def detalle_fila(error, reglas: list) -> str:
+    # Detalle de una fila rechazada en un executemany(batcherrors=True): el
+    # de la regla que coincide o uno genérico. El mensaje ORA (códigos y
+    # nombres de restricciones) queda solo en el log.
+    regla = regla_integridad(error, reglas)
+    if regla is not None:
+        return regla[1]
+    logger.warning("Fila de lote rechazada", extra={"campos": {"codigo": error.code, "error": error.message}})
+    return "Fila rechazada por la base de datos"
+
+
+# -------------------- ESTADÍSTICAS --------------------
+def estadisticas_pool():
+    adquisiciones = _estadisticas["adquisiciones"]
+    return {
+        "inicializado": _pool is not None,
+        "abiertas": _pool.opened if _pool is not None else 0,
+        "ocupadas": _pool.busy if _pool is not None else 0,
+        "min": POOL_MIN,
+        "max": POOL_MAX,
+        "incremento": POOL_INCREMENT,
+        "stmtcachesize": POOL_STMTCACHESIZE,
+        "adquisiciones": adquisiciones,
+        "errores": _estadisticas["errores"],
+        "agotadas": _estadisticas["agotadas"],
+        "espera_promedio_ms": round(_estadisticas["espera_total"] / adquisiciones * 1000, 3) if adquisiciones else 0.0,
+        "espera_max_ms": round(_estadisticas["espera_max"] * 1000, 3),
+        "replica": estadisticas_replica(),
+    }
+
+
+def estadisticas_replica():
+    if _pool_lectura is None:
+        return {"configurada": bool(DB_REPLICA_DSN)}
+    return {
+        "configurada": True,
+        "abiertas": _pool_lectura.opened,
+        "ocupadas": _pool_lectura.busy,
+        "retraso_max_s": REPLICA_RETRASO_MAX,
+        "lectura_propia_s": LECTURA_PROPIA_S,
+        **_replica,
+    }
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import uuid
+from collections import OrderedDict, deque
+
+try:
+    import fcntl
+except ImportError:     # Windows: solo se revisa WEB_CONCURRENCY
+    fcntl = None
+
+from fastapi import HTTPException
+
+from app.database import conexion, detalle_fila
+
+logger = logging.getLogger(__name__)
+
+# Escritura diferida con commit agrupado: el handler valida, encola la fila y
+# responde 202 con un id de seguimiento; una tarea de fondo inserta lo
+# encolado con executemany y un solo commit cada DIFERIDA_INTERVALO_MS o
+# apenas se juntan DIFERIDA_LOTE filas. Lo encolado vive en memoria del
+# worker hasta ese commit: si el proceso muere sin drenar, se pierde.
+# El estado de cada seguimiento también vive solo en este worker, así que el
+# modo exige un único worker (ver verificar_un_worker).
+DIFERIDA_INTERVALO_MS = float(os.getenv("DIFERIDA_INTERVALO_MS", "50"))
+DIFERIDA_LOTE = int(os.getenv("DIFERIDA_LOTE", "500"))
+DIFERIDA_COLA_MAX = int(os.getenv("DIFERIDA_COLA_MAX", "10000"))          # filas esperando commit
+DIFERIDA_SEGUIMIENTO_MAX = int(os.getenv("DIFERIDA_SEGUIMIENTO_MAX", "100000"))  # estados recordados
+DIFERIDA_RETRY_AFTER = os.getenv("DIFERIDA_RETRY_AFTER", "1")            # segundos
+# Workers del despliegue; uvicorn y gunicorn toman este valor por defecto
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Candado que toma el worker con el modo diferido; por defecto uno por
+# proceso maestro (los workers de un mismo uvicorn/gunicorn comparten padre)
+DIFERIDA_CANDADO = os.getenv("DIFERIDA_CANDADO", "")
+
+PENDIENTE = "pendiente"
+GUARDADO = "guardado"
+ERROR = "error"
+
+
+class EscrituraDiferida:
+    def __init__(self, nombre: str, sql: str, reglas: list):
+        # reglas: las mismas de error_integridad, para el detalle de cada fila rechazada
+        self.nombre = nombre
+        self.sql = sql
+        self.reglas = reglas
+        self._cola = deque()                # (id, binds)
+        self._seguimiento = OrderedDict()   # id -> {"estado", "detalle", "dueno"}
+        self._hay_lote = asyncio.Event()
+        self._tarea = None
+        self._deteniendo = False
+        self.encoladas = 0
+        self.guardadas = 0
+        self.rechazadas = 0         # filas que la base rechazó (FK, etc.)
+        self.rechazos_cola = 0      # 503 por cola llena
+        self.volcados = 0
+        self.fallos_volcado = 0     # volcados completos que fallaron y se reintentan
+        self.ultimo_volcado_ms = None
+
+    # -------------------- ENCOLAR --------------------
+    def encolar(self, binds: dict, dueno: str = None) -> str:
+        # dueno: a quién se le muestra el estado (ver app.seguridad.verificar_acceso)
+        if len(self._cola) >= DIFERIDA_COLA_MAX:
+            self.rechazos_cola += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Cola de escritura llena, intente nuevamente",
+                headers={"Retry-After": DIFERIDA_RETRY_AFTER}
+            )
+        seguimiento = uuid.uuid4().hex
+        self._cola.append((seguimiento, binds))
+        self._recordar(seguimiento, {"estado": PENDIENTE, "detalle": None, "dueno": dueno})
+        self.encoladas += 1
+        if len(self._cola) >= DIFERIDA_LOTE:
+            self._hay_lote.set()
+        return seguimiento
+
+    def _recordar(self, seguimiento: str, estado: dict):
+        self._seguimiento[seguimiento] = estado
+        self._seguimiento.move_to_end(seguimiento)
+        while len(self._seguimiento) > DIFERIDA_SEGUIMIENTO_MAX:
+            self._seguimiento.popitem(last=False)
+
+    def estado(self, seguimiento: str):
+        return self._seguimiento.get(seguimiento)
+
+    # -------------------- VOLCADO --------------------
+    async def _volcar(self) -> int:
+        # Inserta hasta DIFERIDA_LOTE filas en una transacción. Si el volcado
+        # completo falla (p. ej. la base no responde), las filas vuelven al
+        # frente de la cola y se reintentan en el siguiente ciclo.
+        lote = [self._cola.popleft() for _ in range(min(DIFERIDA_LOTE, len(self._cola)))]
+        if not lote:
+            return 0
+        inicio = time.perf_counter()
+        try:
+            async with conexion() as cone:
+                with cone.cursor() as cursor:
+                    await cursor.executemany(self.sql, [binds for _, binds in lote], batcherrors=True)
+                    errores = {error.offset: error for error in cursor.getbatcherrors()}
+                await cone.commit()
+        except Exception as ex:
+            self._cola.extendleft(reversed(lote))
+            self.fallos_volcado += 1
+            logger.warning("Volcado diferido fallido", extra={"campos": {
+                "escritura": self.nombre, "filas": len(lote), "error": str(ex)
+            }})
+            return 0
+
+        for posicion, (seguimiento, _) in enumerate(lote):
+            estado = self._seguimiento.get(seguimiento)
+            if estado is None:
+                continue
+            error = errores.get(posicion)
+            if error is None:
+                estado["estado"] = GUARDADO
+            else:
+                estado["estado"] = ERROR
+                estado["detalle"] = detalle_fila(error, self.reglas)
+        self.rechazadas += len(errores)
+        self.guardadas += len(lote) - len(errores)
+        self.volcados += 1
+        self.ultimo_volcado_ms = round((time.perf_counter() - inicio) * 1000, 3)
+        return len(lote)
+
+    async def _escritor(self):
+        while not self._deteniendo:
+            try:
+                await asyncio.wait_for(self._hay_lote.wait(), DIFERIDA_INTERVALO_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._hay_lote.clear()
+            # Vacía todo lo encolado en lotes; si un volcado falla se espera al próximo ciclo
+            while self._cola and await self._volcar():
+                pass
+
+    def iniciar(self):
+        if self._tarea is None:
+            self._deteniendo = False
+            self._tarea = asyncio.create_task(self._escritor())
+
+    async def detener(self, intentos: int = 3):
+        # Drenado ordenado: el ciclo termina su volcado en curso (no se
+        # cancela a mitad de un lote) y después se vuelca lo que quede, con
+        # algunos reintentos, antes de cerrar el pool
+        if self._tarea is not None:
+            self._deteniendo = True
+            self._hay_lote.set()
+            await self._tarea
+            self._tarea = None
+        for _ in range(intentos):
+            while self._cola and await self._volcar():
+                pass
+            if not self._cola:
+                return
+        logger.error("Filas diferidas sin guardar al detener", extra={"campos": {
+            "escritura": self.nombre, "filas": len(self._cola)
+        }})
+
+    def estadisticas(self) -> dict:
+        return {
+            "activa": self._tarea is not None,
+            "en_cola": len(self._cola),
+            "cola_max": DIFERIDA_COLA_MAX,
+            "intervalo_ms": DIFERIDA_INTERVALO_MS,
+            "lote": DIFERIDA_LOTE,
+            "encoladas": self.encoladas,
+            "guardadas": self.guardadas,
+            "rechazadas": self.rechazadas,
+            "rechazos_cola": self.rechazos_cola,
+            "volcados": self.volcados,
+            "fallos_volcado": self.fallos_volcado,
+            "ultimo_volcado_ms": self.ultimo_volcado_ms,
+        }
+
+
+# -------------------- REGISTRO --------------------
+ESCRITURAS = {}
+
+
+def registrar_escritura(nombre: str, sql: str, reglas: list) -> EscrituraDiferida:
+    escritura = ESCRITURAS[nombre] = EscrituraDiferida(nombre, sql, reglas)
+    return escritura
+
+
+_candado = None      # archivo abierto con el candado tomado
+
+
+def _ruta_candado() -> str:
+    return DIFERIDA_CANDADO or os.path.join(tempfile.gettempdir(), f"ferremas-diferida-{os.getppid()}.lock")
+
+
+def verificar_un_worker():
+    # Con varios workers, el GET de seguimiento cae en cualquiera de ellos y
+    # respondería 404 para los ids encolados en otro: no se arranca. Además
+    # de WEB_CONCURRENCY se toma un candado exclusivo (flock), así que
+    # `uvicorn --workers 4` o `gunicorn -w 4` sin la variable también se
+    # detectan: el segundo worker no consigue el candado y no arranca. El
+    # sistema operativo lo suelta si el proceso muere.
+    global _candado
+    if not ESCRITURAS:
+        return
+    if WEB_CONCURRENCY > 1:
+        raise RuntimeError(
+            f"Escritura diferida activa ({', '.join(ESCRITURAS)}) con WEB_CONCURRENCY={WEB_CONCURRENCY}: "
+            "el seguimiento vive en memoria de un worker; use un solo worker o desactive el modo diferido"
+        )
+    if fcntl is None:
+        logger.warning("Sin fcntl no se puede detectar otro worker: el modo diferido confía en WEB_CONCURRENCY")
+        return
+    if _candado is not None:
+        return
+    ruta = _ruta_candado()
+    archivo = open(ruta, "a+", encoding="ascii")
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        archivo.seek(0)
+        otro = archivo.read().strip() or "?"
+        archivo.close()
+        raise RuntimeError(
+            f"Escritura diferida activa ({', '.join(ESCRITURAS)}) y el worker {otro} ya tiene el candado {ruta}: "
+            "hay más de un worker (--workers/-w); use uno solo o desactive el modo diferido"
+        )
+    archivo.seek(0)
+    archivo.truncate()
+    archivo.write(str(os.getpid()))
+    archivo.flush()
+    _candado = archivo
+
+
+def liberar_worker():
+    global _candado
+    if _candado is not None:
+        _candado.close()    # cerrar el archivo suelta el flock
+        _candado = None
+
+
+def iniciar():
+    for escritura in ESCRITURAS.values():
+        escritura.iniciar()
+
+
+async def detener():
+    for escritura in ESCRITURAS.values():
+        await escritura.detener()
+    liberar_worker()
+
+
+def estadisticas_diferidas() -> dict:
+    return {nombre: escritura.estadisticas() for nombre, escritura in ESCRITURAS.items()}
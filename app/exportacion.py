@@ -0,0 +1,88 @@
+import csv
+import io
+import os
+from datetime import datetime
+
+from fastapi import HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.database import conexion
+from app.serializacion import a_json
+
+# Filas por viaje a la base de datos: la memoria usada queda acotada por este
+# lote, sin importar el tamaño de la tabla exportada.
+EXPORT_ARRAYSIZE = int(os.getenv("EXPORT_ARRAYSIZE", "1000"))
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def parametro_formato():
+    return Query("ndjson", pattern="^(ndjson|csv)$", description="Formato de salida: ndjson o csv")
+
+
+def _valor(valor):
+    if isinstance(valor, datetime):
+        return valor.strftime("%Y-%m-%d %H:%M:%S")
+    return valor
+
+
+def _ndjson(columnas, lote):
+    # a_json ya escribe las fechas con el formato de la API
+    return b"".join(a_json(dict(zip(columnas, fila))) + b"\n" for fila in lote)
+
+
+def _csv(lote):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_valor(v) for v in fila] for fila in lote)
+    return buffer.getvalue()
+
+
+async def _generar(sql, binds, columnas, formato, transformar):
+    # La conexión se toma del pool dentro del generador y se libera al
+    # terminar (o si el cliente corta la descarga), así que el cursor vive
+    # solo mientras el cliente sigue leyendo. Las exportaciones son lecturas
+    # largas: van a la réplica si hay una.
+    async with conexion(lectura=True) as cone:
+        with cone.cursor() as cursor:
+            cursor.arraysize = EXPORT_ARRAYSIZE
+            cursor.prefetchrows = EXPORT_ARRAYSIZE
+            await cursor.execute(sql, binds)
+            yield _csv([columnas]) if formato == "csv" else ""
+            while True:
+                lote = await cursor.fetchmany()
+                if not lote:
+                    break
+                if transformar is not None:
+                    lote = [transformar(fila) for fila in lote]
+                yield _csv(lote) if formato == "csv" else _ndjson(columnas, lote)
+
+
+async def exportar(sql: str, binds: dict, columnas: list, formato: str, nombre: str,
+                   transformar=None) -> StreamingResponse:
+    # transformar, si se indica, recibe cada fila (tupla) y devuelve la fila a escribir
+    filas = _generar(sql, binds, columnas, formato, transformar)
+    # Se avanza el generador hasta después del execute para que un error de
+    # conexión o de SQL se responda con su código y no con un 200 truncado.
+    try:
+        primero = await filas.__anext__()
+    except HTTPException:
+        raise
+    except Exception as ex:
+        raise HTTPException(status_code=500, detail=str(ex))
+
+    async def cuerpo():
+        try:
+            yield primero
+            async for bloque in filas:
+                yield bloque
+        finally:
+            await filas.aclose()
+
+    return StreamingResponse(
+        cuerpo(),
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'}
+    )
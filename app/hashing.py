@@ -0,0 +1,168 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from fastapi import HTTPException
+
+from app.metricas import registrar
+
+# -------------------- CONFIGURACIÓN DEL EXECUTOR --------------------
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_MAX_PENDIENTES = int(os.getenv("HASH_MAX_PENDIENTES", str(HASH_WORKERS * 4)))
+HASH_RETRY_AFTER = os.getenv("HASH_RETRY_AFTER", "1")   # segundos
+# Cargas masivas: contraseñas por tarea y tareas de una misma carga en paralelo
+HASH_LOTE_TROZO = int(os.getenv("HASH_LOTE_TROZO", "4"))
+HASH_LOTE_WORKERS = int(os.getenv("HASH_LOTE_WORKERS", str(max(HASH_WORKERS // 2, 1))))
+
+_executor = None
+_pendientes = 0
+_metricas = {
+    "operaciones": 0,
+    "rechazos": 0,
+    "espera_total": 0.0,
+    "espera_max": 0.0,
+    "ejecucion_total": 0.0,
+    "ejecucion_max": 0.0,
+}
+
+
+# -------------------- FUNCIONES DEL PROCESO HIJO --------------------
+# Se ejecutan dentro del ProcessPoolExecutor y devuelven también su tiempo
+# de CPU para separar la espera en cola del tiempo de bcrypt.
+def _hash(password):
+    inicio = time.perf_counter()
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return hashed, time.perf_counter() - inicio
+
+
+def _verificar(password, hashed):
+    inicio = time.perf_counter()
+    valido = bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    return valido, time.perf_counter() - inicio
+
+
+def _hash_lote(passwords):
+    inicio = time.perf_counter()
+    hashes = [bcrypt.hashpw(p.encode('utf-8'), bcrypt.gensalt()).decode('utf-8') for p in passwords]
+    return hashes, time.perf_counter() - inicio
+
+
+def _calentar():
+    # Un hash de costo mínimo: obliga al proceso recién creado a importar bcrypt
+    bcrypt.hashpw(b"calentamiento", bcrypt.gensalt(4))
+    return os.getpid()
+
+
+# -------------------- CICLO DE VIDA --------------------
+def iniciar_executor():
+    # spawn evita heredar por fork los hilos y sockets del proceso de la API
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+async def calentar_executor() -> int:
+    # Con spawn cada proceso arranca e importa bcrypt en su primera tarea; se
+    # le manda una a cada uno antes de recibir tráfico. Devuelve los procesos listos.
+    loop = asyncio.get_running_loop()
+    executor = iniciar_executor()
+    pids = await asyncio.gather(*(loop.run_in_executor(executor, _calentar) for _ in range(HASH_WORKERS)))
+    return len(set(pids))
+
+
+def cerrar_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+async def _ejecutar(funcion, *args, costo: int = 1):
+    # costo: contraseñas de la tarea; _pendientes cuenta hashes, no tareas
+    global _pendientes
+    if _pendientes + costo > HASH_MAX_PENDIENTES:
+        _metricas["rechazos"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio de autenticación saturado, intente nuevamente",
+            headers={"Retry-After": HASH_RETRY_AFTER}
+        )
+
+    _pendientes += costo
+    inicio = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        resultado, ejecucion = await loop.run_in_executor(iniciar_executor(), funcion, *args)
+    finally:
+        _pendientes -= costo
+
+    espera = max(time.perf_counter() - inicio - ejecucion, 0.0)
+    _metricas["operaciones"] += 1
+    _metricas["espera_total"] += espera
+    _metricas["espera_max"] = max(_metricas["espera_max"], espera)
+    _metricas["ejecucion_total"] += ejecucion
+    _metricas["ejecucion_max"] = max(_metricas["ejecucion_max"], ejecucion)
+    registrar("hash", espera + ejecucion)
+    return resultado
+
+
+# -------------------- API PÚBLICA --------------------
+# Encriptar contraseña
+async def hash_password(password: str) -> str:
+    return await _ejecutar(_hash, password)
+
+# Verificar contraseña
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _ejecutar(_verificar, password, hashed)
+
+# Encriptar varias contraseñas (cargas masivas). El lote se manda en trozos
+# chicos, de a uno por vez en cada uno de HASH_LOTE_WORKERS carriles: entre
+# un trozo y el siguiente entran al executor los logins que estén esperando,
+# y la carga nunca ocupa más de la mitad de HASH_MAX_PENDIENTES, así que los
+# logins siguen pasando (o reciben el 503 rápido) en vez de esperar la carga.
+async def hash_passwords(passwords: list) -> list:
+    if not passwords:
+        return []
+    carriles = max(min(HASH_LOTE_WORKERS, len(passwords)), 1)
+    tamano = max(min(HASH_LOTE_TROZO, HASH_MAX_PENDIENTES // 2 // carriles), 1)
+    trozos = [passwords[i:i + tamano] for i in range(0, len(passwords), tamano)]
+    resultados = [None] * len(trozos)
+
+    async def carril(indices):
+        for i in indices:
+            resultados[i] = await _ejecutar(_hash_lote, trozos[i], costo=len(trozos[i]))
+
+    tareas = [asyncio.create_task(carril(range(i, len(trozos), carriles))) for i in range(carriles)]
+    try:
+        await asyncio.gather(*tareas)
+    except BaseException:
+        # Un carril rechazado (503) detiene a los demás
+        for tarea in tareas:
+            tarea.cancel()
+        raise
+    return [hashed for trozo in resultados for hashed in trozo]
+
+
+# -------------------- ESTADÍSTICAS --------------------
+def estadisticas_hashing():
+    operaciones = _metricas["operaciones"]
+    return {
+        "workers": HASH_WORKERS,
+        "max_pendientes": HASH_MAX_PENDIENTES,
+        "lote_trozo": HASH_LOTE_TROZO,
+        "lote_workers": HASH_LOTE_WORKERS,
+        "pendientes": _pendientes,
+        "operaciones": operaciones,
+        "rechazos": _metricas["rechazos"],
+        "espera_promedio_ms": round(_metricas["espera_total"] / operaciones * 1000, 3) if operaciones else 0.0,
+        "espera_max_ms": round(_metricas["espera_max"] * 1000, 3),
+        "ejecucion_promedio_ms": round(_metricas["ejecucion_total"] / operaciones * 1000, 3) if operaciones else 0.0,
+        "ejecucion_max_ms": round(_metricas["ejecucion_max"] * 1000, 3),
+    }
@@ -0,0 +1,67 @@
+import time
+
+from app.database import (
+    DB_REPLICA_DSN, LECTURA_PROPIA_S, escribio_hace_poco, leer_del_primario, marcar_escritura, restablecer_lectura
+)
+
+# Lectura de lo propio con réplica de lectura: después de una escritura
+# exitosa, los GET de la misma sesión van al primario durante
+# LECTURA_PROPIA_S segundos, para no leer de una réplica que todavía no
+# aplicó el cambio. La sesión se reconoce por el token (en este worker) y por
+# una cookie con el instante límite (en cualquier worker).
+COOKIE_LECTURA = "lectura_primaria"
+_LECTURAS = ("GET", "HEAD")
+
+
+def _cabecera(scope, nombre: bytes) -> str:
+    for clave, valor in scope["headers"]:
+        if clave == nombre:
+            return valor.decode("latin-1")
+    return ""
+
+
+def _clave_sesion(scope) -> str:
+    # El token tal cual: solo decide a qué base se lee, así que no hace falta validarlo aquí
+    autorizacion = _cabecera(scope, b"authorization")
+    return autorizacion[7:] if autorizacion[:7].lower() == "bearer " else ""
+
+
+def _cookie_vigente(scope) -> bool:
+    for par in _cabecera(scope, b"cookie").split(";"):
+        nombre, _, valor = par.strip().partition("=")
+        if nombre == COOKIE_LECTURA:
+            try:
+                return float(valor) > time.time()
+            except ValueError:
+                return False
+    return False
+
+
+class MiddlewareLecturaPropia:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not DB_REPLICA_DSN:
+            return await self.app(scope, receive, send)
+        clave = _clave_sesion(scope)
+
+        if scope["method"] in _LECTURAS:
+            if not ((clave and escribio_hace_poco(clave)) or _cookie_vigente(scope)):
+                return await self.app(scope, receive, send)
+            token = leer_del_primario()
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                restablecer_lectura(token)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start" and mensaje["status"] < 400:
+                if clave:
+                    marcar_escritura(clave)
+                hasta = int(time.time() + LECTURA_PROPIA_S) + 1
+                cookie = f"{COOKIE_LECTURA}={hasta}; Max-Age={LECTURA_PROPIA_S:.0f}; Path=/; HttpOnly; SameSite=Lax"
+                mensaje = {**mensaje, "headers": [*mensaje.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]}
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+import os
+import string
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+
+from app.consultas import registrar
+
+# Máximo de filas aceptadas en una sola petición de carga masiva
+LOTE_MAX = int(os.getenv("LOTE_MAX", "10000"))
+
+# Oracle admite hasta 1000 elementos en un IN. Se rellenan las listas hasta
+# uno de estos tamaños para que haya pocas variantes de SQL y el caché de
+# sentencias siga sirviendo.
+_TAMANOS_IN = (8, 64, 256, 1000)
+
+
+# -------------------- LECTURA DEL CUERPO --------------------
+async def leer_lote(request: Request) -> list:
+    # Acepta un arreglo JSON, NDJSON (un objeto por línea) o CSV con encabezado
+    tipo = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    cuerpo = await request.body()
+    try:
+        if tipo in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+            filas = [json.loads(linea) for linea in cuerpo.splitlines() if linea.strip()]
+        elif tipo == "application/json":
+            filas = json.loads(cuerpo)
+        elif tipo == "text/csv":
+            filas = list(csv.DictReader(io.StringIO(cuerpo.decode("utf-8-sig"))))
+        else:
+            raise HTTPException(status_code=415, detail="Use application/json, application/x-ndjson o text/csv")
+    except ValueError as ex:
+        raise HTTPException(status_code=400, detail=f"Cuerpo inválido: {ex}")
+
+    if not isinstance(filas, list) or not filas:
+        raise HTTPException(status_code=400, detail="Se esperaba una lista de filas no vacía")
+    if len(filas) > LOTE_MAX:
+        raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {LOTE_MAX} filas")
+    return filas
+
+
+def validar_filas(filas: list, modelo) -> tuple:
+    # Devuelve ([(indice, instancia)], {indice: detalle_error})
+    validas, errores = [], {}
+    for indice, fila in enumerate(filas):
+        try:
+            validas.append((indice, modelo.model_validate(fila)))
+        except ValidationError as ex:
+            errores[indice] = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in ex.errors())
+    return validas, errores
+
+
+# -------------------- CONSULTAS POR CONJUNTO --------------------
+def tamano_in(cantidad: int) -> int:
+    return next(t for t in _TAMANOS_IN if t >= cantidad)
+
+
+def registrar_in(nombre: str, plantilla: str) -> dict:
+    # plantilla con un campo por lista, p. ej. "... WHERE rut IN {r} OR email IN {e}".
+    # Registra una sentencia por tamaño fijo y devuelve {tamaño: sql}; los
+    # marcadores de cada lista usan el nombre del campo como prefijo (:r0, :r1...).
+    listas = [campo for _, campo, _, _ in string.Formatter().parse(plantilla) if campo]
+    return {
+        tamano: registrar(f"{nombre}_{tamano}", plantilla.format(**{
+            lista: "(" + ", ".join(f":{lista}{i}" for i in range(tamano)) + ")" for lista in listas
+        }))
+        for tamano in _TAMANOS_IN
+    }
+
+
+def binds_in(valores: list, prefijo: str = "v") -> dict:
+    # Binds para hasta 1000 valores, rellenando con NULL hasta el tamaño fijo
+    # de la sentencia que corresponde (ver registrar_in)
+    valores = list(valores) + [None] * (tamano_in(len(valores)) - len(valores))
+    return {f"{prefijo}{i}": v for i, v in enumerate(valores)}
+
+
+def bloques_in(valores) -> list:
+    # Valores sin repetir, en bloques que caben en un IN
+    valores = list(dict.fromkeys(valores))
+    return [valores[i:i + _TAMANOS_IN[-1]] for i in range(0, len(valores), _TAMANOS_IN[-1])]
+
+
+async def buscar_existentes(cursor, sentencias: dict, valores) -> set:
+    # sentencias: registrar_in(nombre, "SELECT x FROM t WHERE x IN {v}");
+    # devuelve cuáles de los valores existen, en una consulta por cada 1000.
+    existentes = set()
+    for bloque in bloques_in(valores):
+        await cursor.execute(sentencias[tamano_in(len(bloque))], binds_in(bloque))
+        existentes.update(fila[0] for fila in await cursor.fetchall())
+    return existentes
+
+
+def resumen_resultados(total: int, errores: dict) -> dict:
+    resultados = [
+        {"indice": i, "estado": "error", "detalle": errores[i]} if i in errores else {"indice": i, "estado": "ok"}
+        for i in range(total)
+    ]
+    return {
+        "total": total,
+        "insertados": total - len(errores),
+        "errores": len(errores),
+        "resultados": resultados,
+    }
@@ -1,15 +1,68 @@
+import time
+_inicio_importacion = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from app.routers import usuarios, despacho, pago
+from app import arranque, escritura_diferida
+from app.admision import MiddlewareAdmision
+from app.bitacora import iniciar_bitacora, detener_bitacora
+from app.compresion import MiddlewareCompresion
+from app.database import crear_pool, cerrar_pool, iniciar_vigilancia_replica
+from app.hashing import iniciar_executor, cerrar_executor
+from app.lectura_propia import MiddlewareLecturaPropia
+from app.metricas import MiddlewareMetricas
+from app.serializacion import RespuestaJSON
+from app.seguridad import verificar_claves
+from app.routers import usuarios, despacho, pago, monitoreo
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El pool y el executor de bcrypt se crean una sola vez por worker y se
+    # calientan antes de que /monitoreo/listo responda 200
+    # Sin claves JWT configuradas el worker no arranca (ver app/seguridad.py)
+    verificar_claves()
+    # El modo diferido exige un único worker (ver app/escritura_diferida.py)
+    escritura_diferida.verificar_un_worker()
+    iniciar_bitacora()
+    crear_pool()
+    iniciar_vigilancia_replica()
+    iniciar_executor()
+    await arranque.calentar()
+    escritura_diferida.iniciar()
+    yield
+    arranque.detener()
+    # Lo encolado en modo diferido se guarda antes de cerrar el pool
+    await escritura_diferida.detener()
+    cerrar_executor()
+    await cerrar_pool()
+    detener_bitacora()
+
 
 app = FastAPI(
     title="API de gestión de usuarios",
     version="1.0.0",
-    description="API para gestionar usuario usando FastAPI y Oracle"
+    description="API para gestionar usuario usando FastAPI y Oracle",
+    default_response_class=RespuestaJSON,
+    lifespan=lifespan
 )
 
+# gzip/br negociado para las respuestas grandes (listas, exportaciones)
+app.add_middleware(MiddlewareCompresion)
+# Con réplica de lectura, los GET de una sesión que acaba de escribir van al primario
+app.add_middleware(MiddlewareLecturaPropia)
+# Límites de concurrencia por clase de ruta (queda por dentro del de
+# métricas, así que los 503 por saturación también se cuentan)
+app.add_middleware(MiddlewareAdmision)
+# Server-Timing por respuesta y agregados por ruta para /metrics
+app.add_middleware(MiddlewareMetricas)
+
 #Traeremos lo de las rutas(routers):
 app.include_router(usuarios.router, prefix="/usuarios")
 app.include_router(pago.router)
 app.include_router(despacho.router)
+app.include_router(monitoreo.router)
+app.include_router(monitoreo.router_metricas)
 
-
+arranque.registrar_importacion(time.perf_counter() - _inicio_importacion)
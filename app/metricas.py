@@ -0,0 +1,255 @@
+import time
+from contextvars import ContextVar
+
+from app import consultas
+
+# -------------------- MEDICIÓN POR PETICIÓN --------------------
+# Cada petición acumula aquí cuánto tiempo pasó en cada fase. Fuera de una
+# petición (CLI, tareas de fondo) la variable está vacía y registrar() no hace nada.
+FASES = ("conexion", "consulta", "fetch", "hash", "serializacion")
+
+_medicion = ContextVar("medicion", default=None)
+
+# Buckets del histograma de duración total, en segundos
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_peticiones = {}     # (metodo, ruta, estado) -> cantidad
+_duraciones = {}     # (metodo, ruta) -> [conteos por bucket..., +Inf, suma]
+_fases = {}          # (metodo, ruta, fase) -> segundos acumulados
+_consultas = {}      # (metodo, ruta) -> consultas acumuladas
+
+
+def registrar(fase: str, segundos: float):
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion[fase] = medicion.get(fase, 0.0) + segundos
+        if fase == "consulta":
+            medicion["consultas"] = medicion.get("consultas", 0) + 1
+
+
+class medir:
+    # with medir("fetch"): ...  suma el tiempo del bloque a esa fase
+    __slots__ = ("fase", "_inicio")
+
+    def __init__(self, fase: str):
+        self.fase = fase
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+
+    def __exit__(self, *exc):
+        registrar(self.fase, time.perf_counter() - self._inicio)
+
+
+def _server_timing(medicion: dict, total: float) -> bytes:
+    partes = [f"{fase};dur={medicion[fase] * 1000:.2f}" for fase in FASES if fase in medicion]
+    partes.append(f'consultas;desc="{medicion.get("consultas", 0)}"')
+    partes.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(partes).encode("latin-1")
+
+
+def _acumular(metodo, ruta, estado, total, medicion):
+    _peticiones[(metodo, ruta, estado)] = _peticiones.get((metodo, ruta, estado), 0) + 1
+    histograma = _duraciones.setdefault((metodo, ruta), [0] * (len(_BUCKETS) + 2))
+    for i, limite in enumerate(_BUCKETS):
+        if total <= limite:
+            histograma[i] += 1
+    histograma[-2] += 1
+    histograma[-1] += total
+    for fase in FASES:
+        if fase in medicion:
+            _fases[(metodo, ruta, fase)] = _fases.get((metodo, ruta, fase), 0.0) + medicion[fase]
+    _consultas[(metodo, ruta)] = _consultas.get((metodo, ruta), 0) + medicion.get("consultas", 0)
+
+
+# -------------------- CONEXIÓN Y CURSOR MEDIDOS --------------------
+# Envoltorios delgados sobre la conexión/cursor asíncronos de oracledb. Todo
+# lo que no se mide (autocommit, rowcount, var, rowfactory, ...) pasa directo.
+class CursorMedido:
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        object.__setattr__(self, "_cursor", cursor)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._cursor, nombre, valor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    async def execute(self, statement, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return await self._cursor.execute(statement, *args, **kwargs)
+        finally:
+            self._contar(statement, time.perf_counter() - inicio)
+
+    async def executemany(self, statement, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return await self._cursor.executemany(statement, *args, **kwargs)
+        finally:
+            self._contar(statement, time.perf_counter() - inicio)
+
+    @staticmethod
+    def _contar(statement, segundos):
+        registrar("consulta", segundos)
+        consultas.contar(statement, segundos)
+
+    async def fetchone(self):
+        with medir("fetch"):
+            return await self._cursor.fetchone()
+
+    async def fetchmany(self, *args, **kwargs):
+        with medir("fetch"):
+            return await self._cursor.fetchmany(*args, **kwargs)
+
+    async def fetchall(self):
+        with medir("fetch"):
+            return await self._cursor.fetchall()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        with medir("fetch"):
+            return await self._cursor.__anext__()
+
+
+class ConexionMedida:
+    __slots__ = ("_cone",)
+
+    def __init__(self, cone):
+        object.__setattr__(self, "_cone", cone)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cone, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._cone, nombre, valor)
+
+    def cursor(self, *args, **kwargs):
+        return CursorMedido(self._cone.cursor(*args, **kwargs))
+
+    async def commit(self):
+        with medir("consulta"):
+            return await self._cone.commit()
+
+    async def fetch_df_all(self, statement, *args, **kwargs):
+        # Consulta y traída en un solo llamado (DataFrame de oracledb)
+        inicio = time.perf_counter()
+        try:
+            return await self._cone.fetch_df_all(statement, *args, **kwargs)
+        finally:
+            CursorMedido._contar(statement, time.perf_counter() - inicio)
+
+
+# -------------------- MIDDLEWARE --------------------
+def _plantilla(scope) -> str:
+    # La plantilla de la ruta ("/pagos/{rut}") mantiene acotadas las etiquetas.
+    # En routers incluidos route.path no trae el prefijo de include_router;
+    # FastAPI lo deja en el contexto de inclusión del scope.
+    ruta = getattr(scope.get("route"), "path", None)
+    if ruta is None:
+        return "sin_ruta"
+    incluido = scope.get("fastapi", {}).get("included_router")
+    prefijo = getattr(getattr(incluido, "include_context", None), "prefix", "")
+    return prefijo + ruta
+
+
+class MiddlewareMetricas:
+    # Middleware ASGI puro (sin BaseHTTPMiddleware, que copia el cuerpo de la
+    # respuesta): agrega Server-Timing y acumula las métricas por ruta.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        medicion = {}
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                cabeceras = list(mensaje.get("headers", []))
+                cabeceras.append((b"server-timing", _server_timing(medicion, time.perf_counter() - inicio)))
+                mensaje = {**mensaje, "headers": cabeceras}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _medicion.reset(token)
+            _acumular(scope["method"], _plantilla(scope), estado, time.perf_counter() - inicio, medicion)
+
+
+# -------------------- EXPOSICIÓN PROMETHEUS --------------------
+def _etiquetas(**valores) -> str:
+    texto = ",".join(f'{k}="{str(v)}"' for k, v in valores.items())
+    return "{" + texto + "}"
+
+
+def exportar_prometheus(extras: dict = None) -> str:
+    # extras: {nombre_métrica: valor} para gauges sueltos (pool, hashing, ...)
+    lineas = [
+        "# HELP api_peticiones_total Peticiones HTTP atendidas.",
+        "# TYPE api_peticiones_total counter",
+    ]
+    for (metodo, ruta, estado), cantidad in sorted(_peticiones.items()):
+        lineas.append(f"api_peticiones_total{_etiquetas(metodo=metodo, ruta=ruta, estado=estado)} {cantidad}")
+
+    lineas += [
+        "# HELP api_duracion_segundos Duración total de la petición.",
+        "# TYPE api_duracion_segundos histogram",
+    ]
+    for (metodo, ruta), histograma in sorted(_duraciones.items()):
+        for limite, cantidad in zip(_BUCKETS, histograma):
+            lineas.append(f"api_duracion_segundos_bucket{_etiquetas(metodo=metodo, ruta=ruta, le=limite)} {cantidad}")
+        lineas.append(f"api_duracion_segundos_bucket{_etiquetas(metodo=metodo, ruta=ruta, le='+Inf')} {histograma[-2]}")
+        lineas.append(f"api_duracion_segundos_count{_etiquetas(metodo=metodo, ruta=ruta)} {histograma[-2]}")
+        lineas.append(f"api_duracion_segundos_sum{_etiquetas(metodo=metodo, ruta=ruta)} {histograma[-1]:.6f}")
+
+    lineas += [
+        "# HELP api_fase_segundos_total Tiempo acumulado por fase (conexion, consulta, fetch, hash, serializacion).",
+        "# TYPE api_fase_segundos_total counter",
+    ]
+    for (metodo, ruta, fase), segundos in sorted(_fases.items()):
+        lineas.append(f"api_fase_segundos_total{_etiquetas(metodo=metodo, ruta=ruta, fase=fase)} {segundos:.6f}")
+
+    lineas += [
+        "# HELP api_consultas_total Consultas a Oracle ejecutadas.",
+        "# TYPE api_consultas_total counter",
+    ]
+    for (metodo, ruta), cantidad in sorted(_consultas.items()):
+        lineas.append(f"api_consultas_total{_etiquetas(metodo=metodo, ruta=ruta)} {cantidad}")
+
+    lineas += [
+        "# HELP api_sentencia_ejecuciones_total Ejecuciones por sentencia registrada (app.consultas).",
+        "# TYPE api_sentencia_ejecuciones_total counter",
+    ]
+    ejecuciones = consultas.ejecuciones()
+    for nombre, (veces, _) in sorted(ejecuciones.items()):
+        lineas.append(f"api_sentencia_ejecuciones_total{_etiquetas(sentencia=nombre)} {veces}")
+    lineas += [
+        "# HELP api_sentencia_segundos_total Tiempo acumulado por sentencia registrada.",
+        "# TYPE api_sentencia_segundos_total counter",
+    ]
+    for nombre, (_, segundos) in sorted(ejecuciones.items()):
+        lineas.append(f"api_sentencia_segundos_total{_etiquetas(sentencia=nombre)} {segundos:.6f}")
+
+    for nombre, valor in (extras or {}).items():
+        lineas.append(f"# TYPE {nombre} gauge")
+        lineas.append(f"{nombre} {valor}")
+    return "\n".join(lineas) + "\n"
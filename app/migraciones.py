@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import os
+import re
+import sys
+import textwrap
+
+import oracledb
+
+from app import consultas as registro, resumen_pagos
+from app.database import cerrar_pool, conexion, crear_pool
+
+logger = logging.getLogger(__name__)
+
+# -------------------- ESQUEMA --------------------
+# DDL de las tablas e índices de la API, en orden de dependencias. Los nombres
+# de las restricciones importan: error_integridad() los usa para elegir el
+# mensaje (EMAIL, TIPO, COMUNA). Las restricciones únicas y foráneas van
+# aparte (RESTRICCIONES) para que una base con las tablas ya creadas también
+# las reciba.
+TABLAS = [
+    ("comuna", """
+        CREATE TABLE comuna (
+            id_comuna    NUMBER        NOT NULL,
+            descripcion  VARCHAR2(100) NOT NULL,
+            CONSTRAINT pk_comuna PRIMARY KEY (id_comuna)
+        )"""),
+    ("tipo_pago", """
+        CREATE TABLE tipo_pago (
+            id_tipo_pago NUMBER        NOT NULL,
+            descripcion  VARCHAR2(100) NOT NULL,
+            CONSTRAINT pk_tipo_pago PRIMARY KEY (id_tipo_pago)
+        )"""),
+    ("usuario", """
+        CREATE TABLE usuario (
+            rut             VARCHAR2(12)  NOT NULL,
+            nombre          VARCHAR2(100) NOT NULL,
+            apellido        VARCHAR2(100) NOT NULL,
+            email           VARCHAR2(150) NOT NULL,
+            telefono        NUMBER,
+            clave           VARCHAR2(100) NOT NULL,
+            rol             VARCHAR2(20)  NOT NULL,
+            id_comuna       NUMBER,
+            requiere_cambio NUMBER(1)     DEFAULT 0 NOT NULL,
+            CONSTRAINT pk_usuario PRIMARY KEY (rut)
+        )"""),
+    ("pago", """
+        CREATE TABLE pago (
+            id_pago      NUMBER GENERATED BY DEFAULT AS IDENTITY,
+            rut_usuario  VARCHAR2(12) NOT NULL,
+            id_tipo_pago NUMBER       NOT NULL,
+            monto        NUMBER       NOT NULL,
+            fecha_pago   DATE         DEFAULT SYSDATE NOT NULL,
+            CONSTRAINT pk_pago PRIMARY KEY (id_pago)
+        )"""),
+    ("tipo_despacho", """
+        CREATE TABLE tipo_despacho (
+            id           NUMBER GENERATED BY DEFAULT AS IDENTITY,
+            rut_usuario  VARCHAR2(12)  NOT NULL,
+            tipo         VARCHAR2(50)  NOT NULL,
+            direccion    VARCHAR2(200),
+            sucursal     VARCHAR2(100),
+            CONSTRAINT pk_tipo_despacho PRIMARY KEY (id)
+        )"""),
+    ("pago_resumen", """
+        CREATE TABLE pago_resumen (
+            rut_usuario   VARCHAR2(12) NOT NULL,
+            id_tipo_pago  NUMBER       NOT NULL,
+            mes           DATE         NOT NULL,
+            cantidad      NUMBER       NOT NULL,
+            total         NUMBER       NOT NULL,
+            CONSTRAINT pk_pago_resumen PRIMARY KEY (rut_usuario, id_tipo_pago, mes)
+        )"""),
+    # Una sola fila; trg_usuario_version la incrementa en cada cambio de usuario
+    # y GET /usuarios/usuarios la usa para su ETag sin recorrer la tabla
+    ("usuario_version", """
+        CREATE TABLE usuario_version (
+            id       NUMBER(1) DEFAULT 1 NOT NULL,
+            version  NUMBER    DEFAULT 0 NOT NULL,
+            CONSTRAINT pk_usuario_version PRIMARY KEY (id),
+            CONSTRAINT ck_usuario_version_unica CHECK (id = 1)
+        )"""),
+]
+
+RESTRICCIONES = [
+    ("uk_usuario_email", "ALTER TABLE usuario ADD CONSTRAINT uk_usuario_email UNIQUE (email)"),
+    ("fk_usuario_comuna",
+     "ALTER TABLE usuario ADD CONSTRAINT fk_usuario_comuna FOREIGN KEY (id_comuna) REFERENCES comuna (id_comuna)"),
+    ("fk_pago_usuario",
+     "ALTER TABLE pago ADD CONSTRAINT fk_pago_usuario FOREIGN KEY (rut_usuario) REFERENCES usuario (rut)"),
+    ("fk_pago_tipo_pago",
+     "ALTER TABLE pago ADD CONSTRAINT fk_pago_tipo_pago FOREIGN KEY (id_tipo_pago) REFERENCES tipo_pago (id_tipo_pago)"),
+    ("fk_despacho_usuario",
+     "ALTER TABLE tipo_despacho ADD CONSTRAINT fk_despacho_usuario FOREIGN KEY (rut_usuario) REFERENCES usuario (rut)"),
+]
+
+INDICES = [
+    # GET /despacho/usuario/{rut} y su sonda de ETag
+    ("ix_despacho_rut", "CREATE INDEX ix_despacho_rut ON tipo_despacho (rut_usuario)"),
+    # GET /pagos/{rut}: filtra por usuario y ordena por fecha sin SORT aparte
+    ("ix_pago_rut_fecha", "CREATE INDEX ix_pago_rut_fecha ON pago (rut_usuario, fecha_pago)"),
+    # GET /pagos/: paginación por cursor (fecha_pago DESC, id_pago DESC)
+    ("ix_pago_fecha_id", "CREATE INDEX ix_pago_fecha_id ON pago (fecha_pago, id_pago)"),
+    # buscar-usuario-por-email compara LOWER(email); uk_usuario_email no sirve ahí
+    ("ix_usuario_email_lower", "CREATE INDEX ix_usuario_email_lower ON usuario (LOWER(email))"),
+    # La clave foránea hacia tipo_pago sin índice bloquea la tabla hija al borrar un tipo
+    ("ix_pago_tipo", "CREATE INDEX ix_pago_tipo ON pago (id_tipo_pago)"),
+]
+
+# Se ejecutan siempre, después de lo anterior: son idempotentes
+FILAS_INICIALES = [
+    ("usuario_version", """
+        INSERT INTO usuario_version (id, version)
+        SELECT 1, 0 FROM dual WHERE NOT EXISTS (SELECT 1 FROM usuario_version)"""),
+]
+
+# A nivel de sentencia: una escritura que toca muchas filas suma una sola vez.
+# Cambiar solo la clave no altera la lista, así que no cuenta.
+DISPARADORES = [
+    ("trg_usuario_version", """
+        CREATE OR REPLACE TRIGGER trg_usuario_version
+        AFTER INSERT OR DELETE OR UPDATE OF nombre, apellido, email, telefono, rol, id_comuna ON usuario
+        BEGIN
+            UPDATE usuario_version SET version = version + 1 WHERE id = 1;
+        END;"""),
+]
+
+# ORA-00955: el nombre ya existe; ORA-01408: esas columnas ya están indexadas
+_YA_EXISTE = (955, 1408)
+# ORA-02264: ya existe una restricción con ese nombre
+_RESTRICCION_EXISTE = 2264
+# ORA-02261 / ORA-02275: ya hay una restricción equivalente, pero con otro nombre
+_RESTRICCION_EQUIVALENTE = (2261, 2275)
+
+
+async def aplicar() -> list:
+    # Crea lo que falta y deja intacto lo que ya existe. Devuelve lo creado.
+    # Una tabla que ya existía igual recibe las restricciones que le falten; si
+    # no se pueden agregar (p. ej. emails duplicados) se detiene con el error.
+    creados = []
+    async with conexion() as cone:
+        with cone.cursor() as cursor:
+            for nombre, ddl in TABLAS:
+                await _crear(cursor, nombre, ddl, creados)
+            for nombre, ddl in RESTRICCIONES:
+                try:
+                    await cursor.execute(ddl)
+                    creados.append(nombre)
+                except oracledb.DatabaseError as ex:
+                    codigo = ex.args[0].code
+                    if codigo in _RESTRICCION_EQUIVALENTE:
+                        raise RuntimeError(
+                            f"Ya existe una restricción equivalente a {nombre} con otro nombre; "
+                            f"renómbrela con ALTER TABLE ... RENAME CONSTRAINT ... TO {nombre}"
+                        ) from ex
+                    if codigo != _RESTRICCION_EXISTE:
+                        raise
+            for nombre, ddl in INDICES:
+                await _crear(cursor, nombre, ddl, creados)
+            for _, ddl in FILAS_INICIALES + DISPARADORES:
+                await cursor.execute(ddl)
+        await cone.commit()
+    if "pago_resumen" in creados:
+        # Tabla nueva en una base con pagos: se llena desde el historial
+        await resumen_pagos.reconstruir()
+    return creados
+
+
+async def _crear(cursor, nombre: str, ddl: str, creados: list):
+    try:
+        await cursor.execute(ddl)
+        creados.append(nombre)
+    except oracledb.DatabaseError as ex:
+        if ex.args[0].code not in _YA_EXISTE:
+            raise
+
+
+# -------------------- VERIFICACIÓN DE PLANES --------------------
+# Opcional: revisar planes con EXPLAIN PLAN en cada worker al iniciar; en CI
+# conviene `python -m app.migraciones verificar` una sola vez
+VERIFICAR_PLANES = os.getenv("VERIFICAR_PLANES", "0") == "1"
+
+# Tablas de referencia de pocas filas: recorrerlas completas es lo más barato
+TABLAS_PEQUENAS = {"COMUNA", "TIPO_PAGO", "USUARIO_VERSION"}
+
+
+def _binds_vacios(sql: str) -> dict:
+    # EXPLAIN PLAN no usa los valores, pero el driver exige uno por placeholder.
+    # Se quitan los literales para no confundir 'HH24:MI:SS' con binds.
+    sin_literales = re.sub(r"'[^']*'", "''", sql)
+    return {nombre: None for nombre in re.findall(r"(?<![:\w]):([A-Za-z_]\w*)", sin_literales)}
+
+
+async def verificar_planes(consultas: dict = None) -> dict:
+    # Ejecuta EXPLAIN PLAN sobre las lecturas puntuales registradas
+    # (verificar_plan=True) y devuelve {nombre: [tablas recorridas completas]}
+    # solo para las que tienen alguna
+    consultas = registro.para_verificar() if consultas is None else consultas
+    problemas = {}
+    async with conexion() as cone:
+        with cone.cursor() as cursor:
+            for i, (nombre, sql) in enumerate(sorted(consultas.items())):
+                id_plan = f"api_{i}"
+                await cursor.execute(f"EXPLAIN PLAN SET STATEMENT_ID = '{id_plan}' FOR {sql}", _binds_vacios(sql))
+                await cursor.execute("""
+                    SELECT DISTINCT object_name
+                    FROM plan_table
+                    WHERE statement_id = :id
+                      AND operation = 'TABLE ACCESS' AND options = 'FULL'
+                """, {"id": id_plan})
+                tablas = sorted(tabla for (tabla,) in await cursor.fetchall() if tabla not in TABLAS_PEQUENAS)
+                if tablas:
+                    problemas[nombre] = tablas
+        # Las filas de plan_table son de esta transacción; se descartan
+        await cone.rollback()
+
+    for nombre, tablas in problemas.items():
+        logger.warning("Consulta con recorrido completo", extra={"campos": {"consulta": nombre, "tablas": tablas}})
+    return problemas
+
+
+# -------------------- CLI --------------------
+async def _main(accion):
+    if accion == "sql":
+        for _, ddl in TABLAS + RESTRICCIONES + INDICES + FILAS_INICIALES:
+            print(textwrap.dedent(ddl).strip() + ";\n")
+        for _, ddl in DISPARADORES:
+            print(textwrap.dedent(ddl).strip() + "\n/\n")
+        return 0
+
+    crear_pool()
+    try:
+        if accion == "aplicar":
+            creados = await aplicar()
+            print(f"Creados: {', '.join(creados)}" if creados else "El esquema ya estaba al día")
+            return 0
+        # Los routers registran sus consultas al importarse
+        import app.main  # noqa: F401
+        problemas = await verificar_planes()
+    finally:
+        await cerrar_pool()
+    for nombre, tablas in problemas.items():
+        print(f"FULL SCAN  {nombre}: {', '.join(tablas)}")
+    print(f"{len(registro.para_verificar())} consultas revisadas, {len(problemas)} con recorrido completo")
+    return 1 if problemas else 0
+
+
+if __name__ == "__main__":
+    # python -m app.migraciones aplicar|verificar|sql
+    if len(sys.argv) < 2 or sys.argv[1] not in ("aplicar", "verificar", "sql"):
+        sys.exit("Uso: python -m app.migraciones aplicar|verificar|sql")
+    sys.exit(asyncio.run(_main(sys.argv[1])))
@@ -0,0 +1,94 @@
+import base64
+import json
+from datetime import datetime
+from typing import Generic, List, Optional, TypeVar
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+
+
+# -------------------- CURSORES OPACOS --------------------
+# El cursor guarda la clave de la última fila entregada (por ejemplo
+# fecha_pago e id_pago) codificada en base64, para que el cliente no dependa
+# de su formato.
+def codificar_cursor(*valores) -> str:
+    crudo = json.dumps(
+        [v.isoformat() if isinstance(v, datetime) else v for v in valores],
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def _cursor_invalido():
+    return HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+
+def decodificar_cursor(cursor: str, *convertir) -> list:
+    # convertir: una función por valor de la clave (parsear_fecha,
+    # parsear_entero, parsear_texto); un cursor alterado con otros tipos
+    # responde 400 en vez de llegar a los binds
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(crudo)
+    except ValueError:
+        raise _cursor_invalido()
+    if not isinstance(valores, list) or len(valores) != len(convertir):
+        raise _cursor_invalido()
+    return [funcion(valor) for funcion, valor in zip(convertir, valores)]
+
+
+def parsear_fecha(valor: str) -> datetime:
+    try:
+        return datetime.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise _cursor_invalido()
+
+
+def parsear_entero(valor) -> int:
+    # bool es subclase de int: true/false no son ids
+    if not isinstance(valor, int) or isinstance(valor, bool):
+        raise _cursor_invalido()
+    return valor
+
+
+def parsear_texto(valor) -> str:
+    if not isinstance(valor, str):
+        raise _cursor_invalido()
+    return valor
+
+
+# -------------------- PARÁMETROS Y RESPUESTA --------------------
+def parametro_limite():
+    return Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO, description="Cantidad máxima de filas por página")
+
+
+def parametro_cursor():
+    return Query(None, description="Token 'siguiente' devuelto por la página anterior")
+
+
+T = TypeVar("T")
+
+
+class Pagina(BaseModel, Generic[T]):
+    # Modelo de respuesta de las listas paginadas (documenta el esquema)
+    items: List[T]
+    siguiente: Optional[str] = None
+
+
+def preparar_cursor(cursor, limite: int):
+    # Con prefetchrows > limite + 1 la página entera llega con la respuesta
+    # del execute y el driver ya sabe que no hay más filas: un solo viaje.
+    cursor.prefetchrows = limite + 2
+    cursor.arraysize = limite + 2
+
+
+def pagina(filas: list, limite: int, clave):
+    # Se piden limite + 1 filas: si sobra una, hay más páginas y el cursor
+    # apunta a la última fila entregada.
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    siguiente = codificar_cursor(*clave(filas[-1])) if hay_mas else None
+    return filas, siguiente
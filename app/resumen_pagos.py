@@ -0,0 +1,160 @@
+import asyncio
+import sys
+
+from app.consultas import registrar
+from app.database import cerrar_pool, conexion, crear_pool
+
+# pago_resumen guarda, por usuario, tipo de pago y mes, la cantidad y el total
+# de pagos. Se mantiene en la misma transacción que cada INSERT/DELETE sobre
+# pago, así que leer el resumen no recorre el historial del usuario.
+
+# Suma v_cantidad/v_total a la fila (v_rut, v_tipo, v_mes), creándola si no existe
+_ACUMULAR = """
+        UPDATE pago_resumen
+        SET cantidad = cantidad + v_cantidad, total = total + v_total
+        WHERE rut_usuario = v_rut AND id_tipo_pago = v_tipo AND mes = v_mes;
+        IF SQL%ROWCOUNT = 0 THEN
+            BEGIN
+                INSERT INTO pago_resumen (rut_usuario, id_tipo_pago, mes, cantidad, total)
+                VALUES (v_rut, v_tipo, v_mes, v_cantidad, v_total);
+            EXCEPTION
+                -- otra sesión creó la fila entre el UPDATE y el INSERT
+                WHEN DUP_VAL_ON_INDEX THEN
+                    UPDATE pago_resumen
+                    SET cantidad = cantidad + v_cantidad, total = total + v_total
+                    WHERE rut_usuario = v_rut AND id_tipo_pago = v_tipo AND mes = v_mes;
+            END;
+        END IF;
+"""
+
+_VARIABLES = """
+        v_rut      pago.rut_usuario%TYPE;
+        v_tipo     pago.id_tipo_pago%TYPE;
+        v_total    pago.monto%TYPE;
+        v_fecha    pago.fecha_pago%TYPE;
+        v_mes      DATE;
+        v_cantidad NUMBER;
+"""
+
+# Binds: rut_usuario, id_tipo_pago, monto; salida: id_pago
+REGISTRAR_PAGO = registrar("pago.registrar", f"""
+    DECLARE{_VARIABLES}
+    BEGIN
+        INSERT INTO pago (rut_usuario, id_tipo_pago, monto)
+        VALUES (:rut_usuario, :id_tipo_pago, :monto)
+        RETURNING id_pago, rut_usuario, id_tipo_pago, monto, fecha_pago
+        INTO :id_pago, v_rut, v_tipo, v_total, v_fecha;
+        v_mes := TRUNC(v_fecha, 'MM');
+        v_cantidad := 1;
+        {_ACUMULAR}
+    END;
+""", caliente=True)
+
+# Binds: id; salida: borrados (0 si el pago no existía)
+ELIMINAR_PAGO = registrar("pago.eliminar", f"""
+    DECLARE{_VARIABLES}
+    BEGIN
+        DELETE FROM pago WHERE id_pago = :id
+        RETURNING rut_usuario, id_tipo_pago, monto, fecha_pago
+        INTO v_rut, v_tipo, v_total, v_fecha;
+        IF SQL%ROWCOUNT = 0 THEN
+            :borrados := 0;
+        ELSE
+            :borrados := 1;
+            v_mes := TRUNC(v_fecha, 'MM');
+            v_cantidad := -1;
+            v_total := -v_total;
+            {_ACUMULAR}
+            DELETE FROM pago_resumen
+            WHERE rut_usuario = v_rut AND id_tipo_pago = v_tipo AND mes = v_mes AND cantidad <= 0;
+        END IF;
+    END;
+""")
+
+# Para cargas masivas (executemany), una fila por (rut, tipo, mes) ya
+# agregada. Binds: rut_usuario, id_tipo_pago, mes, cantidad, total. El mes
+# sale de la fecha_pago que devolvió cada INSERT, no de la hora actual: un
+# lote que cruza el cambio de mes no queda en el mes equivocado.
+ACUMULAR_LOTE = registrar("resumen.acumular_lote", f"""
+    DECLARE{_VARIABLES}
+    BEGIN
+        v_rut := :rut_usuario;
+        v_tipo := :id_tipo_pago;
+        v_mes := TRUNC(:mes, 'MM');
+        v_cantidad := :cantidad;
+        v_total := :total;
+        {_ACUMULAR}
+    END;
+""")
+
+CONSULTAR_RESUMEN = registrar("pago.resumen", """
+    SELECT id_tipo_pago, mes, cantidad, total
+    FROM pago_resumen
+    WHERE rut_usuario = :rut
+    ORDER BY mes DESC, id_tipo_pago
+""", verificar_plan=True)
+
+
+def agregar_lote(pagos) -> list:
+    # pagos: (pago, fecha_pago) con rut_usuario, id_tipo_pago y monto -> binds de ACUMULAR_LOTE
+    grupos = {}
+    for pago, fecha in pagos:
+        mes = fecha.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        grupo = grupos.setdefault((pago.rut_usuario, pago.id_tipo_pago, mes), [0, 0])
+        grupo[0] += 1
+        grupo[1] += pago.monto
+    return [
+        {"rut_usuario": rut, "id_tipo_pago": tipo, "mes": mes, "cantidad": cantidad, "total": total}
+        for (rut, tipo, mes), (cantidad, total) in grupos.items()
+    ]
+
+
+# -------------------- RECONSTRUCCIÓN --------------------
+_RECONSTRUIR = """
+    INSERT INTO pago_resumen (rut_usuario, id_tipo_pago, mes, cantidad, total)
+    SELECT rut_usuario, id_tipo_pago, TRUNC(fecha_pago, 'MM'), COUNT(*), SUM(monto)
+    FROM pago
+    {filtro}
+    GROUP BY rut_usuario, id_tipo_pago, TRUNC(fecha_pago, 'MM')
+"""
+# Mientras se reconstruye nadie puede insertar ni borrar pagos (SHARE
+# bloquea el DML y se libera con el commit): un pago que entrara entre el
+# DELETE y el INSERT ... SELECT quedaría contado dos veces o ninguna
+_SQL_BLOQUEAR = registrar("resumen.bloquear_pagos", "LOCK TABLE pago IN SHARE MODE")
+# (borrar, insertar) para todo el resumen o para un usuario
+_SQL_RECONSTRUIR = {
+    False: (registrar("resumen.borrar", "DELETE FROM pago_resumen"),
+            registrar("resumen.reconstruir", _RECONSTRUIR.format(filtro=""))),
+    True: (registrar("resumen.borrar_usuario", "DELETE FROM pago_resumen WHERE rut_usuario = :rut"),
+           registrar("resumen.reconstruir_usuario", _RECONSTRUIR.format(filtro="WHERE rut_usuario = :rut"))),
+}
+
+
+async def reconstruir(rut: str = None) -> int:
+    # Recalcula el resumen desde pago (todo, o solo un usuario) en una transacción
+    borrar, insertar = _SQL_RECONSTRUIR[bool(rut)]
+    binds = {"rut": rut} if rut else {}
+    async with conexion() as cone:
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_BLOQUEAR)
+            await cursor.execute(borrar, binds)
+            await cursor.execute(insertar, binds)
+            filas = cursor.rowcount
+        await cone.commit()
+    return filas
+
+
+async def _main(rut):
+    crear_pool()
+    try:
+        filas = await reconstruir(rut)
+    finally:
+        await cerrar_pool()
+    print(f"Resumen reconstruido: {filas} filas")
+
+
+if __name__ == "__main__":
+    # python -m app.resumen_pagos reconstruir [rut]
+    if len(sys.argv) < 2 or sys.argv[1] != "reconstruir":
+        sys.exit("Uso: python -m app.resumen_pagos reconstruir [rut]")
+    asyncio.run(_main(sys.argv[2] if len(sys.argv) > 2 else None))
@@ -1,6 +1,17 @@
-from fastapi import APIRouter, HTTPException
-from typing import Optional
-from app.database import get_conexion
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from typing import List, Optional
+import os
+import oracledb
+from pydantic import BaseModel
+from app.condicional import CACHE_PRIVADO, aplicar_validadores, calcular_etag, no_modificado
+from app.consultas import registrar
+from app.database import ORA_PADRE_NO_EXISTE, conexion, error_integridad, get_conexion, get_conexion_lectura
+from app.escritura_diferida import registrar_escritura
+from app.exportacion import exportar, parametro_formato
+from app.paginacion import (Pagina, decodificar_cursor, pagina, parametro_cursor, parametro_limite, parsear_entero,
+                            preparar_cursor)
+from app.serializacion import como_registros, respuesta_json
+from app.seguridad import ROLES_PERSONAL, requiere_rol, usuario_actual, verificar_acceso
 
 router = APIRouter(
     prefix="/despacho",
@@ -8,59 +19,125 @@ router = APIRouter(
 )
 
 # -------------------- GET TODOS LOS DESPACHOS --------------------
-@router.get("/")
-def obtener_despachos():
+class DespachoItem(BaseModel):
+    id: int
+    rut_usuario: Optional[str] = None
+    tipo: str
+    direccion: Optional[str] = None
+    sucursal: Optional[str] = None
+
+
+_SQL_LISTA = """
+    SELECT id, rut_usuario, tipo, direccion, sucursal
+    FROM tipo_despacho
+    {where}
+    ORDER BY id
+    FETCH FIRST :limite ROWS ONLY
+"""
+_SQL_PRIMERA_PAGINA = registrar("despacho.lista", _SQL_LISTA.format(where=""), caliente=True)
+_SQL_PAGINA_SIGUIENTE = registrar("despacho.lista_desde", _SQL_LISTA.format(where="WHERE id > :cursor_id"),
+                                  caliente=True)
+
+
+@router.get("/", response_model=Pagina[DespachoItem])
+async def obtener_despachos(
+    limite: int = parametro_limite(),
+    cursor: Optional[str] = parametro_cursor(),
+    cone=Depends(get_conexion_lectura),
+    sesion=Depends(requiere_rol(*ROLES_PERSONAL))
+):
+    binds = {"limite": limite + 1}
+    sql = _SQL_PRIMERA_PAGINA
+    if cursor:
+        binds["cursor_id"], = decodificar_cursor(cursor, parsear_entero)
+        sql = _SQL_PAGINA_SIGUIENTE
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("SELECT id, rut_usuario, tipo, direccion, sucursal FROM tipo_despacho")
-        despachos = []
-        for id_, rut, tipo, direccion, sucursal in cursor:
-            despachos.append({
-                "id": id_,
-                "rut_usuario": rut,
-                "tipo": tipo,
-                "direccion": direccion,
-                "sucursal": sucursal
-            })
-        cursor.close()
-        cone.close()
-        return despachos
+        with cone.cursor() as cur:
+            preparar_cursor(cur, limite)
+            await cur.execute(sql, binds)
+            como_registros(cur)
+            filas = await cur.fetchall()
+
+        filas, siguiente = pagina(filas, limite, lambda fila: (fila["id"],))
+        return respuesta_json({"items": filas, "siguiente": siguiente})
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
+# -------------------- EXPORTAR DESPACHOS --------------------
+_SQL_EXPORTAR = registrar("despacho.exportar", "SELECT id, rut_usuario, tipo, direccion, sucursal FROM tipo_despacho ORDER BY id")
+
+@router.get("/exportar")
+async def exportar_despachos(formato: str = parametro_formato(), sesion=Depends(requiere_rol(*ROLES_PERSONAL))):
+    return await exportar(
+        _SQL_EXPORTAR,
+        {}, ["id", "rut_usuario", "tipo", "direccion", "sucursal"], formato, "despachos"
+    )
+
 # -------------------- GET POR RUT --------------------
-@router.get("/usuario/{rut}")
-def obtener_despachos_por_usuario(rut: str):
+# Ambas usan ix_despacho_rut (ver app/migraciones.py)
+_SQL_VERSION_USUARIO = registrar("despacho.version_usuario", """
+    SELECT COUNT(*), MAX(id), MAX(ORA_ROWSCN)
+    FROM tipo_despacho
+    WHERE rut_usuario = :rut
+""", verificar_plan=True, caliente=True)
+
+_SQL_POR_USUARIO = registrar("despacho.por_usuario", """
+    SELECT id, tipo, direccion, sucursal
+    FROM tipo_despacho
+    WHERE rut_usuario = :rut
+""", verificar_plan=True, caliente=True)
+
+@router.get("/usuario/{rut}", response_model=List[DespachoItem])
+async def obtener_despachos_por_usuario(rut: str, request: Request, response: Response,
+                                        cone=Depends(get_conexion_lectura),
+                                        sesion=Depends(usuario_actual)):
+    verificar_acceso(sesion, rut)
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("""
-            SELECT id, tipo, direccion, sucursal
-            FROM tipo_despacho
-            WHERE rut_usuario = :rut
-        """, {"rut": rut})
-        resultados = cursor.fetchall()
-        cursor.close()
-        cone.close()
+        with cone.cursor() as cursor:
+            # Sonda de versión sobre los despachos del usuario
+            await cursor.execute(_SQL_VERSION_USUARIO, {"rut": rut})
+            cantidad, ultimo_id, scn = await cursor.fetchone()
+            if not cantidad:
+                raise HTTPException(status_code=404, detail="No se encontraron despachos para este usuario")
+            etag = calcular_etag(request.url.path, cantidad, ultimo_id, scn)
+            no_cambio = no_modificado(request, etag, CACHE_PRIVADO)
+            if no_cambio:
+                return no_cambio
+
+            await cursor.execute(_SQL_POR_USUARIO, {"rut": rut})
+            como_registros(cursor)
+            resultados = await cursor.fetchall()
 
         if not resultados:
             raise HTTPException(status_code=404, detail="No se encontraron despachos para este usuario")
 
-        return [
-            {
-                "id": id_,
-                "tipo": tipo,
-                "direccion": direccion,
-                "sucursal": sucursal
-            } for id_, tipo, direccion, sucursal in resultados
-        ]
+        aplicar_validadores(response, etag, CACHE_PRIVADO)
+        return respuesta_json(resultados, response)
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
 # -------------------- POST NUEVO DESPACHO --------------------
+_SQL_INSERTAR = registrar("despacho.insertar", """
+    INSERT INTO tipo_despacho (rut_usuario, tipo, direccion, sucursal)
+    VALUES (:rut, :tipo, :direccion, :sucursal)
+""", caliente=True)
+
+_ERRORES_DESPACHO = [(ORA_PADRE_NO_EXISTE, None, 404, "Usuario no encontrado")]
+
+# Modo diferido (opcional): el despacho se valida, se encola y se responde
+# 202; la fila se inserta en el siguiente commit agrupado (ver
+# app/escritura_diferida.py) y su estado se consulta en /despacho/seguimiento/{id}
+DESPACHO_DIFERIDO = os.getenv("DESPACHO_DIFERIDO", "0") == "1"
+_diferida = registrar_escritura("despacho", _SQL_INSERTAR, _ERRORES_DESPACHO) if DESPACHO_DIFERIDO else None
+
 @router.post("/")
-def crear_despacho(rut_usuario: str, tipo: str, direccion: Optional[str] = None, sucursal: Optional[str] = None):
+async def crear_despacho(rut_usuario: str, tipo: str, direccion: Optional[str] = None, sucursal: Optional[str] = None,
+                         sesion=Depends(usuario_actual)):
+    verificar_acceso(sesion, rut_usuario)
     if tipo not in ['entrega domicilio', 'retiro en tienda']:
         raise HTTPException(status_code=400, detail="Tipo de despacho inválido")
 
@@ -70,37 +147,60 @@ def crear_despacho(rut_usuario: str, tipo: str, direccion: Optional[str] = None,
     if tipo == 'retiro en tienda' and (not sucursal or direccion):
         raise HTTPException(status_code=400, detail="Debe proporcionar solo una sucursal para retiro en tienda")
 
+    binds = {
+        "rut": rut_usuario,
+        "tipo": tipo,
+        "direccion": direccion,
+        "sucursal": sucursal
+    }
+    if _diferida is not None:
+        # Sin conexión del pool: un usuario inexistente se informa en el seguimiento
+        seguimiento = _diferida.encolar(binds, dueno=rut_usuario)
+        respuesta = respuesta_json({"mensaje": "Despacho recibido", "seguimiento": seguimiento}, status_code=202)
+        respuesta.headers["Location"] = f"{router.prefix}/seguimiento/{seguimiento}"
+        return respuesta
+
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("""
-            INSERT INTO tipo_despacho (rut_usuario, tipo, direccion, sucursal)
-            VALUES (:rut, :tipo, :direccion, :sucursal)
-        """, {
-            "rut": rut_usuario,
-            "tipo": tipo,
-            "direccion": direccion,
-            "sucursal": sucursal
-        })
-        cone.commit()
-        cursor.close()
-        cone.close()
+        # Un solo viaje: si el usuario no existe, la FK rechaza el despacho
+        async with conexion() as cone:
+            cone.autocommit = True
+            with cone.cursor() as cursor:
+                await cursor.execute(_SQL_INSERTAR, binds)
         return {"mensaje": "Despacho registrado correctamente"}
+    except HTTPException:
+        raise
+    except oracledb.IntegrityError as ex:
+        raise error_integridad(ex, _ERRORES_DESPACHO)
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
+
+# -------------------- SEGUIMIENTO DE DESPACHO DIFERIDO --------------------
+@router.get("/seguimiento/{seguimiento}")
+async def obtener_seguimiento(seguimiento: str, sesion=Depends(usuario_actual)):
+    # estado: "pendiente" (en cola), "guardado" (confirmado con commit) o "error"
+    estado = _diferida.estado(seguimiento) if _diferida is not None else None
+    if estado is None:
+        # Solo se recuerdan los últimos DIFERIDA_SEGUIMIENTO_MAX estados, en
+        # memoria del worker: un id muy antiguo o anterior a un reinicio no aparece
+        raise HTTPException(status_code=404, detail="Seguimiento no encontrado o expirado")
+    verificar_acceso(sesion, estado["dueno"])
+    return {"seguimiento": seguimiento, "estado": estado["estado"], "detalle": estado["detalle"]}
+
 # -------------------- DELETE DESPACHO POR ID --------------------
+_SQL_ELIMINAR = registrar("despacho.eliminar", "DELETE FROM tipo_despacho WHERE id = :id")
+
 @router.delete("/{id_despacho}")
-def eliminar_despacho(id_despacho: int):
+async def eliminar_despacho(id_despacho: int, cone=Depends(get_conexion),
+                            sesion=Depends(requiere_rol(*ROLES_PERSONAL))):
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("DELETE FROM tipo_despacho WHERE id = :id", {"id": id_despacho})
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Despacho no encontrado")
-        cone.commit()
-        cursor.close()
-        cone.close()
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_ELIMINAR, {"id": id_despacho})
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Despacho no encontrado")
         return {"mensaje": "Despacho eliminado con éxito"}
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
@@ -0,0 +1,110 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from app import (
+    admision, analitica, arranque, cache_perfiles, cache_referencia, coalescencia, compresion, consultas,
+    escritura_diferida
+)
+from app.database import estadisticas_pool
+from app.hashing import estadisticas_hashing
+from app.metricas import exportar_prometheus
+from app.serializacion import RespuestaJSON
+from app.seguridad import requiere_rol
+
+router = APIRouter(
+    prefix="/monitoreo",
+    tags=["Monitoreo"]
+)
+
+# /metrics va en la raíz, que es donde Prometheus lo busca por defecto
+router_metricas = APIRouter(tags=["Monitoreo"])
+
+# -------------------- READINESS --------------------
+@router.get("/listo")
+async def listo():
+    # El balanceador solo manda tráfico cuando el calentamiento terminó
+    estado = arranque.estado_arranque()
+    return RespuestaJSON(estado, status_code=200 if estado["listo"] else 503)
+
+# -------------------- ESTADO DEL POOL DE CONEXIONES --------------------
+@router.get("/pool")
+async def estado_pool():
+    return estadisticas_pool()
+
+# -------------------- ESTADO DEL EXECUTOR DE HASHING --------------------
+@router.get("/hashing")
+async def estado_hashing():
+    return estadisticas_hashing()
+
+# -------------------- CACHÉ DE DATOS DE REFERENCIA --------------------
+@router.get("/cache-referencia")
+async def estado_cache_referencia():
+    return cache_referencia.estadisticas_referencia()
+
+@router.delete("/cache-referencia")
+async def invalidar_cache_referencia(tabla: Optional[str] = None, sesion=Depends(requiere_rol("administrador"))):
+    cache_referencia.invalidar(tabla)
+    return {"mensaje": "Caché de referencia invalidado"}
+
+# -------------------- CACHÉ DE PERFILES --------------------
+@router.get("/cache-perfiles")
+async def estado_cache_perfiles():
+    return cache_perfiles.estadisticas_perfiles()
+
+# -------------------- CONTROL DE ADMISIÓN --------------------
+@router.get("/admision")
+async def estado_admision():
+    return admision.estadisticas_admision()
+
+# -------------------- LECTURAS COMPARTIDAS --------------------
+@router.get("/coalescencia")
+async def estado_coalescencia():
+    return coalescencia.estadisticas_coalescencia()
+
+# -------------------- ESCRITURA DIFERIDA --------------------
+@router.get("/escritura-diferida")
+async def estado_escritura_diferida():
+    return escritura_diferida.estadisticas_diferidas()
+
+# -------------------- ANALÍTICA DE PAGOS --------------------
+@router.get("/analitica")
+async def estado_analitica():
+    return analitica.estadisticas_analitica()
+
+# -------------------- COMPRESIÓN --------------------
+@router.get("/compresion")
+async def estado_compresion():
+    return compresion.estadisticas_compresion()
+
+# -------------------- CONSULTAS REGISTRADAS --------------------
+@router.get("/consultas")
+async def estado_consultas():
+    return consultas.estadisticas_consultas()
+
+# -------------------- MÉTRICAS PROMETHEUS --------------------
+@router_metricas.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    pool = estadisticas_pool()
+    hashing = estadisticas_hashing()
+    compartidas = coalescencia.totales_coalescencia()
+    clases = admision.estadisticas_admision()["clases"]
+    comprimidas = compresion.estadisticas_compresion()
+    return exportar_prometheus({
+        "api_pool_conexiones_abiertas": pool["abiertas"],
+        "api_pool_conexiones_ocupadas": pool["ocupadas"],
+        "api_pool_espera_max_segundos": pool["espera_max_ms"] / 1000,
+        "api_hash_pendientes": hashing["pendientes"],
+        "api_hash_rechazos": hashing["rechazos"],
+        "api_lecturas_ejecutadas": compartidas["ejecutadas"],
+        "api_lecturas_agrupadas": compartidas["agrupadas"],
+        "api_lecturas_micro_cache": compartidas["micro_cache"],
+        "api_compresion_bytes_originales": comprimidas["bytes_originales"],
+        "api_compresion_bytes_enviados": comprimidas["bytes_enviados"],
+        **{f"api_admision_{nombre}_{campo}": datos[campo]
+           for nombre, datos in clases.items()
+           for campo in ("en_curso", "en_cola", "rechazos_cola", "rechazos_espera")},
+        **{f"api_diferida_{nombre}_{campo}": datos[campo]
+           for nombre, datos in escritura_diferida.estadisticas_diferidas().items()
+           for campo in ("en_cola", "guardadas", "rechazadas", "rechazos_cola", "fallos_volcado")},
+    })
@@ -1,128 +1,461 @@
-from fastapi import APIRouter, HTTPException
-from typing import Optional
-from app.database import get_conexion
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Optional
+from app.cache_referencia import comunas, tipos_pago
+from app.campos import Proyeccion, parametro_campos
+from app.condicional import CACHE_PRIVADO, aplicar_validadores, calcular_etag, no_modificado
+from app.consultas import registrar
+from app.database import (
+    ORA_PADRE_NO_EXISTE, conexion, detalle_fila, error_integridad, get_conexion, get_conexion_lectura,
+    lee_del_primario
+)
+from app.exportacion import exportar, parametro_formato
+from app.lotes import (buscar_existentes, binds_in, leer_lote, registrar_in, resumen_resultados, tamano_in,
+                       validar_filas)
+from app import analitica, coalescencia, resumen_pagos
+from app.paginacion import (Pagina, decodificar_cursor, pagina, parametro_cursor, parametro_limite, parsear_entero,
+                            parsear_fecha, preparar_cursor)
+from app.serializacion import como_registros, fecha_sql, respuesta_json
+from app.seguridad import ROLES_PERSONAL, requiere_rol, usuario_actual, verificar_acceso
 from datetime import datetime
+import oracledb
+from pydantic import BaseModel
 
 router = APIRouter(
     prefix="/pagos",
     tags=["Pagos"]
 )
 
+# Errores de integridad al insertar pagos (ver error_integridad)
+_ERRORES_PAGO = [
+    (ORA_PADRE_NO_EXISTE, "TIPO", 400, "ID de tipo de pago inválido"),
+    (ORA_PADRE_NO_EXISTE, None, 404, "Usuario no encontrado"),
+]
+
 # -------------------- POST NUEVO PAGO --------------------
 @router.post("/")
-def registrar_pago(rut_usuario: str, id_tipo_pago: int, monto: float):
+async def registrar_pago(rut_usuario: str, id_tipo_pago: int, monto: float, cone=Depends(get_conexion),
+                        sesion=Depends(usuario_actual)):
+    verificar_acceso(sesion, rut_usuario)
     try:
         if monto <= 0:
             raise HTTPException(status_code=400, detail="El monto debe ser mayor a cero")
-        if id_tipo_pago not in [1, 2, 3]:
+        # Verificar el tipo de pago contra el caché de referencia
+        if id_tipo_pago not in await tipos_pago.obtener():
             raise HTTPException(status_code=400, detail="ID de tipo de pago inválido")
 
-        cone = get_conexion()
-        cursor = cone.cursor()
-
-        # Verificar si el rut del usuario existe
-        cursor.execute("SELECT 1 FROM usuario WHERE rut = :rut", {"rut": rut_usuario})
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-        # Verificar si el tipo de pago existe
-        cursor.execute("SELECT 1 FROM tipo_pago WHERE id_tipo_pago = :id", {"id": id_tipo_pago})
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Tipo de pago no válido")
-
-        # Insertar el pago
-        cursor.execute("""
-            INSERT INTO pago (rut_usuario, id_tipo_pago, monto)
-            VALUES (:rut_usuario, :id_tipo_pago, :monto)
-        """, {
-            "rut_usuario": rut_usuario,
-            "id_tipo_pago": id_tipo_pago,
-            "monto": monto
-        })
-        cone.commit()
-        cursor.close()
-        cone.close()
-        return {"mensaje": "Pago registrado con éxito"}
+        # Insertar el pago y actualizar el resumen en un solo viaje: si el
+        # usuario no existe, la FK lo rechaza
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            id_pago = cursor.var(int)
+            await cursor.execute(resumen_pagos.REGISTRAR_PAGO, {
+                "rut_usuario": rut_usuario,
+                "id_tipo_pago": id_tipo_pago,
+                "monto": monto,
+                "id_pago": id_pago
+            })
+        coalescencia.olvidar("pagos.lista")
+        return {"mensaje": "Pago registrado con éxito", "id_pago": id_pago.getvalue()}
+    except HTTPException:
+        raise
+    except oracledb.IntegrityError as ex:
+        raise error_integridad(ex, _ERRORES_PAGO)
+    except Exception as ex:
+        raise HTTPException(status_code=500, detail=str(ex))
+
+
+# -------------------- POST LOTE DE PAGOS --------------------
+class PagoLote(BaseModel):
+    rut_usuario: str
+    id_tipo_pago: int
+    monto: float
+
+
+_SQL_RUTS_EXISTENTES = registrar_in("pago.ruts_existentes", "SELECT rut FROM usuario WHERE rut IN {v}")
+
+# Devuelve la fecha_pago de cada fila para acumular el resumen en su mes
+_SQL_INSERTAR_LOTE = registrar("pago.insertar_lote", """
+    INSERT INTO pago (rut_usuario, id_tipo_pago, monto)
+    VALUES (:rut_usuario, :id_tipo_pago, :monto)
+    RETURNING fecha_pago INTO :fecha_pago
+""")
+
+
+@router.post("/batch")
+async def registrar_pagos_lote(request: Request, cone=Depends(get_conexion),
+                               sesion=Depends(requiere_rol(*ROLES_PERSONAL))):
+    # Recibe un arreglo JSON o NDJSON de pagos. Los usuarios se validan con
+    # una consulta por conjunto y los pagos se insertan con array DML en una
+    # sola transacción; cada fila informa su propio resultado.
+    filas = await leer_lote(request)
+    validas, errores = validar_filas(filas, PagoLote)
+    try:
+        tipos = await tipos_pago.obtener()
+        with cone.cursor() as cursor:
+            existentes = await buscar_existentes(
+                cursor, _SQL_RUTS_EXISTENTES, [p.rut_usuario for _, p in validas]
+            )
+            insertar = []
+            for indice, pago in validas:
+                if pago.monto <= 0:
+                    errores[indice] = "El monto debe ser mayor a cero"
+                elif pago.id_tipo_pago not in tipos:
+                    errores[indice] = "ID de tipo de pago inválido"
+                elif pago.rut_usuario not in existentes:
+                    errores[indice] = "Usuario no encontrado"
+                else:
+                    insertar.append((indice, pago))
+
+            if insertar:
+                fechas = cursor.var(oracledb.DB_TYPE_DATE, arraysize=len(insertar))
+                cursor.setinputsizes(fecha_pago=fechas)
+                await cursor.executemany(_SQL_INSERTAR_LOTE, [pago.model_dump() for _, pago in insertar],
+                                         batcherrors=True)
+                # Las filas que fallan en la base no abortan el lote; el detalle
+                # se traduce con las mismas reglas que POST /pagos/
+                for error in cursor.getbatcherrors():
+                    errores[insertar[error.offset][0]] = detalle_fila(error, _ERRORES_PAGO)
+                # Resumen de los pagos que sí se insertaron, en la misma transacción
+                acumulados = resumen_pagos.agregar_lote(
+                    (pago, fechas.getvalue(posicion)[0])
+                    for posicion, (indice, pago) in enumerate(insertar) if indice not in errores
+                )
+                if acumulados:
+                    await cursor.executemany(resumen_pagos.ACUMULAR_LOTE, acumulados)
+        await cone.commit()
+        coalescencia.olvidar("pagos.lista")
+        return resumen_resultados(len(filas), errores)
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
+# -------------------- FILTROS DE PAGOS --------------------
+# Un solo bloque de filtros para cualquier combinación: un filtro sin valor
+# se liga como NULL y su condición queda siempre verdadera, así que el texto
+# de la sentencia no cambia entre peticiones.
+_FILTROS_PAGOS = """
+    (:desde IS NULL OR p.fecha_pago >= :desde)
+    AND (:hasta IS NULL OR p.fecha_pago < :hasta)
+    AND (:id_tipo_pago IS NULL OR p.id_tipo_pago = :id_tipo_pago)
+    AND (:monto_min IS NULL OR p.monto >= :monto_min)
+    AND (:monto_max IS NULL OR p.monto <= :monto_max)
+"""
+
+
+def _filtros_pagos(desde, hasta, id_tipo_pago, monto_min, monto_max) -> dict:
+    return {"desde": desde, "hasta": hasta, "id_tipo_pago": id_tipo_pago,
+            "monto_min": monto_min, "monto_max": monto_max}
+
 
 # -------------------- GET TODOS LOS PAGOS --------------------
-@router.get("/")
-def obtener_pagos():
+class PagoItem(BaseModel):
+    # Con fields= solo vienen los campos pedidos, además de id_pago y fecha_pago
+    id_pago: int
+    rut_usuario: Optional[str] = None
+    nombre: Optional[str] = None
+    apellido: Optional[str] = None
+    id_tipo_pago: Optional[int] = None
+    tipo_pago: Optional[str] = None
+    monto: Optional[float] = None
+    fecha_pago: str
+
+
+# Campos que admite fields= (ver app/campos.py): los JOIN con usuario y
+# tipo_pago solo se hacen si se pide alguno de sus campos. Sin perder filas:
+# las FK garantizan que el JOIN siempre encuentra su fila.
+_LISTA = Proyeccion(
+    "pago.lista",
+    {
+        "id_pago": ("p.id_pago", None),
+        "rut_usuario": ("p.rut_usuario", None),
+        "nombre": ("u.nombre", "usuario"),
+        "apellido": ("u.apellido", "usuario"),
+        "id_tipo_pago": ("p.id_tipo_pago", None),
+        "tipo_pago": ("tp.descripcion AS tipo_pago", "tipo_pago"),
+        "monto": ("p.monto", None),
+        "fecha_pago": (fecha_sql("p.fecha_pago"), None),
+    },
+    {
+        "usuario": "JOIN usuario u ON p.rut_usuario = u.rut",
+        "tipo_pago": "JOIN tipo_pago tp ON p.id_tipo_pago = tp.id_tipo_pago",
+    },
+    f"""
+    SELECT {{columnas}}
+    FROM pago p
+    {{joins}}
+    WHERE {_FILTROS_PAGOS}
+    {{variante}}
+    ORDER BY p.fecha_pago DESC, p.id_pago DESC
+    FETCH FIRST :limite ROWS ONLY
+""",
+    {
+        "": "",
+        "_desde": "AND (p.fecha_pago < :cursor_fecha OR (p.fecha_pago = :cursor_fecha AND p.id_pago < :cursor_id))",
+    },
+    obligatorios=("id_pago", "fecha_pago")
+)
+
+
+@router.get("/", response_model=Pagina[PagoItem])
+async def obtener_pagos(
+    limite: int = parametro_limite(),
+    cursor: Optional[str] = parametro_cursor(),
+    desde: Optional[datetime] = Query(None, description="Fecha de pago mínima (inclusive)"),
+    hasta: Optional[datetime] = Query(None, description="Fecha de pago máxima (exclusive)"),
+    id_tipo_pago: Optional[int] = None,
+    monto_min: Optional[float] = None,
+    monto_max: Optional[float] = None,
+    fields: Optional[str] = parametro_campos(_LISTA),
+    sesion=Depends(requiere_rol(*ROLES_PERSONAL))
+):
+    # Paginación por keyset sobre (fecha_pago, id_pago): cada página usa el
+    # índice en vez de recorrer y ordenar todo el historial de pagos. Las
+    # peticiones simultáneas con los mismos parámetros comparten la consulta
+    # (ver app/coalescencia.py), así que la conexión se toma solo al leer.
+    campos = _LISTA.campos(fields)
+    binds = _filtros_pagos(desde, hasta, id_tipo_pago, monto_min, monto_max)
+    binds["limite"] = limite + 1
+    variante = ""
+    if cursor:
+        binds["cursor_fecha"], binds["cursor_id"] = decodificar_cursor(cursor, parsear_fecha, parsear_entero)
+        variante = "_desde"
+    sql = _LISTA.sql(campos, variante)
+
+    async def leer():
+        async with conexion(lectura=True) as cone:
+            with cone.cursor() as cur:
+                preparar_cursor(cur, limite)
+                await cur.execute(sql, binds)
+                como_registros(cur)
+                filas = await cur.fetchall()
+        # fecha_pago es DATE (precisión de segundos): el texto sirve como clave del cursor
+        filas, siguiente = pagina(filas, limite, lambda fila: (fila["fecha_pago"], fila["id_pago"]))
+        return {"items": filas, "siguiente": siguiente}
+
+    try:
+        # Los parámetros ya parseados (fechas, números) forman la clave; una
+        # sesión que acaba de escribir lee del primario y no se suma a
+        # lecturas hechas en la réplica
+        clave = (lee_del_primario(), campos, *sorted(binds.items()))
+        resultado = await coalescencia.compartir("pagos.lista", clave, leer)
+        return respuesta_json(resultado)
+    except HTTPException:
+        raise
+    except Exception as ex:
+        raise HTTPException(status_code=500, detail=str(ex))
+
+
+# -------------------- EXPORTAR PAGOS --------------------
+_SQL_EXPORTAR = registrar("pago.exportar", f"""
+    SELECT p.id_pago, p.rut_usuario, u.nombre, u.apellido, p.id_tipo_pago, tp.descripcion, p.monto, p.fecha_pago
+    FROM pago p
+    JOIN usuario u ON p.rut_usuario = u.rut
+    JOIN tipo_pago tp ON p.id_tipo_pago = tp.id_tipo_pago
+    WHERE {_FILTROS_PAGOS}
+    ORDER BY p.fecha_pago DESC, p.id_pago DESC
+""")
+
+
+@router.get("/exportar")
+async def exportar_pagos(
+    formato: str = parametro_formato(),
+    desde: Optional[datetime] = Query(None, description="Fecha de pago mínima (inclusive)"),
+    hasta: Optional[datetime] = Query(None, description="Fecha de pago máxima (exclusive)"),
+    id_tipo_pago: Optional[int] = None,
+    monto_min: Optional[float] = None,
+    monto_max: Optional[float] = None,
+    sesion=Depends(requiere_rol(*ROLES_PERSONAL))
+):
+    binds = _filtros_pagos(desde, hasta, id_tipo_pago, monto_min, monto_max)
+    return await exportar(
+        _SQL_EXPORTAR, binds,
+        ["id_pago", "rut_usuario", "nombre", "apellido", "id_tipo_pago", "tipo_pago", "monto", "fecha_pago"],
+        formato, "pagos"
+    )
+
+
+# -------------------- ANALÍTICA DE PAGOS --------------------
+# Una fila por pago, sin nombres ni descripciones: los totales se calculan
+# sobre columnas (ver app/analitica.py) y los nombres se agregan al final
+_SQL_ANALITICA = registrar("pago.analitica", f"""
+    SELECT p.rut_usuario, p.id_tipo_pago, u.id_comuna, p.monto, p.fecha_pago
+    FROM pago p
+    JOIN usuario u ON p.rut_usuario = u.rut
+    WHERE {_FILTROS_PAGOS}
+""")
+
+_SQL_NOMBRES_CLIENTES = registrar_in("pago.analitica_clientes", "SELECT rut, nombre, apellido FROM usuario WHERE rut IN {v}")
+
+
+@router.get("/analytics")
+async def analitica_pagos(
+    intervalo: str = Query("dia", description="Agrupación temporal: dia, semana o mes"),
+    top: int = Query(10, ge=0, le=100, description="Cantidad de clientes con mayor monto"),
+    desde: Optional[datetime] = Query(None, description="Fecha de pago mínima (inclusive)"),
+    hasta: Optional[datetime] = Query(None, description="Fecha de pago máxima (exclusive)"),
+    id_tipo_pago: Optional[int] = None,
+    monto_min: Optional[float] = None,
+    monto_max: Optional[float] = None,
+    sesion=Depends(requiere_rol(*ROLES_PERSONAL))
+):
+    if not analitica.disponible():
+        raise HTTPException(status_code=501, detail="La analítica requiere el paquete pyarrow")
+    if intervalo not in analitica.INTERVALOS:
+        raise HTTPException(status_code=400, detail=f"Intervalo inválido. Use: {', '.join(analitica.INTERVALOS)}")
+    binds = _filtros_pagos(desde, hasta, id_tipo_pago, monto_min, monto_max)
+    clave = (intervalo, top, *sorted(binds.items()))
+    resultado = analitica.guardado(clave)
+    if resultado is not None:
+        return respuesta_json(resultado)
+
+    async def cargar():
+        async with conexion(lectura=True) as cone:
+            resultado = await analitica.calcular(cone, _SQL_ANALITICA, binds, intervalo, top)
+            ruts = [cliente["rut_usuario"] for cliente in resultado["top_clientes"]]
+            nombres = {}
+            if ruts:
+                with cone.cursor() as cursor:
+                    await cursor.execute(_SQL_NOMBRES_CLIENTES[tamano_in(len(ruts))], binds_in(ruts))
+                    nombres = {rut: (nombre, apellido) for rut, nombre, apellido in await cursor.fetchall()}
+        tipos = await tipos_pago.obtener()
+        nombres_comunas = await comunas.obtener()
+        for fila in resultado["por_tipo_pago"]:
+            fila["tipo_pago"] = tipos.get(fila["id_tipo_pago"])
+        for fila in resultado["por_comuna"]:
+            fila["comuna"] = nombres_comunas.get(fila["id_comuna"])
+        for cliente in resultado["top_clientes"]:
+            cliente["nombre"], cliente["apellido"] = nombres.get(cliente["rut_usuario"], (None, None))
+        resultado["intervalo"] = intervalo
+        analitica.guardar(clave, resultado)
+        return resultado
+
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("""
-            SELECT DISTINCT p.id_pago, p.rut_usuario, u.nombre, u.apellido, p.id_tipo_pago, tp.descripcion, p.monto, p.fecha_pago
-            FROM pago p
-            JOIN usuario u ON p.rut_usuario = u.rut
-            JOIN tipo_pago tp ON p.id_tipo_pago = tp.id_tipo_pago
-            ORDER BY p.fecha_pago DESC
-        """)
-        pagos = []
-        for fila in cursor:
-            pagos.append({
-                "rut_usuario": fila[1],
-                "nombre": fila[2],
-                "apellido": fila[3],
-                "id_tipo_pago": fila[4],
-                "tipo_pago": fila[5],
-                "monto": fila[6],
-                "fecha_pago": fila[7].strftime("%Y-%m-%d %H:%M:%S")
+        # Un tablero recién abierto por varias personas calcula una sola vez
+        resultado = await coalescencia.compartir("pagos.analitica", clave, cargar)
+        return respuesta_json(resultado)
+    except HTTPException:
+        raise
+    except Exception as ex:
+        raise HTTPException(status_code=500, detail=str(ex))
+
+
+# -------------------- GET RESUMEN DE PAGOS POR RUT --------------------
+@router.get("/{rut}/resumen")
+async def obtener_resumen_pagos(rut: str, request: Request, response: Response, cone=Depends(get_conexion_lectura),
+                                sesion=Depends(usuario_actual)):
+    # Lee pago_resumen (una fila por tipo de pago y mes), no el historial completo
+    verificar_acceso(sesion, rut)
+    try:
+        with cone.cursor() as cursor:
+            await cursor.execute(resumen_pagos.CONSULTAR_RESUMEN, {"rut": rut})
+            filas = await cursor.fetchall()
+
+        if not filas:
+            raise HTTPException(status_code=404, detail="No se encontraron pagos para este usuario")
+
+        etag = calcular_etag(request.url.path, filas)
+        no_cambio = no_modificado(request, etag, CACHE_PRIVADO)
+        if no_cambio:
+            return no_cambio
+
+        tipos = await tipos_pago.obtener()
+        por_tipo, por_mes = {}, {}
+        for id_tipo_pago, mes, cantidad, total in filas:
+            tipo = por_tipo.setdefault(id_tipo_pago, {
+                "id_tipo_pago": id_tipo_pago, "tipo_pago": tipos.get(id_tipo_pago), "cantidad": 0, "total": 0
             })
-        cursor.close()
-        cone.close()
-        return pagos
+            tipo["cantidad"] += cantidad
+            tipo["total"] += total
+            clave_mes = mes.strftime("%Y-%m")
+            periodo = por_mes.setdefault(clave_mes, {"mes": clave_mes, "cantidad": 0, "total": 0})
+            periodo["cantidad"] += cantidad
+            periodo["total"] += total
+
+        aplicar_validadores(response, etag, CACHE_PRIVADO)
+        return {
+            "rut": rut,
+            "cantidad": sum(t["cantidad"] for t in por_tipo.values()),
+            "total": sum(t["total"] for t in por_tipo.values()),
+            "por_tipo": list(por_tipo.values()),
+            "por_mes": list(por_mes.values())
+        }
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
 
 # -------------------- GET PAGOS POR RUT --------------------
-@router.get("/{rut}")
-def obtener_pagos_por_usuario(rut: str):
+class PagoUsuarioItem(BaseModel):
+    id_pago: int
+    id_tipo_pago: int
+    tipo_pago: Optional[str] = None
+    monto: float
+    fecha_pago: str
+
+
+# Ambas usan ix_pago_rut_fecha (ver app/migraciones.py)
+_SQL_VERSION_USUARIO = registrar("pago.version_usuario", """
+    SELECT COUNT(*), MAX(id_pago), MAX(ORA_ROWSCN)
+    FROM pago
+    WHERE rut_usuario = :rut
+""", verificar_plan=True, caliente=True)
+
+_SQL_POR_USUARIO = registrar("pago.por_usuario", f"""
+    SELECT p.id_pago, p.id_tipo_pago, tp.descripcion AS tipo_pago, p.monto, {fecha_sql("p.fecha_pago")}
+    FROM pago p
+    JOIN tipo_pago tp ON p.id_tipo_pago = tp.id_tipo_pago
+    WHERE p.rut_usuario = :rut
+    ORDER BY p.fecha_pago DESC
+""", verificar_plan=True, caliente=True)
+
+
+@router.get("/{rut}", response_model=List[PagoUsuarioItem])
+async def obtener_pagos_por_usuario(rut: str, request: Request, response: Response,
+                                    cone=Depends(get_conexion_lectura),
+                                    sesion=Depends(usuario_actual)):
+    verificar_acceso(sesion, rut)
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("""
-            SELECT p.id_pago, p.id_tipo_pago, tp.descripcion, p.monto, p.fecha_pago
-            FROM pago p
-            JOIN tipo_pago tp ON p.id_tipo_pago = tp.id_tipo_pago
-            WHERE p.rut_usuario = :rut
-            ORDER BY p.fecha_pago DESC
-        """, {"rut": rut})
-        pagos = cursor.fetchall()
-        cursor.close()
-        cone.close()
+        with cone.cursor() as cursor:
+            # Sonda de versión sobre los pagos del usuario
+            await cursor.execute(_SQL_VERSION_USUARIO, {"rut": rut})
+            cantidad, ultimo_id, scn = await cursor.fetchone()
+            if not cantidad:
+                raise HTTPException(status_code=404, detail="No se encontraron pagos para este usuario")
+            etag = calcular_etag(request.url.path, cantidad, ultimo_id, scn)
+            no_cambio = no_modificado(request, etag, CACHE_PRIVADO)
+            if no_cambio:
+                return no_cambio
+
+            await cursor.execute(_SQL_POR_USUARIO, {"rut": rut})
+            como_registros(cursor)
+            pagos = await cursor.fetchall()
 
         if not pagos:
             raise HTTPException(status_code=404, detail="No se encontraron pagos para este usuario")
 
-        return [
-            {
-                "id_pago": pago[0],
-                "id_tipo_pago": pago[1],
-                "tipo_pago": pago[2],
-                "monto": pago[3],
-                "fecha_pago": pago[4].strftime("%Y-%m-%d %H:%M:%S")
-            } for pago in pagos
-        ]
+        aplicar_validadores(response, etag, CACHE_PRIVADO)
+        return respuesta_json(pagos, response)
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
 
 # -------------------- DELETE PAGO POR ID --------------------
 @router.delete("/{id_pago}")
-def eliminar_pago(id_pago: int):
+async def eliminar_pago(id_pago: int, cone=Depends(get_conexion), sesion=Depends(requiere_rol(*ROLES_PERSONAL))):
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("DELETE FROM pago WHERE id_pago = :id", {"id": id_pago})
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Pago no encontrado")
-        cone.commit()
-        cursor.close()
-        cone.close()
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            borrados = cursor.var(int)
+            await cursor.execute(resumen_pagos.ELIMINAR_PAGO, {"id": id_pago, "borrados": borrados})
+            if not borrados.getvalue():
+                raise HTTPException(status_code=404, detail="Pago no encontrado")
+        coalescencia.olvidar("pagos.lista")
         return {"mensaje": "Pago eliminado con éxito"}
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
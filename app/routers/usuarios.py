@@ -1,258 +1,429 @@
-import email
-import hashlib
-from fastapi import APIRouter, Body, HTTPException, Path, logger
-from typing import Optional
-
-from fastapi.responses import JSONResponse
+import logging
+import oracledb
+from fastapi import APIRouter, Body, Depends, HTTPException, Path, Request, Response
+from typing import List, Optional
 from pydantic import BaseModel
-from app.database import get_conexion
-import bcrypt
+from app import cache_perfiles, cache_referencia, coalescencia
+from app.campos import Proyeccion, parametro_campos
+from app.condicional import CACHE_PRIVADO, CACHE_REFERENCIA, aplicar_validadores, calcular_etag, no_modificado
+from app.consultas import registrar
+from app.database import (
+    ORA_PADRE_NO_EXISTE, ORA_UNICA, conexion, detalle_fila, error_integridad, get_conexion, get_conexion_lectura,
+    unica_en
+)
+from app.exportacion import exportar, parametro_formato
+from app.hashing import hash_password, hash_passwords, verify_password
+from app.lotes import binds_in, bloques_in, leer_lote, registrar_in, resumen_resultados, tamano_in, validar_filas
+from app.paginacion import (Pagina, decodificar_cursor, pagina, parametro_cursor, parametro_limite, parsear_texto,
+                            preparar_cursor)
+from app.serializacion import como_registros, respuesta_json
+from app.seguridad import (
+    ROLES_PERSONAL, ROLES_VALIDOS, crear_tokens, decodificar_token, requiere_rol, usuario_actual, usuario_opcional,
+    verificar_acceso, verificar_escritura
+)
 
 router = APIRouter()
-
-ROLES_VALIDOS = ["cliente", "vendedor", "contador", "bodeguero", "administrador"]
-
-# Encriptar contraseña
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-# Verificar contraseña
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+logger = logging.getLogger(__name__)
+
+# Errores de integridad al insertar o modificar usuarios (ver error_integridad).
+# Los fragmentos se buscan en el nombre y en las columnas de la restricción.
+_ERRORES_USUARIO = [
+    (ORA_UNICA, "EMAIL", 400, "Email ya registrado"),
+    (ORA_UNICA, "RUT", 400, "RUT ya registrado"),
+    (ORA_UNICA, None, 400, "RUT o email ya registrado"),
+    (ORA_PADRE_NO_EXISTE, "COMUNA", 400, "Comuna inválida"),
+]
+
+# Solo para esquemas sin restricción única en usuario.email (ver
+# cargar_restricciones): ahí Oracle no rechaza el duplicado y se busca antes
+_SQL_EMAIL_OCUPADO = registrar("usuario.email_ocupado", """
+    SELECT 1 FROM usuario WHERE email = :email AND rut <> :rut FETCH FIRST 1 ROWS ONLY
+""")
+
+
+async def _verificar_email(cone, email: str, rut: str):
+    if email is None or unica_en("USUARIO", "EMAIL"):
+        return
+    with cone.cursor() as cursor:
+        await cursor.execute(_SQL_EMAIL_OCUPADO, {"email": email, "rut": rut})
+        if await cursor.fetchone():
+            raise HTTPException(status_code=400, detail="Email ya registrado")
 
 # -------------------- LOGIN --------------------
-from pydantic import BaseModel
-from passlib.context import CryptContext
-router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def _enmascarar(email: str) -> str:
+    # "juan.perez@x.cl" -> "j***@x.cl"
+    usuario, _, dominio = email.partition("@")
+    return f"{usuario[:1]}***@{dominio}"
 
 class LoginRequest(BaseModel):
     email: str
     clave: str
 
+# Usa el índice de uk_usuario_email
+_SQL_LOGIN = registrar("usuario.login", """
+    SELECT rut, nombre, email, clave, rol, requiere_cambio
+    FROM usuario
+    WHERE email = :email
+""", verificar_plan=True, caliente=True)
+
 @router.get("/login")
-def login_usuario(email: str, clave: str):
-    print(f"Login intent: email={email}, clave={clave}")
+async def login_usuario(email: str, clave: str, cone=Depends(get_conexion)):
+    # Nunca se registran la clave ni el hash; el email solo enmascarado.
+    # Va al primario: una clave recién cambiada debe valer de inmediato.
     try:
-        cone = get_conexion()
-        print("Conexión a DB exitosa.")
-        cursor = cone.cursor()
-
-        cursor.execute("""
-            SELECT rut, nombre, email, clave, rol, requiere_cambio
-            FROM usuario
-            WHERE email = :email
-        """, {"email": email})
-        print("Consulta ejecutada.")
-
-        row = cursor.fetchone()
-        print(f"Resultado fetchone: {row}")
-
-        cursor.close()
-        cone.close()
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_LOGIN, {"email": email})
+            row = await cursor.fetchone()
 
         if not row:
-            print("Usuario no encontrado.")
+            logger.info("Login rechazado", extra={"campos": {"motivo": "usuario_no_encontrado", "email": _enmascarar(email)}})
             raise HTTPException(status_code=401, detail="Email o clave incorrectos")
 
         rut, nombre, email_db, clave_hash, rol, requiere_cambio = row
-        print(f"Datos del usuario: rut={rut}, nombre={nombre}, email_db={email_db}, hash={clave_hash}, rol={rol}, requiere_cambio={requiere_cambio}")
 
-        if not pwd_context.verify(clave, clave_hash):
-            print("Clave incorrecta.")
+        if not await verify_password(clave, clave_hash):
+            logger.info("Login rechazado", extra={"campos": {"motivo": "clave_incorrecta", "rut": rut}})
             raise HTTPException(status_code=401, detail="Email o clave incorrectos")
 
-        print("Login exitoso.")
+        logger.info("Login exitoso", extra={"campos": {"rut": rut, "rol": rol}})
         return {
             "rut": rut,
             "nombre": nombre,
             "email": email_db,
             "rol": rol,
-            "requiere_cambio": requiere_cambio
+            "requiere_cambio": requiere_cambio,
+            **crear_tokens(rut, rol, email_db)
         }
 
+    except HTTPException:
+        raise
     except Exception as ex:
-        print(f"Error inesperado: {ex}")
+        logger.exception("Error inesperado en login")
         raise HTTPException(status_code=500, detail=f"Error del servidor: {str(ex)}")
 
 
 
-# -------------------- CAMBIO DE CLAVE admin --------------------   
-from pydantic import BaseModel
+# -------------------- REFRESCO DE TOKEN --------------------
+class RefrescoRequest(BaseModel):
+    refresh_token: str
 
-class CambioClave(BaseModel):
-    email: str
-    nueva_clave: str
+# Por la clave primaria: un usuario eliminado no renueva y uno con otro rol
+# recibe tokens con el rol actual, no con el del refresh_token
+_SQL_SESION = registrar("usuario.sesion", """
+    SELECT rol, email
+    FROM usuario
+    WHERE rut = :rut
+""", verificar_plan=True, caliente=True)
 
-@router.put("/cambiar-clave")
-def cambiar_clave(data: CambioClave):
+@router.post("/token/refrescar")
+async def refrescar_token(data: RefrescoRequest):
+    # Emite un nuevo par de tokens sin bcrypt; se lee del primario, igual que el login
+    payload = decodificar_token(data.refresh_token, tipo="refresh")
     try:
-        clave_hash = hash_password(data.nueva_clave)
-        cone = get_conexion()
-        cursor = cone.cursor()
+        async with conexion() as cone:
+            with cone.cursor() as cursor:
+                await cursor.execute(_SQL_SESION, {"rut": payload["sub"]})
+                fila = await cursor.fetchone()
+    except Exception as ex:
+        raise HTTPException(status_code=500, detail=str(ex))
+    if not fila:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado", headers={"WWW-Authenticate": "Bearer"})
+    rol, email = fila
+    return crear_tokens(payload["sub"], rol, email)
 
-        cursor.execute("""
-            UPDATE usuario
-            SET clave = :clave, requiere_cambio = 0
-            WHERE email = :email
-        """, {"clave": clave_hash, "email": data.email})
 
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+# -------------------- CAMBIO DE CLAVE admin --------------------
+class CambioClave(BaseModel):
+    email: str
+    nueva_clave: str
 
-        cone.commit()
-        cursor.close()
-        cone.close()
+_SQL_CAMBIAR_CLAVE = registrar("usuario.cambiar_clave", """
+    UPDATE usuario
+    SET clave = :clave, requiere_cambio = 0
+    WHERE email = :email
+""")
 
+@router.put("/cambiar-clave")
+async def cambiar_clave(data: CambioClave, cone=Depends(get_conexion), sesion=Depends(usuario_actual)):
+    if sesion.get("email") != data.email and sesion.get("rol") != "administrador":
+        raise HTTPException(status_code=403, detail="No tiene permisos para esta operación")
+    try:
+        clave_hash = await hash_password(data.nueva_clave)
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_CAMBIAR_CLAVE, {"clave": clave_hash, "email": data.email})
+
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        await cache_perfiles.invalidar(email=data.email)
         return {"mensaje": "Clave actualizada con éxito"}
 
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
 # -------------------- GET TODOS LOS USUARIOS --------------------
-@router.get("/usuarios")
-def obtener_usuarios():
+class UsuarioItem(BaseModel):
+    rut: str
+    nombre: Optional[str] = None
+    apellido: Optional[str] = None
+    email: Optional[str] = None
+    telefono: Optional[int] = None
+    rol: Optional[str] = None
+    comuna: Optional[str] = None
+
+
+# Una fila que trg_usuario_version incrementa en cada cambio (ver app/migraciones.py)
+_SQL_VERSION = registrar("usuario.version", "SELECT version FROM usuario_version WHERE id = 1", caliente=True)
+_ORA_TABLA_NO_EXISTE = 942
+_version_disponible = True      # False si falta usuario_version: la lista va sin ETag
+
+
+async def _version_usuarios(cur):
+    # Sin la migración (tabla o fila de usuario_version) devuelve None y la
+    # lista se entrega completa, sin ETag, en vez de fallar
+    global _version_disponible
+    if not _version_disponible:
+        return None
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("SELECT u.rut," \
-        "                      u.nombre, " \
-        "                      u.apellido, " \
-        "                      u.email, " \
-        "                      u.telefono, " \
-        "                      u.rol, " \
-        "                      c.descripcion " \
-        "               FROM usuario u" \
-        "               JOIN comuna c ON u.id_comuna = c.id_comuna")
-        usuarios = []
-        for rut, nombre, apellido, email, telefono, rol, comuna in cursor:
-            usuarios.append({
-                "rut": rut,
-                "nombre": nombre,
-                "apellido": apellido,
-                "email": email,
-                "telefono": telefono,
-                "rol": rol,
-                "comuna": comuna
-            })
-        cursor.close()
-        cone.close()
-        return usuarios
+        await cur.execute(_SQL_VERSION)
+        fila = await cur.fetchone()
+    except oracledb.DatabaseError as ex:
+        if ex.args[0].code != _ORA_TABLA_NO_EXISTE:
+            raise
+        _version_disponible = False
+        logger.warning("Falta la tabla usuario_version: GET /usuarios/usuarios responde sin ETag hasta aplicar "
+                       "python -m app.migraciones aplicar y reiniciar")
+        return None
+    return fila[0] if fila else None
+
+# Las lecturas de usuarios (lista, exportación, por rut y por email) excluyen
+# a los que no tienen comuna, como cuando se unían con comuna: el nombre de la
+# comuna ahora sale del caché de referencia, pero el resultado es el mismo
+
+# Campos que admite fields= (ver app/campos.py); rut es la clave del cursor
+_LISTA = Proyeccion(
+    "usuario.lista",
+    {
+        "rut": ("u.rut", None),
+        "nombre": ("u.nombre", None),
+        "apellido": ("u.apellido", None),
+        "email": ("u.email", None),
+        "telefono": ("u.telefono", None),
+        "rol": ("u.rol", None),
+        "comuna": ("u.id_comuna AS comuna", None),
+    },
+    {},
+    """
+    SELECT {columnas}
+    FROM usuario u
+    {joins}
+    WHERE u.id_comuna IS NOT NULL
+    {variante}
+    ORDER BY u.rut
+    FETCH FIRST :limite ROWS ONLY
+""",
+    {"": "", "_desde": "AND u.rut > :cursor_rut"},
+    obligatorios=("rut",)
+)
+
+
+@router.get("/usuarios", response_model=Pagina[UsuarioItem])
+async def obtener_usuarios(
+    request: Request,
+    response: Response,
+    limite: int = parametro_limite(),
+    cursor: Optional[str] = parametro_cursor(),
+    fields: Optional[str] = parametro_campos(_LISTA),
+    cone=Depends(get_conexion_lectura),
+    sesion=Depends(requiere_rol(*ROLES_PERSONAL))
+):
+    campos = _LISTA.campos(fields)
+    binds = {"limite": limite + 1}
+    variante = ""
+    if cursor:
+        binds["cursor_rut"], = decodificar_cursor(cursor, parsear_texto)
+        variante = "_desde"
+    try:
+        with cone.cursor() as cur:
+            # Sonda barata de versión: si nada cambió, 304 sin armar la página
+            version = await _version_usuarios(cur)
+            comunas = await cache_referencia.comunas.obtener()
+            etag = None
+            if version is not None:
+                etag = calcular_etag(request.url.path, request.url.query, version, cache_referencia.comunas.version)
+                no_cambio = no_modificado(request, etag, CACHE_PRIVADO)
+                if no_cambio:
+                    return no_cambio
+
+            preparar_cursor(cur, limite)
+            await cur.execute(_LISTA.sql(campos, variante), binds)
+            if "comuna" in campos:
+                como_registros(cur, comuna=comunas.get)
+            else:
+                como_registros(cur)
+            filas = await cur.fetchall()
+
+        filas, siguiente = pagina(filas, limite, lambda fila: (fila["rut"],))
+        if etag is not None:
+            aplicar_validadores(response, etag, CACHE_PRIVADO)
+        return respuesta_json({"items": filas, "siguiente": siguiente}, response)
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
+# -------------------- EXPORTAR USUARIOS --------------------
+_SQL_EXPORTAR = registrar("usuario.exportar", """
+    SELECT u.rut, u.nombre, u.apellido, u.email, u.telefono, u.rol, u.id_comuna
+    FROM usuario u
+    WHERE u.id_comuna IS NOT NULL
+    ORDER BY u.rut
+""")
+
+@router.get("/usuarios/exportar")
+async def exportar_usuarios(formato: str = parametro_formato(), sesion=Depends(requiere_rol(*ROLES_PERSONAL))):
+    comunas = await cache_referencia.comunas.obtener()
+    return await exportar(
+        _SQL_EXPORTAR,
+        {}, ["rut", "nombre", "apellido", "email", "telefono", "rol", "comuna"], formato, "usuarios",
+        transformar=lambda fila: fila[:6] + (comunas.get(fila[6]),)
+    )
+
 # -------------------- GET POR RUT --------------------
 @router.get("/comuna")
-def obtener_comunas():
+async def obtener_comunas(request: Request, response: Response):
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("SELECT id_comuna, descripcion FROM comuna")
+        # Con la tabla en memoria se responde sin ceder el event loop; mientras
+        # se recarga, las demás peticiones esperan esa misma lectura
+        datos = cache_referencia.comunas.en_memoria() or await coalescencia.compartir(
+            "usuarios.comuna", (), cache_referencia.comunas.obtener
+        )
+        etag = calcular_etag(request.url.path, cache_referencia.comunas.version)
+        no_cambio = no_modificado(request, etag, CACHE_REFERENCIA)
+        if no_cambio:
+            return no_cambio
+
         comunas = []
-        for id_comuna, descripcion in cursor:
+        for id_comuna, descripcion in datos.items():
             comunas.append({
                 "id_comuna": id_comuna,
                 "descripcion": descripcion
             })
-        cursor.close()
-        cone.close()
+        aplicar_validadores(response, etag, CACHE_REFERENCIA)
         return comunas
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 # -------------------- GET ADMINISTRADORES --------------------
-@router.get("/administrador")
-def obtener_administradores():
+class AdministradorItem(BaseModel):
+    rut: str
+    nombre: Optional[str] = None
+    email: Optional[str] = None
+    rol: Optional[str] = None
+
+
+_SQL_ADMINISTRADORES = registrar("usuario.administradores", """
+    SELECT rut, nombre, email, rol
+    FROM usuario
+    WHERE LOWER(rol) = 'administrador'
+""")
+
+
+@router.get("/administrador", response_model=List[AdministradorItem])
+async def obtener_administradores(cone=Depends(get_conexion_lectura), sesion=Depends(requiere_rol(*ROLES_PERSONAL))):
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("""
-            SELECT rut, nombre, email, rol
-            FROM usuario
-            WHERE LOWER(rol) = 'administrador'
-        """)
-        admins = []
-        for rut, nombre, email, rol in cursor:
-            admins.append({
-                "rut": rut,  # Asumiendo que rut es el primer campo
-                "nombre": nombre,
-                "email": email,
-                "rol": rol
-            })
-        cursor.close()
-        cone.close()
-        return admins
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_ADMINISTRADORES)
+            como_registros(cursor)
+            admins = await cursor.fetchall()
+        return respuesta_json(admins)
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 # -------------------- GET POR RUT --------------------
+_SQL_POR_RUT = registrar("usuario.por_rut", """
+    SELECT u.rut, u.nombre, u.apellido, u.email, u.telefono, u.rol, u.id_comuna
+    FROM usuario u
+    WHERE u.rut = :rut AND u.id_comuna IS NOT NULL
+""", verificar_plan=True, caliente=True)
+
+_COLUMNAS_PERFIL = ("rut", "nombre", "apellido", "email", "telefono", "rol", "id_comuna")
+
+
+async def _cargar_perfil(sql: str, binds: dict, generacion: int = None) -> dict:
+    # Solo se toma una conexión del pool cuando el perfil no está en caché.
+    # Se lee del primario aunque haya réplica: el perfil queda guardado en el
+    # caché compartido y una réplica atrasada lo dejaría obsoleto hasta el TTL.
+    if generacion is None:
+        generacion = await cache_perfiles.generacion()
+    async with conexion() as cone:
+        with cone.cursor() as cursor:
+            await cursor.execute(sql, binds)
+            fila = await cursor.fetchone()
+    if not fila:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    perfil = dict(zip(_COLUMNAS_PERFIL, fila))
+    await cache_perfiles.guardar(perfil, generacion)
+    return perfil
+
+
+async def _respuesta_perfil(perfil: dict) -> dict:
+    # El nombre de la comuna sale del caché de referencia, no del perfil guardado
+    return {**perfil, "comuna": (await cache_referencia.comunas.obtener()).get(perfil["id_comuna"])}
+
+
 @router.get("/usuario/{rut_buscar}")
-def obtener_usuario(rut_buscar: str):
+async def obtener_usuario(rut_buscar: str, sesion=Depends(usuario_actual)):
+    verificar_acceso(sesion, rut_buscar)
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute(
-            "SELECT u.rut, u.nombre, u.apellido, u.email, u.telefono, u.rol, u.id_comuna, c.descripcion "
-            "FROM usuario u "
-            "JOIN comuna c ON u.id_comuna = c.id_comuna "
-            "WHERE u.rut = :rut",
-            {"rut": rut_buscar}
-        )
-        usuario = cursor.fetchone()
-        cursor.close()
-        cone.close()
-        if not usuario:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        return {
-            "rut": usuario[0],
-            "nombre": usuario[1],
-            "apellido": usuario[2],
-            "email": usuario[3],
-            "telefono": usuario[4],
-            "rol": usuario[5],
-            "id_comuna": usuario[6],    # <-- agregamos el ID
-            "comuna": usuario[7]        # <-- el nombre para mostrar si quieres
-        }
+        # Con caché frío, las peticiones simultáneas por el mismo rut comparten
+        # una lectura; la generación en la clave evita sumarse a una lectura
+        # que empezó antes de una escritura
+        perfil = await cache_perfiles.por_rut(rut_buscar)
+        if perfil is None:
+            generacion = await cache_perfiles.generacion()
+            perfil = await coalescencia.compartir(
+                "usuarios.por_rut", (rut_buscar, generacion),
+                lambda: _cargar_perfil(_SQL_POR_RUT, {"rut": rut_buscar}, generacion)
+            )
+        return await _respuesta_perfil(perfil)
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
 # -------------------- POST REGISTRO CLIENTE --------------------
+_SQL_INSERTAR_CLIENTE = registrar("usuario.insertar_cliente", """
+    INSERT INTO usuario (rut, nombre, apellido, email, telefono, clave, rol, id_comuna)
+    VALUES (:rut, :nombre, :apellido, :email, :telefono, :clave, 'cliente', :id_comuna)
+""")
+
 @router.post("/registro-cliente")
-def registrar_cliente(rut: str, nombre: str, apellido: str, email: str, telefono: int, clave: str, id_comuna: int):
+async def registrar_cliente(rut: str, nombre: str, apellido: str, email: str, telefono: int, clave: str, id_comuna: int,
+                            cone=Depends(get_conexion)):
     if len(str(telefono)) != 9:
         raise HTTPException(status_code=400, detail="El teléfono debe tener 9 dígitos")
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-
-        # Verificar si ya existe el email
-        cursor.execute("SELECT 1 FROM usuario WHERE email = :email", {"email": email})
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Email ya registrado")
-
-        # Verificar si ya existe el RUT
-        cursor.execute("SELECT 1 FROM usuario WHERE rut = :rut", {"rut": rut})
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="RUT ya registrado")
-
-        clave_hash = hash_password(clave)
-        cursor.execute("""
-            INSERT INTO usuario (rut, nombre, apellido, email, telefono, clave, rol, id_comuna)
-            VALUES (:rut, :nombre, :apellido, :email, :telefono, :clave, 'cliente', :id_comuna)
-        """, {
-            "rut": rut, "nombre": nombre, "apellido": apellido, "email": email,
-            "telefono": telefono, "clave": clave_hash, "id_comuna": id_comuna
-        })
-        cone.commit()
-        cursor.close()
-        cone.close()
+        await _verificar_email(cone, email, rut)
+        clave_hash = await hash_password(clave)
+        # Un solo viaje: los duplicados de email o RUT los rechaza Oracle
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_INSERTAR_CLIENTE, {
+                "rut": rut, "nombre": nombre, "apellido": apellido, "email": email,
+                "telefono": telefono, "clave": clave_hash, "id_comuna": id_comuna
+            })
         return {"mensaje": "Cliente registrado con éxito"}
+    except HTTPException:
+        raise
+    except oracledb.IntegrityError as ex:
+        raise error_integridad(ex, _ERRORES_USUARIO)
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
 
 
 # -------------------- POST REGISTRO ADMIN A TRABAJADOR --------------------
-from pydantic import BaseModel
-
 class TrabajadorRequest(BaseModel):
     rut: str
     nombre: str
@@ -263,96 +434,186 @@ class TrabajadorRequest(BaseModel):
     rol: str
     id_comuna: int
 
+# También la usa la importación masiva (executemany)
+_SQL_INSERTAR_TRABAJADOR = registrar("usuario.insertar_trabajador", """
+    INSERT INTO usuario (
+        rut, nombre, apellido, email, telefono, clave, rol, id_comuna, requiere_cambio
+    ) VALUES (
+        :rut, :nombre, :apellido, :email, :telefono, :clave, :rol, :id_comuna, 1
+    )
+""")
+
 @router.post("/registro-trabajador")
-def agregar_usuario(data: TrabajadorRequest):
+async def agregar_usuario(data: TrabajadorRequest, cone=Depends(get_conexion),
+                          sesion=Depends(requiere_rol("administrador"))):
     if data.rol.lower() not in ROLES_VALIDOS or data.rol.lower() == "cliente":
         raise HTTPException(status_code=400, detail="No puedes asignar rol cliente")
     if len(str(data.telefono)) != 9:
         raise HTTPException(status_code=400, detail="El teléfono debe tener 9 dígitos")
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-
-        cursor.execute("SELECT 1 FROM usuario WHERE email = :email", {"email": data.email})
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Email ya registrado")
+        await _verificar_email(cone, data.email, data.rut)
+        clave_hash = await hash_password(data.clave)
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_INSERTAR_TRABAJADOR, {
+                "rut": data.rut,
+                "nombre": data.nombre,
+                "apellido": data.apellido,
+                "email": data.email,
+                "telefono": data.telefono,
+                "clave": clave_hash,
+                "rol": data.rol.lower(),
+                "id_comuna": data.id_comuna
+            })
+        return {"mensaje": "Usuario registrado con éxito"}
+    except HTTPException:
+        raise
+    except oracledb.IntegrityError as ex:
+        raise error_integridad(ex, _ERRORES_USUARIO)
+    except Exception as ex:
+        raise HTTPException(status_code=500, detail=str(ex))
 
-        clave_hash = hash_password(data.clave)
+# -------------------- POST IMPORTACIÓN MASIVA DE TRABAJADORES --------------------
+_SQL_EXISTENTES = registrar_in("usuario.existentes", "SELECT rut, email FROM usuario WHERE rut IN {r} OR email IN {e}")
+
+@router.post("/registro-trabajador/importar")
+async def importar_trabajadores(request: Request, cone=Depends(get_conexion),
+                                sesion=Depends(requiere_rol("administrador"))):
+    # Recibe JSON, NDJSON o CSV con los campos de TrabajadorRequest. Los
+    # duplicados se buscan en una consulta por bloque, las claves se
+    # encriptan en paralelo y los usuarios se insertan con array DML.
+    filas = await leer_lote(request)
+    validas, errores = validar_filas(filas, TrabajadorRequest)
+
+    vistos_rut, vistos_email, candidatos = set(), set(), []
+    for indice, data in validas:
+        if data.rol.lower() not in ROLES_VALIDOS or data.rol.lower() == "cliente":
+            errores[indice] = "No puedes asignar rol cliente"
+        elif len(str(data.telefono)) != 9:
+            errores[indice] = "El teléfono debe tener 9 dígitos"
+        elif data.rut in vistos_rut:
+            errores[indice] = "RUT repetido en el archivo"
+        elif data.email in vistos_email:
+            errores[indice] = "Email repetido en el archivo"
+        else:
+            vistos_rut.add(data.rut)
+            vistos_email.add(data.email)
+            candidatos.append((indice, data))
 
-        cursor.execute("""
-            INSERT INTO usuario (
-                rut, nombre, apellido, email, telefono, clave, rol, id_comuna, requiere_cambio
-            ) VALUES (
-                :rut, :nombre, :apellido, :email, :telefono, :clave, :rol, :id_comuna, 1
-            )
-        """, {
-            "rut": data.rut,
-            "nombre": data.nombre,
-            "apellido": data.apellido,
-            "email": data.email,
-            "telefono": data.telefono,
-            "clave": clave_hash,
-            "rol": data.rol.lower(),
-            "id_comuna": data.id_comuna
-        })
-
-        cone.commit()
-        return {"mensaje": "Usuario registrado con éxito"}
+    try:
+        with cone.cursor() as cursor:
+            ruts_existentes, emails_existentes = set(), set()
+            for bloque in bloques_in(range(len(candidatos))):
+                await cursor.execute(_SQL_EXISTENTES[tamano_in(len(bloque))], {
+                    **binds_in([candidatos[i][1].rut for i in bloque], "r"),
+                    **binds_in([candidatos[i][1].email for i in bloque], "e"),
+                })
+                for rut, email_ in await cursor.fetchall():
+                    ruts_existentes.add(rut)
+                    emails_existentes.add(email_)
+
+            insertar = []
+            for indice, data in candidatos:
+                if data.email in emails_existentes:
+                    errores[indice] = "Email ya registrado"
+                elif data.rut in ruts_existentes:
+                    errores[indice] = "RUT ya registrado"
+                else:
+                    insertar.append((indice, data))
+
+            if insertar:
+                claves = await hash_passwords([data.clave for _, data in insertar])
+                await cursor.executemany(_SQL_INSERTAR_TRABAJADOR, [
+                    {**data.model_dump(), "clave": clave, "rol": data.rol.lower()}
+                    for (_, data), clave in zip(insertar, claves)
+                ], batcherrors=True)
+                for error in cursor.getbatcherrors():
+                    errores[insertar[error.offset][0]] = detalle_fila(error, _ERRORES_USUARIO)
+        await cone.commit()
+        return resumen_resultados(len(filas), errores)
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
-    finally:
-        cursor.close()
-        cone.close()
-    # -------------------- POST REGISTRO ADMIN --------------------
-from pydantic import BaseModel
 
+# -------------------- POST REGISTRO ADMIN --------------------
 class AdminRequest(BaseModel):
     rut: str
     nombre: str
     email: str
     clave: str
-@router.post("/registro-administrador")
-def registrar_administrador(admin: AdminRequest):
-    try:
-        cone = get_conexion()
-        cursor = cone.cursor()
 
-        # Validar que no exista el email
-        cursor.execute("SELECT 1 FROM usuario WHERE email = :email", {"email": admin.email})
-        if cursor.fetchone():
-            raise HTTPException(status_code=400, detail="Email ya registrado")
+_SQL_INSERTAR_ADMINISTRADOR = registrar("usuario.insertar_administrador", """
+    INSERT INTO usuario (
+        rut, nombre, apellido, email, telefono, clave, rol, id_comuna, requiere_cambio
+    ) VALUES (
+        :rut, :nombre, :apellido, :email, :telefono, :clave, 'administrador', :id_comuna, 1
+    )
+""")
 
-        clave_hash = hash_password(admin.clave)
+# Arranque de una base sin administradores: el primero se puede crear sin
+# sesión. La condición va en el mismo INSERT, así que si otro administrador
+# aparece entre la consulta previa y la inserción, no se inserta nada.
+_SQL_HAY_ADMINISTRADOR = registrar("usuario.hay_administrador", """
+    SELECT 1 FROM usuario WHERE LOWER(rol) = 'administrador' FETCH FIRST 1 ROWS ONLY
+""")
 
-        cursor.execute("""
-            INSERT INTO usuario (
-                rut, nombre, apellido, email, telefono, clave, rol, id_comuna, requiere_cambio
-            ) VALUES (
-                :rut, :nombre, :apellido, :email, :telefono, :clave, 'administrador', :id_comuna, 1
-            )
-        """, {
-            "rut": admin.rut,
-            "nombre": admin.nombre,
-            "apellido": "-",  # Valor requerido
-            "email": admin.email,
-            "telefono": None,       # Aceptable solo si la columna permite NULL
-            "clave": clave_hash,
-            "id_comuna": None       # Aceptable solo si la columna permite NULL
-        })
-
-        cone.commit()
+_SQL_INSERTAR_PRIMER_ADMINISTRADOR = registrar("usuario.insertar_primer_administrador", """
+    INSERT INTO usuario (
+        rut, nombre, apellido, email, telefono, clave, rol, id_comuna, requiere_cambio
+    )
+    SELECT :rut, :nombre, :apellido, :email, :telefono, :clave, 'administrador', :id_comuna, 1
+    FROM dual
+    WHERE NOT EXISTS (SELECT 1 FROM usuario WHERE LOWER(rol) = 'administrador')
+""")
+
+
+def _sin_permiso_administrador():
+    return HTTPException(status_code=401, detail="Solo un administrador puede registrar administradores",
+                         headers={"WWW-Authenticate": "Bearer"})
+
+
+@router.post("/registro-administrador")
+async def registrar_administrador(admin: AdminRequest, cone=Depends(get_conexion),
+                                  sesion=Depends(usuario_opcional)):
+    # Con sesión se exige rol administrador; sin sesión solo se acepta si
+    # todavía no existe ningún administrador
+    if sesion is not None and sesion.get("rol") != "administrador":
+        raise HTTPException(status_code=403, detail="No tiene permisos para esta operación")
+    try:
+        sql = _SQL_INSERTAR_ADMINISTRADOR
+        if sesion is None:
+            # Antes de bcrypt: sin sesión no se gasta CPU si ya hay administradores
+            with cone.cursor() as cursor:
+                await cursor.execute(_SQL_HAY_ADMINISTRADOR)
+                if await cursor.fetchone():
+                    raise _sin_permiso_administrador()
+            sql = _SQL_INSERTAR_PRIMER_ADMINISTRADOR
+        await _verificar_email(cone, admin.email, admin.rut)
+
+        clave_hash = await hash_password(admin.clave)
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            await cursor.execute(sql, {
+                "rut": admin.rut,
+                "nombre": admin.nombre,
+                "apellido": "-",  # Valor requerido
+                "email": admin.email,
+                "telefono": None,       # Aceptable solo si la columna permite NULL
+                "clave": clave_hash,
+                "id_comuna": None       # Aceptable solo si la columna permite NULL
+            })
+            if cursor.rowcount == 0:
+                raise _sin_permiso_administrador()
         return {"mensaje": "Administrador registrado con éxito"}
     
+    except HTTPException:
+        raise
+    except oracledb.IntegrityError as ex:
+        raise error_integridad(ex, _ERRORES_USUARIO)
     except Exception as ex:
-        print("", str(ex))
+        logger.exception("Error al registrar administrador")
         raise HTTPException(status_code=500, detail="Error interno: " + str(ex))
-    
-    finally:
-        try:
-            cursor.close()
-            cone.close()
-        except:
-            pass
 
 
 # -------------------- PATCH ACTUALIZACIÓN PARCIAL --------------------
@@ -364,119 +625,111 @@ class UsuarioUpdate(BaseModel):
     rol: Optional[str] = None
     id_comuna: Optional[int] = None
 
+# Una sola sentencia para cualquier combinación de campos: cada columna
+# lleva su bandera :con_<campo> y solo cambia si vino en el cuerpo, así que
+# el texto no depende de la petición. Las numéricas se convierten para que
+# un NULL ligado como texto no cambie el tipo del CASE.
+_CAMPOS_MODIFICABLES = ("nombre", "apellido", "email", "telefono", "rol", "id_comuna")
+_NUMERICOS = {"telefono", "id_comuna"}
+_SQL_MODIFICAR = registrar("usuario.modificar", "UPDATE usuario SET {} WHERE rut = :rut".format(", ".join(
+    f"{campo} = CASE WHEN :con_{campo} = 1 THEN "
+    f"{f'TO_NUMBER(:{campo})' if campo in _NUMERICOS else f':{campo}'} ELSE {campo} END"
+    for campo in _CAMPOS_MODIFICABLES
+)))
+
 @router.patch("/modificar/{rut}")
-async def modificar_usuario(rut: str = Path(...), usuario: UsuarioUpdate = Body(...)):
+async def modificar_usuario(rut: str = Path(...), usuario: UsuarioUpdate = Body(...), cone=Depends(get_conexion),
+                            sesion=Depends(usuario_actual)):
+    verificar_escritura(sesion, rut)
+    if usuario.rol is not None and sesion.get("rol") != "administrador":
+        raise HTTPException(status_code=403, detail="Solo un administrador puede cambiar el rol")
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        
-        # Verificar si el usuario existe
-        cursor.execute("SELECT rut FROM usuario WHERE rut = :rut", {"rut": rut})
-        if cursor.fetchone() is None:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-
-        # Construir query dinámicamente
-        campos = []
-        valores = {}
-        for field, value in usuario.dict(exclude_unset=True).items():
-            campos.append(f"{field} = :{field}")
-            valores[field] = value
-
-        if not campos:
+        cambios = usuario.model_dump(exclude_unset=True)
+        if not cambios:
             raise HTTPException(status_code=400, detail="No se enviaron campos para actualizar")
 
-        valores["rut"] = rut
-        sql = f"UPDATE usuario SET {', '.join(campos)} WHERE rut = :rut"
-        cursor.execute(sql, valores)
-        cone.commit()
-        
+        valores = {"rut": rut}
+        for campo in _CAMPOS_MODIFICABLES:
+            valores[campo] = cambios.get(campo)
+            valores[f"con_{campo}"] = int(campo in cambios)
+        await _verificar_email(cone, cambios.get("email"), rut)
+        # Un solo viaje: si no se actualizó ninguna fila, el usuario no existe
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_MODIFICAR, valores)
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        await cache_perfiles.invalidar(rut=rut)
         return {"detail": "Usuario actualizado correctamente"}
     except HTTPException:
         raise
+    except oracledb.IntegrityError as ex:
+        raise error_integridad(ex, _ERRORES_USUARIO)
     except Exception as ex:
         raise HTTPException(status_code=500, detail=f"Error en la base de datos: {str(ex)}")
-    finally:
-        cursor.close()
-        cone.close()
 
 # -------------------- DELETE USUARIO --------------------
+_SQL_ELIMINAR = registrar("usuario.eliminar", "DELETE FROM usuario WHERE rut = :rut")
+
 @router.delete("/eliminar/{rut}")
-def eliminar_usuario(rut: str):
+async def eliminar_usuario(rut: str, cone=Depends(get_conexion), sesion=Depends(requiere_rol("administrador"))):
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute("DELETE FROM usuario WHERE rut = :rut", {"rut": rut})
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        cone.commit()
-        cursor.close()
-        cone.close()
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_ELIMINAR, {"rut": rut})
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        await cache_perfiles.invalidar(rut=rut)
         return {"mensaje": "Usuario eliminado con éxito"}
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
     
 class PasswordUpdate(BaseModel):
     clave: str
 
+_SQL_MODIFICAR_CLAVE = registrar("usuario.modificar_clave", "UPDATE usuario SET clave = :clave WHERE rut = :rut")
+
+# Usa ix_usuario_email_lower (índice por función, ver app/migraciones.py)
+_SQL_POR_EMAIL = registrar("usuario.por_email", """
+    SELECT u.rut, u.nombre, u.apellido, u.email, u.telefono, u.rol, u.id_comuna
+    FROM usuario u
+    WHERE LOWER(u.email) = LOWER(:email) AND u.id_comuna IS NOT NULL
+""", verificar_plan=True, caliente=True)
+
 @router.get("/buscar-usuario-por-email/")
-def buscar_usuario_por_email(email: str):
+async def buscar_usuario_por_email(email: str, sesion=Depends(usuario_actual)):
+    # Un cliente solo puede buscar su propio email; se revisa antes de leer
+    # para no revelar si otros emails existen
+    if sesion.get("rol") not in ROLES_PERSONAL and (sesion.get("email") or "").lower() != email.lower():
+        raise HTTPException(status_code=403, detail="No tiene permisos para esta operación")
     try:
-        cone = get_conexion()
-        cursor = cone.cursor()
-        cursor.execute(
-            "SELECT u.rut, u.nombre, u.apellido, u.email, u.telefono, u.rol, u.id_comuna, c.descripcion "
-            "FROM usuario u "
-            "JOIN comuna c ON u.id_comuna = c.id_comuna "
-            "WHERE LOWER(u.email) = LOWER(:email)",
-            {"email": email}
-        )
-        usuario = cursor.fetchone()
-        cursor.close()
-        cone.close()
-        if not usuario:
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        return {
-            "rut": usuario[0],
-            "nombre": usuario[1],
-            "apellido": usuario[2],
-            "email": usuario[3],
-            "telefono": usuario[4],
-            "rol": usuario[5],
-            "id_comuna": usuario[6],
-            "comuna": usuario[7]
-        }
+        perfil = await cache_perfiles.por_email(email) or await _cargar_perfil(_SQL_POR_EMAIL, {"email": email})
+        verificar_acceso(sesion, perfil["rut"])
+        return await _respuesta_perfil(perfil)
+    except HTTPException:
+        raise
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 @router.patch("/modificar-clave/{rut}")
-def modificar_clave_usuario(rut: str, datos: PasswordUpdate):
+async def modificar_clave_usuario(rut: str, datos: PasswordUpdate, cone=Depends(get_conexion),
+                                  sesion=Depends(usuario_actual)):
+    verificar_escritura(sesion, rut)
     try:
-        conn = get_conexion()
-        cursor = conn.cursor()
-
-        # Verificar usuario
-        cursor.execute("SELECT rut FROM usuario WHERE rut = :rut", {"rut": rut})
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        
         # Hashear con bcrypt (igual que en login)
-        clave_hash = pwd_context.hash(datos.clave)
-        
-        # Actualizar en BD
-        cursor.execute(
-            "UPDATE usuario SET clave = :clave WHERE rut = :rut",
-            {"clave": clave_hash, "rut": rut}
-        )
-        conn.commit()
-        
+        clave_hash = await hash_password(datos.clave)
+
+        # Actualizar en BD; rowcount 0 significa que el usuario no existe
+        cone.autocommit = True
+        with cone.cursor() as cursor:
+            await cursor.execute(_SQL_MODIFICAR_CLAVE, {"clave": clave_hash, "rut": rut})
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        await cache_perfiles.invalidar(rut=rut)
         return {"message": "Contraseña actualizada correctamente"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        cursor.close()
-        conn.close()
-
-class PasswordUpdate(BaseModel):
-    nueva_contrasena: str
@@ -0,0 +1,213 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sys
+import time
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+logger = logging.getLogger(__name__)
+
+ROLES_VALIDOS = ["cliente", "vendedor", "contador", "bodeguero", "administrador"]
+ROLES_PERSONAL = [rol for rol in ROLES_VALIDOS if rol != "cliente"]
+
+# -------------------- CONFIGURACIÓN --------------------
+# JWT_CLAVES: "kid:secreto,kid_anterior:secreto_anterior" (la primera firma)
+# JWT_CLAVES_ARCHIVO: JSON {"activa": kid, "claves": {kid: secreto}}; se
+# relee cada JWT_CLAVES_TTL segundos, así que rotar no requiere reiniciar.
+JWT_CLAVES = os.getenv("JWT_CLAVES", "")
+JWT_CLAVES_ARCHIVO = os.getenv("JWT_CLAVES_ARCHIVO", "")
+JWT_CLAVES_TTL = int(os.getenv("JWT_CLAVES_TTL", "300"))
+JWT_CLAVES_RETENIDAS = int(os.getenv("JWT_CLAVES_RETENIDAS", "3"))
+JWT_ACCESO_TTL = int(os.getenv("JWT_ACCESO_TTL", "900"))           # 15 minutos
+JWT_REFRESCO_TTL = int(os.getenv("JWT_REFRESCO_TTL", "604800"))    # 7 días
+JWT_EMISOR = os.getenv("JWT_EMISOR", "ferremas-api-usuarios")
+# Solo desarrollo: sin claves configuradas, cada proceso inventa la suya y
+# los tokens no sirven entre workers ni sobreviven un reinicio
+JWT_CLAVE_TEMPORAL = os.getenv("JWT_CLAVE_TEMPORAL", "0") == "1"
+
+
+def _b64(datos: bytes) -> str:
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode("ascii")
+
+
+def _b64_decode(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+# -------------------- CONJUNTO DE CLAVES --------------------
+class ConjuntoClaves:
+    # Mantiene en memoria las claves HMAC ya decodificadas. Solo la clave
+    # activa firma; las anteriores siguen validando tokens ya emitidos.
+    def __init__(self):
+        self._activa = None
+        self._claves = {}
+        self._cargado_en = 0.0
+
+    def _cargar(self):
+        if JWT_CLAVES_ARCHIVO:
+            with open(JWT_CLAVES_ARCHIVO, encoding="utf-8") as archivo:
+                datos = json.load(archivo)
+            activa, claves = datos["activa"], datos["claves"]
+        elif JWT_CLAVES:
+            pares = [par.split(":", 1) for par in JWT_CLAVES.split(",") if par.strip()]
+            activa, claves = pares[0][0].strip(), {kid.strip(): secreto for kid, secreto in pares}
+        else:
+            if not JWT_CLAVE_TEMPORAL:
+                raise RuntimeError("Configure JWT_CLAVES o JWT_CLAVES_ARCHIVO (JWT_CLAVE_TEMPORAL=1 solo en desarrollo)")
+            if not self._claves:
+                logger.warning("JWT_CLAVES no configurado: se usa una clave temporal válida solo para este proceso")
+                self._activa, self._claves = "temporal", {"temporal": secrets.token_bytes(32)}
+            return
+        self._activa = activa
+        self._claves = {kid: secreto.encode("utf-8") for kid, secreto in claves.items()}
+
+    def _vigente(self):
+        if not self._claves or time.monotonic() - self._cargado_en > JWT_CLAVES_TTL:
+            try:
+                self._cargar()
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                if not self._claves:
+                    raise
+                logger.error("No se pudo recargar el conjunto de claves JWT: %s", e)
+            self._cargado_en = time.monotonic()
+
+    def activa(self):
+        self._vigente()
+        return self._activa, self._claves[self._activa]
+
+    def clave(self, kid):
+        self._vigente()
+        return self._claves.get(kid)
+
+    def invalidar(self):
+        self._cargado_en = 0.0
+
+
+claves = ConjuntoClaves()
+
+
+def verificar_claves():
+    # Se llama al iniciar el worker: sin claves configuradas no arranca
+    claves.activa()
+
+
+# -------------------- EMISIÓN Y VALIDACIÓN --------------------
+def _firmar(payload: dict) -> str:
+    kid, clave = claves.activa()
+    cabecera = _b64(json.dumps({"alg": "HS256", "typ": "JWT", "kid": kid}, separators=(",", ":")).encode())
+    cuerpo = _b64(json.dumps(payload, separators=(",", ":")).encode())
+    firma = hmac.new(clave, f"{cabecera}.{cuerpo}".encode("ascii"), hashlib.sha256).digest()
+    return f"{cabecera}.{cuerpo}.{_b64(firma)}"
+
+
+def crear_tokens(rut: str, rol: str, email: str) -> dict:
+    ahora = int(time.time())
+    base = {"iss": JWT_EMISOR, "sub": rut, "rol": rol, "email": email, "iat": ahora}
+    return {
+        "access_token": _firmar({**base, "typ": "access", "exp": ahora + JWT_ACCESO_TTL}),
+        "refresh_token": _firmar({**base, "typ": "refresh", "exp": ahora + JWT_REFRESCO_TTL}),
+        "token_type": "bearer",
+        "expires_in": JWT_ACCESO_TTL,
+    }
+
+
+def _no_autorizado(detalle: str):
+    return HTTPException(status_code=401, detail=detalle, headers={"WWW-Authenticate": "Bearer"})
+
+
+def decodificar_token(token: str, tipo: str = "access") -> dict:
+    try:
+        cabecera_b64, cuerpo_b64, firma_b64 = token.split(".")
+        cabecera = json.loads(_b64_decode(cabecera_b64))
+        clave = claves.clave(cabecera.get("kid"))
+        if clave is None or cabecera.get("alg") != "HS256":
+            raise _no_autorizado("Token inválido")
+        esperada = hmac.new(clave, f"{cabecera_b64}.{cuerpo_b64}".encode("ascii"), hashlib.sha256).digest()
+        if not hmac.compare_digest(esperada, _b64_decode(firma_b64)):
+            raise _no_autorizado("Token inválido")
+        payload = json.loads(_b64_decode(cuerpo_b64))
+    except HTTPException:
+        raise
+    except (ValueError, TypeError, AttributeError):
+        raise _no_autorizado("Token inválido")
+
+    if payload.get("typ") != tipo or payload.get("iss") != JWT_EMISOR:
+        raise _no_autorizado("Token inválido")
+    if payload.get("exp", 0) < time.time():
+        raise _no_autorizado("Token expirado")
+    return payload
+
+
+# -------------------- DEPENDENCIAS --------------------
+_bearer = HTTPBearer(auto_error=False)
+
+
+async def usuario_actual(credenciales: HTTPAuthorizationCredentials = Depends(_bearer)) -> dict:
+    # Valida el token sin tocar la base de datos ni bcrypt
+    if credenciales is None:
+        raise _no_autorizado("No autenticado")
+    return decodificar_token(credenciales.credentials)
+
+
+async def usuario_opcional(credenciales: HTTPAuthorizationCredentials = Depends(_bearer)):
+    # Como usuario_actual, pero sin token devuelve None en vez de 401
+    if credenciales is None:
+        return None
+    return decodificar_token(credenciales.credentials)
+
+
+def requiere_rol(*roles):
+    async def dependencia(usuario: dict = Depends(usuario_actual)) -> dict:
+        if usuario.get("rol") not in roles:
+            raise HTTPException(status_code=403, detail="No tiene permisos para esta operación")
+        return usuario
+    return dependencia
+
+
+def verificar_acceso(usuario: dict, rut: str):
+    # El dueño del recurso o cualquier trabajador puede acceder
+    if usuario.get("sub") != rut and usuario.get("rol") not in ROLES_PERSONAL:
+        raise HTTPException(status_code=403, detail="No tiene permisos para esta operación")
+
+
+def verificar_escritura(usuario: dict, rut: str):
+    # Modificar una cuenta (datos o clave): solo el dueño o un administrador.
+    # El resto del personal puede leerla (verificar_acceso), no cambiarla.
+    if usuario.get("sub") != rut and usuario.get("rol") != "administrador":
+        raise HTTPException(status_code=403, detail="No tiene permisos para esta operación")
+
+
+# -------------------- ROTACIÓN DE CLAVES (CLI) --------------------
+def rotar_claves(ruta: str):
+    # Agrega una clave nueva como activa y conserva las últimas anteriores
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            datos = json.load(archivo)
+    except FileNotFoundError:
+        datos = {"activa": None, "claves": {}}
+
+    kid = time.strftime("k%Y%m%d%H%M%S")
+    datos["claves"][kid] = secrets.token_urlsafe(48)
+    datos["activa"] = kid
+    retenidas = list(datos["claves"])[-JWT_CLAVES_RETENIDAS:]
+    datos["claves"] = {k: datos["claves"][k] for k in retenidas}
+
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        json.dump(datos, archivo, indent=2)
+    return kid
+
+
+if __name__ == "__main__":
+    # python -m app.seguridad rotar [ruta]
+    if len(sys.argv) < 2 or sys.argv[1] != "rotar":
+        sys.exit("Uso: python -m app.seguridad rotar [ruta_archivo_claves]")
+    ruta = sys.argv[2] if len(sys.argv) > 2 else JWT_CLAVES_ARCHIVO
+    if not ruta:
+        sys.exit("Indique la ruta del archivo de claves o configure JWT_CLAVES_ARCHIVO")
+    print(f"Nueva clave activa: {rotar_claves(ruta)}")
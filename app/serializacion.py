@@ -0,0 +1,79 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from app.metricas import medir
+
+# Formato de fechas de la API. Las consultas de listas lo aplican con TO_CHAR
+# en Oracle, así que las filas ya llegan con texto y no hay strftime por fila.
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+_FORMATO_FECHA_SQL = "YYYY-MM-DD HH24:MI:SS"
+
+
+def fecha_sql(columna: str, alias: str = None) -> str:
+    # fecha_sql("p.fecha_pago") -> "TO_CHAR(p.fecha_pago, '...') AS fecha_pago"
+    alias = alias or columna.rsplit(".", 1)[-1]
+    return f"TO_CHAR({columna}, '{_FORMATO_FECHA_SQL}') AS {alias}"
+
+
+def _por_defecto(valor):
+    # Tipos que orjson no serializa solo (o no con el formato de la API)
+    if isinstance(valor, datetime):
+        return valor.strftime(FORMATO_FECHA)
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError
+
+
+_OPCIONES = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def a_json(contenido) -> bytes:
+    with medir("serializacion"):
+        return orjson.dumps(contenido, default=_por_defecto, option=_OPCIONES)
+
+
+# -------------------- RESPUESTAS --------------------
+class RespuestaJSON(JSONResponse):
+    # Respuesta por defecto de la aplicación: igual que JSONResponse pero
+    # serializada con orjson. Las fechas se escriben en FORMATO_FECHA.
+    def render(self, content) -> bytes:
+        return a_json(content)
+
+
+def respuesta_json(contenido, response: Response = None, status_code: int = 200) -> Response:
+    # Serializa directo a bytes, sin pasar por jsonable_encoder ni por el
+    # response_model. Si se indica la response inyectada en el handler, se
+    # conservan sus headers (ETag, Cache-Control, ...).
+    respuesta = Response(
+        content=a_json(contenido),
+        media_type="application/json",
+        status_code=status_code
+    )
+    if response is not None:
+        respuesta.headers.raw.extend(response.headers.raw)
+    return respuesta
+
+
+# -------------------- FILAS COMO REGISTROS --------------------
+def como_registros(cursor, **transformaciones):
+    # Se llama después de execute: desde ahí cada fila sale como dict
+    # {columna: valor} usando los alias de la consulta, listo para orjson.
+    # transformaciones: columna -> función aplicada a ese valor.
+    columnas = [c.name.lower() for c in cursor.description]
+    if not transformaciones:
+        cursor.rowfactory = lambda *fila: dict(zip(columnas, fila))
+        return
+
+    def fabrica(*fila):
+        registro = dict(zip(columnas, fila))
+        for columna, funcion in transformaciones.items():
+            registro[columna] = funcion(registro[columna])
+        return registro
+
+    cursor.rowfactory = fabrica
@@ -0,0 +1,4 @@
+import os
+
+# Los benchmarks firman tokens sin JWT_CLAVES configurado (ver app.seguridad)
+os.environ.setdefault("JWT_CLAVE_TEMPORAL", "1")
@@ -0,0 +1,91 @@
+"""Tiempo de arranque de un worker: importación de app.main y calentamiento.
+
+* Importación: se mide en procesos nuevos (como un worker recién creado) y se
+  compara la mediana con ``ARRANQUE_IMPORT_MAX_MS``; con ``-X importtime`` se
+  listan los módulos que más aportan.
+* Calentamiento: ejecuta ``arranque.calentar()`` contra el driver falso y
+  muestra cuánto tarda cada paso (pool, caché de referencia, hashing).
+
+Termina con código 1 si la importación supera el presupuesto, así que sirve
+como chequeo en CI.
+
+Uso::
+
+    python -m benchmarks.arranque --repeticiones 5 --latencia 0.005
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+
+_MEDIR = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def _importacion(repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-c", _MEDIR], capture_output=True, text=True, check=True)
+        tiempos.append(float(salida.stdout.strip().splitlines()[-1]) * 1000)
+    return tiempos
+
+
+def _modulos_pesados(cantidad):
+    # Líneas de -X importtime: "import time: self | cumulative | paquete"
+    salida = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                            capture_output=True, text=True, check=True)
+    modulos = []
+    for linea in salida.stderr.splitlines():
+        partes = linea.split("|")
+        if len(partes) != 3 or not partes[0].strip().split()[-1].isdigit():
+            continue
+        modulos.append((int(partes[0].split()[-1]), int(partes[1]), partes[2].strip()))
+    return sorted(modulos, reverse=True)[:cantidad]
+
+
+async def _calentamiento(latencia):
+    import app.database as database
+    from app import arranque
+    import app.main  # noqa: F401  (los routers registran sus consultas)
+    from benchmarks.fake_oracle import FakeAsyncPool
+
+    database._pool = FakeAsyncPool(latencia)
+    # El plan_table del driver falso no tiene sentido
+    arranque.VERIFICAR_PLANES = False
+    try:
+        await arranque.calentar()
+        return arranque.estado_arranque()
+    finally:
+        arranque.detener()
+        from app.hashing import cerrar_executor
+        cerrar_executor()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--latencia", type=float, default=0.005, help="segundos por viaje del driver falso")
+    parser.add_argument("--modulos", type=int, default=10, help="módulos más lentos a listar")
+    args = parser.parse_args()
+
+    from app.arranque import ARRANQUE_IMPORT_MAX_MS
+
+    tiempos = _importacion(args.repeticiones)
+    mediana = statistics.median(tiempos)
+    print(f"importación app.main: mediana {mediana:7.1f} ms  (mín {min(tiempos):.1f}, máx {max(tiempos):.1f}, "
+          f"presupuesto {ARRANQUE_IMPORT_MAX_MS:.0f} ms)")
+    print("módulos con más tiempo propio:")
+    for propio, acumulado, nombre in _modulos_pesados(args.modulos):
+        print(f"  {propio / 1000:7.1f} ms propio  {acumulado / 1000:7.1f} ms acumulado  {nombre}")
+
+    estado = asyncio.run(_calentamiento(args.latencia))
+    print(f"calentamiento: {estado['calentamiento_ms']} ms  listo={estado['listo']}")
+    for paso, datos in estado["pasos"].items():
+        print(f"  {paso:17} {datos['ms']:7.1f} ms  {datos.get('resultado', datos.get('error'))}")
+
+    if mediana > ARRANQUE_IMPORT_MAX_MS:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Prueba de carga de todas las rutas de usuarios, pagos y despacho.
+
+La dependencia ``get_conexion`` se reemplaza por conexiones del driver falso
+de ``fake_oracle`` (y ``app.database._pool`` apunta al mismo pool para el
+código que usa ``conexion()`` directamente). Cada ruta se ejecuta
+``--peticiones`` veces con ``--concurrencia`` peticiones en vuelo y se
+reporta throughput, latencia p50/p95/p99 y viajes a la base por petición.
+
+Los resultados se pueden guardar como línea base JSON y comparar contra una
+anterior; la comparación termina con código 1 si alguna ruta empeora más de
+``--tolerancia`` (latencia p95 o throughput) o hace más viajes que antes::
+
+    python -m benchmarks.carga --guardar benchmarks/lineas_base/local.json
+    python -m benchmarks.carga --comparar benchmarks/lineas_base/local.json
+
+Las cifras de latencia dependen de la máquina; los viajes por petición no.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+
+import httpx
+
+import app.database as database
+from app import admision, cache_referencia, hashing, seguridad
+from app.escritura_diferida import EscrituraDiferida
+from app.routers import despacho
+from app.database import get_conexion
+from app.main import app
+from benchmarks.fake_oracle import CLAVE_FALSA, FakeAsyncPool
+
+PREFIJOS = ("/usuarios", "/pagos", "/despacho")
+
+RUT = "rut_0"          # el driver falso devuelve ruts rut_0, rut_1, ...
+EMAIL = "email_0"
+
+TRABAJADOR = {
+    "rut": "11111111-1", "nombre": "Ana", "apellido": "Soto", "email": "ana@ferremas.cl",
+    "telefono": 912345678, "clave": "secreta", "rol": "vendedor", "id_comuna": 1,
+}
+LOTE_PAGOS = [{"rut_usuario": RUT, "id_tipo_pago": 1, "monto": 1000} for _ in range(20)]
+LOTE_TRABAJADORES = [{**TRABAJADOR, "rut": f"2000000{i}-{i}", "email": f"t{i}@ferremas.cl"} for i in range(5)]
+
+# Rutas que pasan por bcrypt: su concurrencia se limita a la cola del executor
+# de hashing para medir el hash y no solo los rechazos 503
+RUTAS_BCRYPT = {
+    "GET /usuarios/login", "PUT /usuarios/cambiar-clave", "POST /usuarios/registro-cliente",
+    "POST /usuarios/registro-trabajador", "POST /usuarios/registro-administrador",
+    "PATCH /usuarios/modificar-clave/{rut}",
+}
+
+# (método, ruta registrada, ruta a llamar, opciones de httpx)
+ESCENARIOS = [
+    ("GET", "/usuarios/login", "/usuarios/login", {"params": {"email": EMAIL, "clave": CLAVE_FALSA}}),
+    ("POST", "/usuarios/token/refrescar", "/usuarios/token/refrescar", {"json": "refresh_token"}),
+    ("PUT", "/usuarios/cambiar-clave", "/usuarios/cambiar-clave", {"json": {"email": EMAIL, "nueva_clave": "otra"}}),
+    ("GET", "/usuarios/usuarios", "/usuarios/usuarios", {}),
+    ("GET", "/usuarios/usuarios/exportar", "/usuarios/usuarios/exportar", {}),
+    ("GET", "/usuarios/comuna", "/usuarios/comuna", {}),
+    ("GET", "/usuarios/administrador", "/usuarios/administrador", {}),
+    ("GET", "/usuarios/usuario/{rut_buscar}", f"/usuarios/usuario/{RUT}", {}),
+    ("POST", "/usuarios/registro-cliente", "/usuarios/registro-cliente",
+     {"params": {k: v for k, v in TRABAJADOR.items() if k != "rol"}}),
+    ("POST", "/usuarios/registro-trabajador", "/usuarios/registro-trabajador", {"json": TRABAJADOR}),
+    ("POST", "/usuarios/registro-trabajador/importar", "/usuarios/registro-trabajador/importar",
+     {"json": LOTE_TRABAJADORES}),
+    ("POST", "/usuarios/registro-administrador", "/usuarios/registro-administrador", {"json": TRABAJADOR}),
+    ("PATCH", "/usuarios/modificar/{rut}", f"/usuarios/modificar/{RUT}", {"json": {"nombre": "Ana María"}}),
+    ("DELETE", "/usuarios/eliminar/{rut}", f"/usuarios/eliminar/{RUT}", {}),
+    ("GET", "/usuarios/buscar-usuario-por-email/", "/usuarios/buscar-usuario-por-email/", {"params": {"email": EMAIL}}),
+    ("PATCH", "/usuarios/modificar-clave/{rut}", f"/usuarios/modificar-clave/{RUT}", {"json": {"clave": "otra"}}),
+    ("POST", "/pagos/", "/pagos/", {"params": {"rut_usuario": RUT, "id_tipo_pago": 1, "monto": 1000}}),
+    ("POST", "/pagos/batch", "/pagos/batch", {"json": LOTE_PAGOS}),
+    ("GET", "/pagos/", "/pagos/", {}),
+    ("GET", "/pagos/exportar", "/pagos/exportar", {}),
+    # Sin pyarrow responde 501; con él, la primera petición calcula y el resto sale de lo guardado
+    ("GET", "/pagos/analytics", "/pagos/analytics", {"params": {"intervalo": "mes"}}),
+    ("GET", "/pagos/{rut}/resumen", f"/pagos/{RUT}/resumen", {}),
+    ("GET", "/pagos/{rut}", f"/pagos/{RUT}", {}),
+    ("DELETE", "/pagos/{id_pago}", "/pagos/1", {}),
+    ("GET", "/despacho/", "/despacho/", {}),
+    ("GET", "/despacho/exportar", "/despacho/exportar", {}),
+    ("GET", "/despacho/usuario/{rut}", f"/despacho/usuario/{RUT}", {}),
+    ("POST", "/despacho/", "/despacho/", {"params": {"rut_usuario": RUT, "tipo": "retiro en tienda", "sucursal": "Centro"}}),
+    ("DELETE", "/despacho/{id_despacho}", "/despacho/1", {}),
+    # El id se crea al medir (ver _seguimiento)
+    ("GET", "/despacho/seguimiento/{seguimiento}", "/despacho/seguimiento/{seguimiento}", {}),
+]
+
+
+def _seguimiento():
+    # Encola un despacho para tener un id de seguimiento conocido. Sin
+    # DESPACHO_DIFERIDO=1 se usa una cola propia que nunca se vuelca; se
+    # quita después de medir para no cambiar el POST /despacho/ de otras rutas.
+    anterior = despacho._diferida
+    if anterior is None:
+        despacho._diferida = EscrituraDiferida("despacho", despacho._SQL_INSERTAR, despacho._ERRORES_DESPACHO)
+    seguimiento = despacho._diferida.encolar(
+        {"rut": RUT, "tipo": "retiro en tienda", "direccion": None, "sucursal": "Centro"}, dueno=RUT
+    )
+    return seguimiento, anterior
+
+
+def _rutas_sin_escenario():
+    cubiertas = {(metodo, ruta) for metodo, ruta, _, _ in ESCENARIOS}
+    faltantes = []
+    for ruta, operaciones in app.openapi()["paths"].items():
+        if not ruta.startswith(PREFIJOS):
+            continue
+        for metodo in operaciones:
+            if (metodo.upper(), ruta) not in cubiertas:
+                faltantes.append(f"{metodo.upper()} {ruta}")
+    return faltantes
+
+
+def _percentil(valores, p):
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1] if len(valores) > 1 else valores[0]
+
+
+async def _medir_ruta(cliente, pool, metodo, ruta, opciones, peticiones, concurrencia):
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias, estados = [], {}
+
+    async def una():
+        async with semaforo:
+            inicio = time.perf_counter()
+            respuesta = await cliente.request(metodo, ruta, **opciones)
+            await respuesta.aread()
+            latencias.append(time.perf_counter() - inicio)
+            estados[respuesta.status_code] = estados.get(respuesta.status_code, 0) + 1
+
+    pool.viajes = 0
+    inicio = time.perf_counter()
+    await asyncio.gather(*(una() for _ in range(peticiones)))
+    duracion = time.perf_counter() - inicio
+    return {
+        "peticiones": peticiones,
+        "concurrencia": concurrencia,
+        "rps": round(peticiones / duracion, 1),
+        "p50_ms": round(_percentil(latencias, 50) * 1000, 2),
+        "p95_ms": round(_percentil(latencias, 95) * 1000, 2),
+        "p99_ms": round(_percentil(latencias, 99) * 1000, 2),
+        "viajes_por_peticion": round(pool.viajes / peticiones, 2),
+        "estados": {str(k): v for k, v in sorted(estados.items())},
+    }
+
+
+def _comparar(resultados, base, tolerancia):
+    regresiones = []
+    for nombre, actual in resultados.items():
+        anterior = base.get(nombre)
+        if anterior is None:
+            continue
+        if actual["viajes_por_peticion"] > anterior["viajes_por_peticion"]:
+            regresiones.append(f"{nombre}: viajes {anterior['viajes_por_peticion']} -> {actual['viajes_por_peticion']}")
+        if actual["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p95 {anterior['p95_ms']} ms -> {actual['p95_ms']} ms")
+        if actual["rps"] < anterior["rps"] * (1 - tolerancia):
+            regresiones.append(f"{nombre}: rps {anterior['rps']} -> {actual['rps']}")
+    return regresiones
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peticiones", type=int, default=100, help="peticiones por ruta")
+    parser.add_argument("--peticiones-bcrypt", type=int, default=20,
+                        help="peticiones por ruta que encripta o verifica claves (cada una cuesta ~0.3 s de CPU)")
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--latencia", type=float, default=0.005, help="segundos por viaje a la base")
+    parser.add_argument("--latencia-fila", type=float, default=0.00001, help="segundos por fila transferida")
+    parser.add_argument("--pool-max", type=int, default=20)
+    parser.add_argument("--filas", type=int, default=5, help="filas de una búsqueda por clave")
+    parser.add_argument("--tablas", default="usuario=5000,pago=50000,tipo_despacho=20000,comuna=350,tipo_pago=4",
+                        help="tamaños de tabla: nombre=filas,...")
+    parser.add_argument("--rutas", default="", help="solo las rutas que contengan este texto")
+    parser.add_argument("--guardar", help="archivo JSON donde guardar la línea base")
+    parser.add_argument("--comparar", help="línea base JSON contra la cual comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.5, help="empeoramiento permitido (0.5 = 50%%)")
+    args = parser.parse_args()
+
+    tablas = dict((nombre, int(filas)) for nombre, filas in (t.split("=") for t in args.tablas.split(",") if t))
+    pool = FakeAsyncPool(args.latencia, args.filas, max=args.pool_max, tablas=tablas, latencia_fila=args.latencia_fila)
+
+    async def conexion_falsa():
+        cone = await pool.acquire()
+        try:
+            yield cone
+        finally:
+            await pool.release(cone)
+
+    app.dependency_overrides[get_conexion] = conexion_falsa
+    database._pool = pool
+    await cache_referencia.precargar()
+    await database.cargar_restricciones()
+    # Se mide la capacidad de cada ruta, no el control de admisión: ninguna
+    # clase limita por debajo de --concurrencia ni rechaza con 503
+    for nombre in admision.CLASES:
+        admision.CLASES[nombre] = admision.ClaseAdmision(nombre, args.concurrencia, args.concurrencia)
+
+    faltantes = _rutas_sin_escenario()
+    if faltantes:
+        print("Rutas sin escenario:", ", ".join(faltantes), file=sys.stderr)
+
+    tokens = seguridad.crear_tokens(RUT, "administrador", EMAIL)
+    resultados = {}
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://carga", timeout=None,
+                                 headers={"Authorization": f"Bearer {tokens['access_token']}"}) as cliente:
+        for metodo, registrada, ruta, opciones in ESCENARIOS:
+            nombre = f"{metodo} {registrada}"
+            if args.rutas not in nombre:
+                continue
+            if opciones.get("json") == "refresh_token":
+                opciones = {"json": {"refresh_token": tokens["refresh_token"]}}
+            peticiones, concurrencia = args.peticiones, args.concurrencia
+            if nombre in RUTAS_BCRYPT:
+                peticiones = args.peticiones_bcrypt
+                concurrencia = min(concurrencia, hashing.HASH_MAX_PENDIENTES)
+            elif nombre == "POST /usuarios/registro-trabajador/importar":
+                # cada importación ocupa un lugar de la cola por worker
+                peticiones = args.peticiones_bcrypt
+                concurrencia = min(concurrencia, max(hashing.HASH_MAX_PENDIENTES // hashing.HASH_WORKERS, 1))
+            if "{seguimiento}" in ruta:
+                seguimiento, anterior = _seguimiento()
+                ruta = ruta.format(seguimiento=seguimiento)
+                try:
+                    resultados[nombre] = await _medir_ruta(cliente, pool, metodo, ruta, opciones, peticiones,
+                                                           concurrencia)
+                finally:
+                    despacho._diferida = anterior
+            else:
+                resultados[nombre] = await _medir_ruta(cliente, pool, metodo, ruta, opciones, peticiones, concurrencia)
+            r = resultados[nombre]
+            print(f"{nombre:48} {r['rps']:8.1f} req/s  p50 {r['p50_ms']:7.2f}  p95 {r['p95_ms']:7.2f}  "
+                  f"p99 {r['p99_ms']:7.2f} ms  viajes {r['viajes_por_peticion']:5.2f}  {r['estados']}")
+
+    app.dependency_overrides.pop(get_conexion, None)
+    hashing.cerrar_executor()
+
+    configuracion = {k: v for k, v in vars(args).items() if k not in ("guardar", "comparar", "rutas", "tolerancia")}
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as archivo:
+            json.dump({"configuracion": configuracion, "python": platform.python_version(),
+                       "rutas": resultados}, archivo, indent=2, ensure_ascii=False)
+            archivo.write("\n")
+        print(f"Línea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            base = json.load(archivo)
+        if base["configuracion"] != configuracion:
+            print("Aviso: la línea base se midió con otra configuración:", base["configuracion"], file=sys.stderr)
+        regresiones = _comparar(resultados, base["rutas"], args.tolerancia)
+        for regresion in regresiones:
+            print("REGRESIÓN", regresion)
+        if regresiones:
+            sys.exit(1)
+        print("Sin regresiones respecto de", args.comparar)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
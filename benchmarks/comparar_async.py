@@ -0,0 +1,86 @@
+"""Compara el camino síncrono (threadpool) con el asíncrono (asyncio) de la API.
+
+Ambos lados usan el driver falso de ``fake_oracle`` con la misma latencia por
+consulta y el mismo tamaño de pool, de modo que la única diferencia es cómo
+se espera a la base de datos:
+
+* ``sync``: handler ``def`` que bloquea un hilo del threadpool de Starlette
+  por cada consulta (como estaban los routers antes).
+* ``async``: ``GET /despacho/`` de la aplicación real, que espera con
+  ``await`` sobre el pool asíncrono.
+
+Uso::
+
+    python -m benchmarks.comparar_async --peticiones 2000 --concurrencia 200 --latencia 0.1
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+import app.database as database
+from app import seguridad
+from app.main import app as app_real
+from benchmarks.fake_oracle import FakeAsyncPool, FakePool
+
+
+def _app_sync(pool):
+    # Réplica del handler obtener_despachos antes de la migración a asyncio
+    app_sync = FastAPI()
+
+    @app_sync.get("/despacho/")
+    def obtener_despachos():
+        cone = pool.acquire()
+        try:
+            with cone.cursor() as cursor:
+                cursor.execute("SELECT id, rut_usuario, tipo, direccion, sucursal FROM tipo_despacho")
+                return [
+                    {"id": id_, "rut_usuario": rut, "tipo": tipo, "direccion": direccion, "sucursal": sucursal}
+                    for id_, rut, tipo, direccion, sucursal in cursor
+                ]
+        finally:
+            pool.release(cone)
+
+    return app_sync
+
+
+async def _medir(aplicacion, peticiones, concurrencia):
+    transporte = httpx.ASGITransport(app=aplicacion)
+    semaforo = asyncio.Semaphore(concurrencia)
+    # GET /despacho/ es solo para personal
+    token = seguridad.crear_tokens("11111111-1", "administrador", "bench@ferremas.cl")["access_token"]
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench",
+                                 headers={"Authorization": f"Bearer {token}"}) as cliente:
+        async def una():
+            async with semaforo:
+                respuesta = await cliente.get("/despacho/")
+                respuesta.raise_for_status()
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(una() for _ in range(peticiones)))
+        return peticiones / (time.perf_counter() - inicio)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peticiones", type=int, default=1000)
+    parser.add_argument("--concurrencia", type=int, default=200)
+    parser.add_argument("--latencia", type=float, default=0.1, help="segundos por consulta")
+    parser.add_argument("--pool-max", type=int, default=100)
+    parser.add_argument("--filas", type=int, default=5, help="filas devueltas por consulta")
+    args = parser.parse_args()
+
+    rps_sync = await _medir(_app_sync(FakePool(args.latencia, args.filas, max=args.pool_max)), args.peticiones, args.concurrencia)
+
+    database._pool = FakeAsyncPool(args.latencia, args.filas, max=args.pool_max)
+    rps_async = await _medir(app_real, args.peticiones, args.concurrencia)
+
+    print(f"sync  (threadpool): {rps_sync:8.1f} req/s")
+    print(f"async (asyncio)   : {rps_async:8.1f} req/s")
+    print(f"mejora            : {rps_async / rps_sync:8.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
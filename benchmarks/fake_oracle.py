@@ -0,0 +1,382 @@
+"""Driver Oracle falso, en proceso, con latencia inyectada por consulta.
+
+Imita la parte de python-oracledb que usa la API (pool, conexión y cursor)
+tanto en su variante asíncrona como en la síncrona, para poder medir la
+aplicación sin una base de datos Oracle XE real.
+"""
+import asyncio
+import collections
+import datetime
+import re
+import threading
+import time
+
+import bcrypt
+import oracledb
+
+try:
+    import pyarrow as pa
+except ImportError:     # opcional: solo lo usa fetch_df_all (GET /pagos/analytics)
+    pa = None
+
+FILAS_POR_DEFECTO = 50
+
+# Todas las filas de usuario tienen esta clave (bcrypt de costo bajo), así el
+# login se puede medir completo
+CLAVE_FALSA = "clave"
+_HASH_FALSO = bcrypt.hashpw(CLAVE_FALSA.encode("utf-8"), bcrypt.gensalt(4)).decode("utf-8")
+
+
+# Restricciones del esquema de app/migraciones, como las devuelve
+# user_constraints + user_cons_columns
+RESTRICCIONES = [
+    ("PK_PAGO", "P", "PAGO", "ID_PAGO"),
+    ("PK_TIPO_DESPACHO", "P", "TIPO_DESPACHO", "ID"),
+    ("PK_USUARIO", "P", "USUARIO", "RUT"),
+    ("UK_USUARIO_EMAIL", "U", "USUARIO", "EMAIL"),
+    ("FK_USUARIO_COMUNA", "R", "USUARIO", "ID_COMUNA"),
+    ("FK_PAGO_USUARIO", "R", "PAGO", "RUT_USUARIO"),
+    ("FK_PAGO_TIPO_PAGO", "R", "PAGO", "ID_TIPO_PAGO"),
+    ("FK_DESPACHO_USUARIO", "R", "TIPO_DESPACHO", "RUT_USUARIO"),
+]
+
+
+# -------------------- GENERACIÓN DE FILAS --------------------
+def _columnas(sql):
+    # Devuelve los alias de la lista SELECT (a nivel de paréntesis 0)
+    texto = " ".join(sql.split())
+    coincidencia = re.search(r"SELECT\s+(?:DISTINCT\s+)?(.*?)\s+FROM\s", texto, re.I)
+    if not coincidencia:
+        return []
+    columnas, actual, nivel = [], "", 0
+    for caracter in coincidencia.group(1):
+        if caracter == "(":
+            nivel += 1
+        elif caracter == ")":
+            nivel -= 1
+        if caracter == "," and nivel == 0:
+            columnas.append(actual)
+            actual = ""
+        else:
+            actual += caracter
+    columnas.append(actual)
+    return [c.strip().split()[-1].split(".")[-1].lower() for c in columnas]
+
+
+def _valor(columna, i):
+    if "fecha" in columna or columna == "mes":
+        return datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=i)
+    if columna in ("1", "count(*)") or columna.startswith("id") or columna in ("monto", "telefono", "requiere_cambio", "cantidad", "total"):
+        return i + 1
+    if columna == "clave":
+        return _HASH_FALSO
+    return f"{columna}_{i}"
+
+
+def generar_filas(sql, cantidad, ciclos=None):
+    # ciclos: columna -> cantidad de valores distintos (p. ej. las claves
+    # foráneas hacia tablas chicas se repiten como en datos reales)
+    columnas = _columnas(sql)
+    if not columnas:
+        return []
+    ciclos = ciclos or {}
+    return [tuple(_valor(c, i % ciclos[c] if c in ciclos else i) for c in columnas) for i in range(cantidad)]
+
+
+# -------------------- ERRORES --------------------
+class FakeError:
+    # Lo que usa la API del _Error del driver (ex.args[0] o getbatcherrors())
+    def __init__(self, code, message, offset=0, full_code=None):
+        self.code = code
+        self.message = message
+        self.offset = offset
+        self.full_code = full_code or f"ORA-{code:05d}"
+
+
+# -------------------- VARIANTE ASÍNCRONA --------------------
+class FakeVar:
+    # Variable de salida para RETURNING ... INTO
+    def __init__(self, tipo):
+        self.tipo = tipo
+        self._valor = []
+        self._por_fila = None   # executemany: un valor por fila del lote
+
+    def getvalue(self, pos=0):
+        return self._valor if self._por_fila is None else self._por_fila[pos]
+
+
+class FakeColumna:
+    # Lo que usa la API de cursor.description (FetchInfo)
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeAsyncCursor:
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.arraysize = 100
+        self.prefetchrows = 2
+        self.rowcount = 0
+        self.description = None
+        self.rowfactory = None
+        self._filas = collections.deque()
+        self._en_buffer = 0
+        self._tamanos = {}
+        self._errores_lote = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._filas = collections.deque()
+
+    def var(self, tipo, *args, **kwargs):
+        return FakeVar(tipo)
+
+    def setinputsizes(self, *args, **kwargs):
+        self._tamanos = kwargs
+
+    async def execute(self, sql, parameters=None, **kwargs):
+        # El execute trae de una vez las primeras prefetchrows filas; el resto
+        # se pide en viajes de arraysize filas a medida que se consumen.
+        filas = self.conexion.pool.filas_para(sql, parameters)
+        self._en_buffer = min(self.prefetchrows, len(filas))
+        await self.conexion.viaje(self._en_buffer)
+        self.conexion.pool.fallar_si_corresponde(sql)
+        self._filas = collections.deque(filas)
+        self.rowcount = len(self._filas) or 1
+        self.description = [FakeColumna(c.upper()) for c in _columnas(sql)] or None
+        self.rowfactory = None
+        # En un bloque PL/SQL las variables de salida son escalares; en un
+        # RETURNING de DML, listas
+        plsql = sql.lstrip().upper().startswith(("DECLARE", "BEGIN"))
+        for valor in (parameters.values() if isinstance(parameters, dict) else ()):
+            if isinstance(valor, FakeVar):
+                valor._valor = 1 if plsql else [1]
+
+    async def parse(self, sql):
+        await self.conexion.viaje()
+        self.conexion.pool.fallar_si_corresponde(sql, self.conexion.pool.errores_parse, oracledb.DatabaseError)
+
+    async def executemany(self, sql, parameters, batcherrors=False, **kwargs):
+        await self.conexion.viaje(len(parameters))
+        self.conexion.pool.fallar_si_corresponde(sql)
+        self._filas = collections.deque()
+        self._errores_lote = self.conexion.pool.errores_de_lote(sql, len(parameters)) if batcherrors else []
+        self.rowcount = len(parameters) - len(self._errores_lote)
+        # RETURNING ... INTO en array DML: una lista de valores por fila
+        for variable in self._tamanos.values():
+            if isinstance(variable, FakeVar):
+                variable._por_fila = [[_valor("fecha", i)] for i in range(len(parameters))]
+        self._tamanos = {}
+
+    def getbatcherrors(self):
+        return self._errores_lote
+
+    def _fabricar(self, filas):
+        if self.rowfactory is None:
+            return filas
+        return [self.rowfactory(*fila) for fila in filas]
+
+    async def _traer(self, cantidad=None):
+        salida = []
+        while self._filas and (cantidad is None or len(salida) < cantidad):
+            if self._en_buffer == 0:
+                self._en_buffer = min(self.arraysize, len(self._filas))
+                await self.conexion.viaje(self._en_buffer)
+            salida.append(self._filas.popleft())
+            self._en_buffer -= 1
+        return self._fabricar(salida)
+
+    async def fetchone(self):
+        filas = await self._traer(1)
+        return filas[0] if filas else None
+
+    async def fetchall(self):
+        return await self._traer()
+
+    async def fetchmany(self, size=None):
+        return await self._traer(size or self.arraysize)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        filas = await self._traer(1)
+        if not filas:
+            raise StopAsyncIteration
+        return filas[0]
+
+
+class FakeAsyncConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeAsyncCursor(self)
+
+    async def viaje(self, filas=0):
+        # Cada llamada al servidor cuenta como un viaje de ida y vuelta; las
+        # filas transferidas suman latencia_fila cada una
+        self.pool.viajes += 1
+        await asyncio.sleep(self.pool.latencia + filas * self.pool.latencia_fila)
+
+    async def commit(self):
+        await self.viaje()
+
+    async def rollback(self):
+        pass
+
+    async def fetch_df_all(self, statement, parameters=None, arraysize=100, **kwargs):
+        # Como el driver: el execute y cada bloque de arraysize filas son un
+        # viaje; devuelve una tabla Arrow con los nombres en mayúsculas
+        filas = self.pool.filas_para(statement, parameters)
+        for inicio in range(0, max(len(filas), 1), arraysize):
+            await self.viaje(min(arraysize, len(filas) - inicio))
+        columnas = _columnas(statement)
+        return pa.table({columna.upper(): [fila[i] for fila in filas] for i, columna in enumerate(columnas)})
+
+
+class FakeAsyncPool:
+    # latencia: segundos por viaje; filas: filas de una búsqueda por clave
+    # (WHERE col = :x) o de una tabla sin tamaño declarado; tablas: tamaño de
+    # cada tabla ({"pago": 100000}), que acota los recorridos y las páginas.
+    # respuestas: fragmento de SQL -> filas fijas; errores: fragmento de SQL ->
+    # (código ORA, mensaje), que el execute levanta como IntegrityError;
+    # errores_lote: fragmento de SQL -> {posición: (código ORA, mensaje)}, que
+    # executemany(batcherrors=True) informa por fila en getbatcherrors();
+    # errores_parse: como errores, pero los levanta cursor.parse() como
+    # DatabaseError (p. ej. ORA-00942 si falta una tabla).
+    def __init__(self, latencia=0.01, filas=FILAS_POR_DEFECTO, max=10, tablas=None, latencia_fila=0.0,
+                 wait_timeout=None):
+        self.latencia = latencia
+        self.latencia_fila = latencia_fila
+        self.filas = filas
+        self.tablas = {k.lower(): v for k, v in (tablas or {}).items()}
+        self._ciclos = {
+            columna: self.tablas[tabla]
+            for columna, tabla in (("id_comuna", "comuna"), ("id_tipo_pago", "tipo_pago")) if tabla in self.tablas
+        }
+        self.max = max
+        self.min = max
+        self.wait_timeout = wait_timeout    # ms, como POOL_GETMODE_TIMEDWAIT; None espera sin límite
+        self.opened = max
+        self.busy = 0
+        self.viajes = 0
+        self.respuestas = {"user_constraints": RESTRICCIONES}
+        self.errores = {}
+        self.errores_lote = {}
+        self.errores_parse = {}
+        self._semaforo = asyncio.Semaphore(max)
+
+    def filas_para(self, sql, binds=None):
+        for fragmento, filas in self.respuestas.items():
+            if fragmento in sql:
+                return list(filas)
+        return generar_filas(sql, self.cantidad_filas(sql, binds), self._ciclos)
+
+    def fallar_si_corresponde(self, sql, errores=None, tipo=oracledb.IntegrityError):
+        for fragmento, (codigo, mensaje) in (self.errores if errores is None else errores).items():
+            if fragmento in sql:
+                raise tipo(FakeError(codigo, mensaje))
+
+    def errores_de_lote(self, sql, filas):
+        for fragmento, errores in self.errores_lote.items():
+            if fragmento in sql:
+                return [FakeError(codigo, mensaje, posicion)
+                        for posicion, (codigo, mensaje) in sorted(errores.items()) if posicion < filas]
+        return []
+
+    def cantidad_filas(self, sql, binds=None):
+        columnas = _columnas(sql)
+        if any(c == "count(*)" or c.startswith(("max(", "sum(", "min(")) for c in columnas):
+            return 1
+        tabla = re.search(r"\bFROM\s+(\w+)", sql, re.I)
+        total = self.tablas.get(tabla.group(1).lower(), self.filas) if tabla else self.filas
+        # Igualdad o IN en el WHERE: búsqueda por clave, pocas filas
+        if re.search(r"\bWHERE\s+[\w.()]+\s*(?:=|IN\s*\()", sql, re.I):
+            total = min(total, self.filas)
+        if isinstance(binds, dict) and isinstance(binds.get("limite"), int):
+            total = min(total, binds["limite"])
+        return total
+
+    async def acquire(self):
+        espera = None if self.wait_timeout is None else self.wait_timeout / 1000
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), espera)
+        except asyncio.TimeoutError:
+            raise oracledb.DatabaseError(FakeError(
+                0, "DPY-4005: timed out waiting for the connection pool to return a connection", full_code="DPY-4005"
+            ))
+        self.busy += 1
+        return FakeAsyncConnection(self)
+
+    async def release(self, conexion):
+        self.busy -= 1
+        self._semaforo.release()
+
+    async def close(self, force=False):
+        pass
+
+
+# -------------------- VARIANTE SÍNCRONA --------------------
+class FakeCursor:
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.rowcount = 0
+        self._filas = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._filas = []
+
+    def execute(self, sql, parameters=None, **kwargs):
+        time.sleep(self.conexion.pool.latencia)
+        self._filas = generar_filas(sql, self.conexion.pool.filas)
+        self.rowcount = len(self._filas) or 1
+
+    def fetchone(self):
+        return self._filas.pop(0) if self._filas else None
+
+    def fetchall(self):
+        # Igual que la variante asíncrona: más allá de las 2 filas del
+        # prefetch, un viaje por cada 100 filas (arraysize por defecto)
+        filas, self._filas = self._filas, []
+        for _ in range(0, max(len(filas) - 2, 0), 100):
+            time.sleep(self.conexion.pool.latencia)
+        return filas
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        time.sleep(self.pool.latencia)
+
+
+class FakePool:
+    def __init__(self, latencia=0.01, filas=FILAS_POR_DEFECTO, max=10):
+        self.latencia = latencia
+        self.filas = filas
+        self.max = max
+        self._semaforo = threading.BoundedSemaphore(max)
+
+    def acquire(self):
+        self._semaforo.acquire()
+        return FakeConnection(self)
+
+    def release(self, conexion):
+        self._semaforo.release()
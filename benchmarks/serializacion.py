@@ -0,0 +1,86 @@
+"""Costo por fila de serializar una página de pagos: camino anterior vs actual.
+
+* ``anterior``: tupla -> dict armado a mano con ``strftime`` por fila ->
+  ``jsonable_encoder`` -> ``JSONResponse`` (``json.dumps``).
+* ``actual``: ``rowfactory`` de ``como_registros`` (la fecha ya viene como
+  texto desde Oracle) -> ``respuesta_json`` (orjson, directo a bytes).
+
+Uso::
+
+    python -m benchmarks.serializacion --filas 500 --repeticiones 200
+"""
+import argparse
+import datetime
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.serializacion import FORMATO_FECHA, como_registros, respuesta_json
+from benchmarks.fake_oracle import FakeColumna
+
+COLUMNAS = ["id_pago", "rut_usuario", "nombre", "apellido", "id_tipo_pago", "tipo_pago", "monto", "fecha_pago"]
+
+
+def _filas(cantidad, fecha_como_texto):
+    base = datetime.datetime(2024, 1, 1)
+    filas = []
+    for i in range(cantidad):
+        fecha = base + datetime.timedelta(minutes=i)
+        filas.append((
+            i, f"{i:08d}-K", f"Nombre {i}", f"Apellido {i}", i % 4 + 1, "Tarjeta", 1000.0 + i,
+            fecha.strftime(FORMATO_FECHA) if fecha_como_texto else fecha
+        ))
+    return filas
+
+
+def anterior(filas):
+    pagos = []
+    for fila in filas:
+        pagos.append({
+            "id_pago": fila[0],
+            "rut_usuario": fila[1],
+            "nombre": fila[2],
+            "apellido": fila[3],
+            "id_tipo_pago": fila[4],
+            "tipo_pago": fila[5],
+            "monto": fila[6],
+            "fecha_pago": fila[7].strftime(FORMATO_FECHA)
+        })
+    return JSONResponse(jsonable_encoder({"items": pagos, "siguiente": None})).body
+
+
+class _Cursor:
+    description = [FakeColumna(c.upper()) for c in COLUMNAS]
+    rowfactory = None
+
+
+def actual(filas):
+    # El driver aplica rowfactory al traer cada fila; aquí se imita ese paso
+    cursor = _Cursor()
+    como_registros(cursor)
+    registros = [cursor.rowfactory(*fila) for fila in filas]
+    return respuesta_json({"items": registros, "siguiente": None}).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=500)
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    filas_anterior = _filas(args.filas, fecha_como_texto=False)
+    filas_actual = _filas(args.filas, fecha_como_texto=True)
+    # Ambos caminos deben producir el mismo JSON
+    assert anterior(filas_anterior).replace(b" ", b"") == actual(filas_actual).replace(b" ", b"")
+
+    resultados = {}
+    for nombre, funcion, filas in (("anterior", anterior, filas_anterior), ("actual", actual, filas_actual)):
+        segundos = min(timeit.repeat(lambda: funcion(filas), number=args.repeticiones, repeat=3))
+        resultados[nombre] = segundos / args.repeticiones / args.filas * 1e6
+        print(f"{nombre:9}: {resultados[nombre]:6.2f} µs/fila")
+    print(f"mejora   : {resultados['anterior'] / resultados['actual']:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
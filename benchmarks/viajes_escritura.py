@@ -0,0 +1,69 @@
+"""Cuenta los viajes a la base de datos de cada endpoint de escritura.
+
+Usa el driver falso de ``fake_oracle``, que suma un viaje por cada
+``execute``, ``executemany`` o ``commit``. Las escrituras simples deben
+resolverse en un solo viaje (sin SELECT previo ni ``commit`` aparte); el
+script termina con código 1 si alguna supera ``--maximo``.
+
+Uso::
+
+    python -m benchmarks.viajes_escritura
+"""
+import argparse
+import asyncio
+import sys
+
+import httpx
+
+import app.database as database
+from app import cache_referencia, hashing, seguridad
+from app.main import app
+from benchmarks.fake_oracle import FakeAsyncPool
+
+USUARIO = {
+    "rut": "11111111-1", "nombre": "Ana", "apellido": "Soto", "email": "ana@ferremas.cl",
+    "telefono": 912345678, "clave": "secreta", "rol": "vendedor", "id_comuna": 1,
+}
+
+ESCRITURAS = [
+    ("POST", "/usuarios/registro-cliente", {"params": {k: v for k, v in USUARIO.items() if k != "rol"}}),
+    ("POST", "/usuarios/registro-trabajador", {"json": USUARIO}),
+    ("POST", "/usuarios/registro-administrador", {"json": USUARIO}),
+    ("PUT", "/usuarios/cambiar-clave", {"json": {"email": USUARIO["email"], "nueva_clave": "otra"}}),
+    ("PATCH", "/usuarios/modificar/11111111-1", {"json": {"nombre": "Ana María"}}),
+    ("PATCH", "/usuarios/modificar-clave/11111111-1", {"json": {"clave": "otra"}}),
+    ("DELETE", "/usuarios/eliminar/11111111-1", {}),
+    ("POST", "/pagos/", {"params": {"rut_usuario": "11111111-1", "id_tipo_pago": 1, "monto": 1000}}),
+    ("DELETE", "/pagos/1", {}),
+    ("POST", "/despacho/", {"params": {"rut_usuario": "11111111-1", "tipo": "retiro en tienda", "sucursal": "Centro"}}),
+    ("DELETE", "/despacho/1", {}),
+]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--maximo", type=int, default=1, help="viajes permitidos por escritura")
+    args = parser.parse_args()
+
+    pool = database._pool = FakeAsyncPool(latencia=0, filas=1)
+    await cache_referencia.precargar()
+    await database.cargar_restricciones()
+    token = seguridad.crear_tokens("11111111-1", "administrador", USUARIO["email"])["access_token"]
+
+    excedidas = 0
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench",
+                                 headers={"Authorization": f"Bearer {token}"}) as cliente:
+        for metodo, ruta, opciones in ESCRITURAS:
+            pool.viajes = 0
+            respuesta = await cliente.request(metodo, ruta, **opciones)
+            estado = "ok" if pool.viajes <= args.maximo else "EXCEDE"
+            excedidas += pool.viajes > args.maximo
+            print(f"{metodo:6} {ruta:40} {respuesta.status_code}  viajes={pool.viajes}  {estado}")
+
+    hashing.cerrar_executor()
+    sys.exit(1 if excedidas else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
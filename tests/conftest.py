@@ -0,0 +1,48 @@
+"""Fixtures comunes: la API contra el driver falso de ``benchmarks.fake_oracle``.
+
+Las pruebas son síncronas; cada petición corre en su propio event loop con
+``asyncio.run``, igual que los scripts de ``benchmarks``.
+"""
+import asyncio
+import os
+
+os.environ.setdefault("JWT_CLAVE_TEMPORAL", "1")
+
+import httpx
+import pytest
+
+import app.database as database
+from app import cache_referencia, seguridad
+from app.main import app
+from benchmarks.fake_oracle import FakeAsyncPool
+
+RUT = "11111111-1"
+EMAIL = "ana@ferremas.cl"
+
+
+@pytest.fixture
+def pool():
+    # Un pool nuevo por prueba, con las restricciones del esquema de
+    # app/migraciones ya leídas (se pueden cambiar y volver a cargar)
+    pool = database._pool = FakeAsyncPool(latencia=0, filas=1)
+    asyncio.run(cache_referencia.precargar())
+    asyncio.run(database.cargar_restricciones())
+    pool.viajes = 0
+    yield pool
+    database._pool = None
+
+
+@pytest.fixture
+def pedir():
+    # pedir(metodo, ruta, rol="administrador", **opciones) -> httpx.Response
+    def pedir(metodo, ruta, rol="administrador", **opciones):
+        async def una():
+            cabeceras = {}
+            if rol is not None:
+                token = seguridad.crear_tokens(RUT, rol, EMAIL)["access_token"]
+                cabeceras["Authorization"] = f"Bearer {token}"
+            transporte = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transporte, base_url="http://prueba", headers=cabeceras) as cliente:
+                return await cliente.request(metodo, ruta, **opciones)
+        return asyncio.run(una())
+    return pedir
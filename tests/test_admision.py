@@ -0,0 +1,113 @@
+"""Control de admisión: clases de ruta, colas acotadas y 503 con Retry-After."""
+import asyncio
+
+import pytest
+
+from app import admision
+from app.admision import ClaseAdmision, clasificar
+from tests.conftest import RUT
+
+SATURADO = {"detail": "Servicio saturado, intente nuevamente"}
+
+
+@pytest.fixture
+def listas(monkeypatch):
+    # Una lista a la vez, sin cola y con espera corta
+    clase = ClaseAdmision("listas", 1, 0)
+    monkeypatch.setitem(admision.CLASES, "listas", clase)
+    monkeypatch.setattr(admision, "ADMISION_ESPERA_MS", 20)
+    return clase
+
+
+# -------------------- CLASIFICACIÓN --------------------
+@pytest.mark.parametrize("metodo, ruta, clase", [
+    ("GET", "/usuarios/login", "hashing"),
+    ("POST", "/usuarios/registro-trabajador/importar", "hashing"),
+    ("PATCH", f"/usuarios/modificar-clave/{RUT}", "hashing"),
+    ("GET", "/pagos/", "listas"),
+    ("GET", "/pagos/exportar", "listas"),
+    ("GET", "/pagos/analytics", "listas"),
+    ("GET", "/usuarios/usuarios", "listas"),
+    ("GET", f"/pagos/{RUT}", "puntuales"),
+    ("GET", f"/pagos/{RUT}/resumen", "puntuales"),
+    ("GET", "/usuarios/comuna", "puntuales"),
+    ("POST", "/pagos/", None),
+    ("DELETE", "/pagos/1", None),
+    ("GET", "/metrics", None),
+])
+def test_clasificar(metodo, ruta, clase):
+    resultado = clasificar(metodo, ruta)
+    assert (resultado.nombre if resultado else None) == clase
+
+
+# -------------------- CLASE DE ADMISIÓN --------------------
+def test_cola_llena_rechaza_sin_esperar():
+    clase = ClaseAdmision("prueba", 1, 0)
+
+    async def escena():
+        assert await clase.entrar()
+        return await clase.entrar()
+
+    assert asyncio.run(escena()) is False
+    assert (clase.rechazos_cola, clase.rechazos_espera, clase.en_curso) == (1, 0, 1)
+
+
+def test_espera_vencida_rechaza(monkeypatch):
+    monkeypatch.setattr(admision, "ADMISION_ESPERA_MS", 10)
+    clase = ClaseAdmision("prueba", 1, 1)
+
+    async def escena():
+        assert await clase.entrar()
+        return await clase.entrar()
+
+    assert asyncio.run(escena()) is False
+    assert (clase.rechazos_cola, clase.rechazos_espera, clase.en_cola) == (0, 1, 0)
+
+
+def test_la_cola_entra_al_liberarse_un_lugar():
+    clase = ClaseAdmision("prueba", 1, 1)
+
+    async def escena():
+        assert await clase.entrar()
+        esperando = asyncio.create_task(clase.entrar())
+        await asyncio.sleep(0)
+        assert clase.en_cola == 1
+        clase.salir()
+        return await esperando
+
+    assert asyncio.run(escena()) is True
+    assert (clase.admitidas, clase.en_curso, clase.en_cola) == (2, 1, 0)
+
+
+# -------------------- MIDDLEWARE --------------------
+def _sin_lugar(respuesta):
+    assert respuesta.status_code == 503
+    assert respuesta.headers["retry-after"] == admision.ADMISION_RETRY_AFTER
+    assert respuesta.json() == SATURADO
+
+
+def test_lista_saturada_responde_503_sin_tocar_el_pool(pool, pedir, listas):
+    asyncio.run(listas.entrar())
+    _sin_lugar(pedir("GET", "/pagos/"))
+    assert pool.viajes == 0
+    assert listas.estadisticas()["rechazos_cola"] == 1
+
+
+def test_lista_en_cola_vence_la_espera(pool, pedir, listas):
+    listas.cola = 1
+    asyncio.run(listas.entrar())
+    _sin_lugar(pedir("GET", "/despacho/"))
+    assert pool.viajes == 0
+    assert listas.estadisticas()["rechazos_espera"] == 1
+
+
+def test_otras_clases_siguen_atendiendo(pool, pedir, listas):
+    asyncio.run(listas.entrar())
+    assert pedir("GET", f"/usuarios/usuario/{RUT}").status_code == 200
+    assert pedir("POST", "/pagos/", params={"rut_usuario": RUT, "id_tipo_pago": 1, "monto": 1000}).status_code == 200
+
+
+def test_lugar_se_libera_al_responder(pool, pedir, listas):
+    assert pedir("GET", "/pagos/").status_code == 200
+    assert pedir("GET", "/pagos/").status_code == 200
+    assert (listas.en_curso, listas.admitidas) == (0, 2)
@@ -0,0 +1,88 @@
+"""Analítica de pagos: agregación con pyarrow y respuesta 501 sin el paquete."""
+import datetime
+
+import pytest
+
+from app import analitica
+
+pa = pytest.importorskip("pyarrow")
+
+
+@pytest.fixture(autouse=True)
+def sin_resultados_guardados():
+    analitica._resultados.clear()
+    yield
+    analitica._resultados.clear()
+
+
+# Como la entrega Oracle: nombres en mayúsculas y NUMBER como double
+ESQUEMA = pa.schema([
+    ("RUT_USUARIO", pa.string()), ("ID_TIPO_PAGO", pa.float64()), ("ID_COMUNA", pa.float64()),
+    ("MONTO", pa.float64()), ("FECHA_PAGO", pa.timestamp("s")),
+])
+
+
+def _pagos(*filas):
+    # (rut, tipo, comuna, monto, fecha) -> tabla Arrow
+    return pa.table({campo.name: [fila[i] for fila in filas] for i, campo in enumerate(ESQUEMA)}, schema=ESQUEMA)
+
+
+def test_agregar():
+    tabla = _pagos(
+        ("1-9", 1, 10, 100.0, datetime.datetime(2024, 1, 31, 23, 59)),
+        ("1-9", 2, 10, 50.0, datetime.datetime(2024, 2, 1, 0, 0)),
+        ("2-7", 1, 20, 300.0, datetime.datetime(2024, 2, 15, 12, 0)),
+    )
+    resultado = analitica.agregar(tabla, "mes", top=1)
+    assert resultado["total"] == {"cantidad": 3, "monto": 450.0}
+    assert resultado["por_periodo"] == [
+        {"periodo": "2024-01-01", "cantidad": 1, "monto": 100.0},
+        {"periodo": "2024-02-01", "cantidad": 2, "monto": 350.0},
+    ]
+    assert resultado["por_tipo_pago"] == [
+        {"id_tipo_pago": 1, "cantidad": 2, "monto": 400.0},
+        {"id_tipo_pago": 2, "cantidad": 1, "monto": 50.0},
+    ]
+    assert resultado["por_comuna"][0] == {"id_comuna": 20, "cantidad": 1, "monto": 300.0}
+    assert resultado["top_clientes"] == [{"rut_usuario": "2-7", "cantidad": 1, "monto": 300.0}]
+
+
+def test_agregar_semanas_empiezan_el_lunes():
+    tabla = _pagos(
+        ("1-9", 1, 10, 1.0, datetime.datetime(2024, 1, 7)),     # domingo
+        ("1-9", 1, 10, 1.0, datetime.datetime(2024, 1, 8)),     # lunes
+    )
+    periodos = [fila["periodo"] for fila in analitica.agregar(tabla, "semana", top=0)["por_periodo"]]
+    assert periodos == ["2024-01-01", "2024-01-08"]
+
+
+def test_agregar_sin_pagos():
+    resultado = analitica.agregar(_pagos(), "dia", top=10)
+    assert resultado["total"] == {"cantidad": 0, "monto": 0}
+    assert resultado["por_periodo"] == resultado["top_clientes"] == []
+
+
+def test_endpoint(pool, pedir):
+    respuesta = pedir("GET", "/pagos/analytics", params={"intervalo": "mes", "top": 3})
+    assert respuesta.status_code == 200
+    datos = respuesta.json()
+    assert datos["intervalo"] == "mes"
+    assert datos["total"]["cantidad"] == pool.filas
+    # fetch_df_all de los pagos y una consulta por los nombres de los clientes
+    assert pool.viajes == 2
+
+    pool.viajes = 0
+    assert pedir("GET", "/pagos/analytics", params={"intervalo": "mes", "top": 3}).json() == datos
+    assert pool.viajes == 0
+
+
+def test_intervalo_invalido(pool, pedir):
+    respuesta = pedir("GET", "/pagos/analytics", params={"intervalo": "anio"})
+    assert respuesta.status_code == 400
+
+
+def test_sin_pyarrow_responde_501(pool, pedir, monkeypatch):
+    monkeypatch.setattr(analitica, "pa", None)
+    respuesta = pedir("GET", "/pagos/analytics")
+    assert respuesta.status_code == 501
+    assert pool.viajes == 0
@@ -0,0 +1,45 @@
+"""Calentamiento del worker: solo las consultas calientes y sin bloquearse por una inválida."""
+import asyncio
+
+import oracledb
+import pytest
+
+from app import arranque, database
+from app.consultas import CONSULTAS, calientes
+
+FALTA_TABLA = (942, "ORA-00942: table or view does not exist")
+
+
+def test_calienta_solo_las_consultas_calientes(pool):
+    resultado = asyncio.run(database.calentar_pool(calientes(), 2))
+    assert resultado == {"parseadas": len(calientes()), "conexiones": 2, "omitidas": []}
+    assert pool.viajes == 2 * len(calientes())
+    assert len(calientes()) < len(CONSULTAS)
+    assert {"usuario.login", "usuario.lista", "pago.lista"} <= calientes().keys()
+
+
+def test_sentencia_invalida_se_omite(pool):
+    pool.errores_parse["usuario_version"] = FALTA_TABLA
+    resultado = asyncio.run(database.calentar_pool(calientes(), 2))
+    assert resultado["omitidas"] == ["usuario.version"]
+    assert resultado["parseadas"] == len(calientes()) - 1
+
+
+def test_error_de_conexion_hace_fallar_el_paso(pool):
+    pool.errores_parse["usuario_version"] = (3113, "ORA-03113: end-of-file on communication channel")
+    with pytest.raises(oracledb.DatabaseError):
+        asyncio.run(database.calentar_pool(calientes(), 1))
+
+
+def test_worker_listo_aunque_falte_una_migracion(pool, monkeypatch):
+    async def sin_procesos():
+        return 0
+
+    monkeypatch.setattr(arranque, "calentar_executor", sin_procesos)
+    monkeypatch.setattr(arranque, "_estado", {**arranque._estado, "listo": False, "pasos": {}})
+    pool.errores_parse["usuario_version"] = FALTA_TABLA
+    pool.errores_parse["pago_resumen"] = FALTA_TABLA
+
+    asyncio.run(arranque.calentar())
+    assert arranque.esta_listo()
+    assert "error" not in arranque.estado_arranque()["pasos"]["pool"]
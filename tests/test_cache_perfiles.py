@@ -0,0 +1,158 @@
+"""Caché de perfiles: invalidación y generación, en memoria y con Redis.
+
+Redis se reemplaza por ``RedisEnMemoria``, que implementa solo lo que usa
+``PerfilesRedis`` (GET, SET, INCR, DELETE y WATCH/MULTI/EXEC).
+"""
+import asyncio
+
+import pytest
+
+from app import cache_perfiles
+from app.cache_perfiles import PerfilesLocal, PerfilesRedis, WatchError
+
+PERFIL = {"rut": "11111111-1", "email": "Ana@Ferremas.cl", "nombre": "Ana"}
+
+
+class RedisEnMemoria:
+    def __init__(self):
+        self.datos = {}
+        self.versiones = {}         # clave -> escrituras, para WATCH
+        self.antes_de_exec = None   # se llama justo antes de aplicar un MULTI
+
+    def _escribir(self, clave, valor):
+        if valor is None:
+            self.datos.pop(clave, None)
+        else:
+            self.datos[clave] = valor
+        self.versiones[clave] = self.versiones.get(clave, 0) + 1
+
+    async def get(self, clave):
+        return self.datos.get(clave)
+
+    async def set(self, clave, valor, ex=None):
+        self._escribir(clave, valor)
+
+    async def incr(self, clave):
+        self._escribir(clave, str(int(self.datos.get(clave, 0)) + 1).encode())
+        return int(self.datos[clave])
+
+    async def delete(self, *claves):
+        for clave in claves:
+            self._escribir(clave, None)
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.vigiladas = {}
+        self.cola = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def watch(self, *claves):
+        self.vigiladas = {clave: self.redis.versiones.get(clave, 0) for clave in claves}
+
+    async def get(self, clave):
+        return await self.redis.get(clave)
+
+    def multi(self):
+        self.cola = []
+
+    def set(self, clave, valor, ex=None):
+        self.cola.append((clave, valor))
+
+    async def execute(self):
+        if self.redis.antes_de_exec:
+            await self.redis.antes_de_exec()
+        if any(self.redis.versiones.get(clave, 0) != version for clave, version in self.vigiladas.items()):
+            raise WatchError()
+        for clave, valor in self.cola:
+            self.redis._escribir(clave, valor)
+
+
+@pytest.fixture(params=["local", "redis"])
+def backend(request):
+    anterior = cache_perfiles._backend
+    nuevo = PerfilesLocal() if request.param == "local" else PerfilesRedis(cliente=RedisEnMemoria())
+    cache_perfiles.configurar(nuevo)
+    yield nuevo
+    cache_perfiles.configurar(anterior)
+
+
+def _cargar(perfil):
+    # Lo que hace _cargar_perfil: generación antes de leer la base, luego guardar
+    async def cargar():
+        generacion = await cache_perfiles.generacion()
+        await cache_perfiles.guardar(perfil, generacion)
+    asyncio.run(cargar())
+
+
+def test_guarda_por_rut_y_por_email(backend):
+    _cargar(PERFIL)
+    assert asyncio.run(cache_perfiles.por_rut("11111111-1")) == PERFIL
+    assert asyncio.run(cache_perfiles.por_email("ana@ferremas.CL")) == PERFIL
+
+
+def test_invalidar_por_rut_borra_tambien_el_email(backend):
+    _cargar(PERFIL)
+    asyncio.run(cache_perfiles.invalidar(rut="11111111-1"))
+    assert asyncio.run(cache_perfiles.por_rut("11111111-1")) is None
+    assert asyncio.run(cache_perfiles.por_email(PERFIL["email"])) is None
+
+
+def test_lectura_anterior_a_una_escritura_no_se_guarda(backend):
+    async def escenario():
+        generacion = await cache_perfiles.generacion()    # empieza la lectura
+        await cache_perfiles.invalidar(rut=PERFIL["rut"])  # escritura confirmada en medio
+        await cache_perfiles.guardar(PERFIL, generacion)   # la lectura termina con datos viejos
+        return await cache_perfiles.por_rut(PERFIL["rut"])
+    assert asyncio.run(escenario()) is None
+
+
+def test_redis_invalidacion_de_otro_worker_descarta_la_lectura():
+    # Dos workers con el mismo Redis: la generación es compartida
+    redis = RedisEnMemoria()
+    worker_a, worker_b = PerfilesRedis(cliente=redis), PerfilesRedis(cliente=redis)
+    claves = ["rut:11111111-1"]
+
+    async def escenario():
+        generacion = await worker_b.generacion()
+        await worker_a.nueva_generacion()
+        await worker_a.borrar(claves)
+        await worker_b.guardar(claves, PERFIL, generacion)
+        return await worker_b.obtener(claves[0])
+    assert asyncio.run(escenario()) is None
+
+
+def test_redis_invalidacion_entre_watch_y_exec_descarta_la_escritura():
+    redis = RedisEnMemoria()
+    lector, escritor = PerfilesRedis(cliente=redis), PerfilesRedis(cliente=redis)
+    claves = ["rut:11111111-1"]
+
+    async def escenario():
+        generacion = await lector.generacion()
+        redis.antes_de_exec = escritor.nueva_generacion
+        await lector.guardar(claves, PERFIL, generacion)
+        return await lector.obtener(claves[0])
+    assert asyncio.run(escenario()) is None
+
+
+def test_local_vence_por_ttl_y_descarta_los_menos_usados():
+    perfiles = PerfilesLocal(maximo=2, ttl=-1)
+    asyncio.run(perfiles.guardar(["a"], PERFIL, 0))
+    assert asyncio.run(perfiles.obtener("a")) is None
+
+    perfiles = PerfilesLocal(maximo=2, ttl=60)
+    for clave in ("a", "b"):
+        asyncio.run(perfiles.guardar([clave], PERFIL, 0))
+    asyncio.run(perfiles.obtener("a"))
+    asyncio.run(perfiles.guardar(["c"], PERFIL, 0))
+    assert asyncio.run(perfiles.obtener("b")) is None
+    assert asyncio.run(perfiles.obtener("a")) == PERFIL
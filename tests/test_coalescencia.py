@@ -0,0 +1,171 @@
+"""Lecturas compartidas: una sola consulta para peticiones idénticas y simultáneas."""
+import asyncio
+
+import httpx
+import pytest
+
+from app import admision, coalescencia, seguridad
+from app.main import app
+from tests.conftest import EMAIL, RUT
+
+
+@pytest.fixture(autouse=True)
+def limpio(monkeypatch):
+    monkeypatch.setattr(coalescencia, "_en_vuelo", {})
+    monkeypatch.setattr(coalescencia, "_recientes", coalescencia.OrderedDict())
+    monkeypatch.setattr(coalescencia, "_estadisticas", {})
+
+
+def _cargador(resultado="filas", espera=0.01):
+    # Función de lectura que cuenta sus ejecuciones
+    llamadas = []
+
+    async def cargar():
+        llamadas.append(1)
+        await asyncio.sleep(espera)
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+    return cargar, llamadas
+
+
+def _simultaneas(*llamadas):
+    async def todas():
+        return await asyncio.gather(*llamadas, return_exceptions=True)
+    return asyncio.run(todas())
+
+
+# -------------------- COMPARTIR --------------------
+def test_lecturas_identicas_ejecutan_una_vez():
+    cargar, llamadas = _cargador()
+    resultados = _simultaneas(*[coalescencia.compartir("prueba", ("a",), cargar) for _ in range(10)])
+    assert resultados == ["filas"] * 10
+    assert len(llamadas) == 1
+    assert coalescencia.estadisticas_coalescencia()["lecturas"]["prueba"] == {
+        "ejecutadas": 1, "agrupadas": 9, "micro_cache": 0,
+    }
+    assert coalescencia.estadisticas_coalescencia()["en_vuelo"] == 0
+
+
+def test_claves_distintas_no_se_agrupan():
+    cargar, llamadas = _cargador()
+    _simultaneas(coalescencia.compartir("prueba", ("a",), cargar), coalescencia.compartir("prueba", ("b",), cargar))
+    assert len(llamadas) == 2
+
+
+def test_errores_llegan_a_todos_y_no_se_guardan(monkeypatch):
+    monkeypatch.setattr(coalescencia, "COALESCENCIA_VENTANA_MS", 1000)
+    cargar, llamadas = _cargador(RuntimeError("caída"))
+    resultados = _simultaneas(*[coalescencia.compartir("prueba", ("a",), cargar) for _ in range(3)])
+    assert all(isinstance(resultado, RuntimeError) for resultado in resultados)
+    assert len(llamadas) == 1
+
+    # La siguiente petición vuelve a consultar
+    with pytest.raises(RuntimeError):
+        asyncio.run(coalescencia.compartir("prueba", ("a",), cargar))
+    assert len(llamadas) == 2
+
+
+def test_cancelar_a_quien_inicio_no_afecta_a_los_demas():
+    cargar, llamadas = _cargador(espera=0.05)
+
+    async def escena():
+        primera = asyncio.create_task(coalescencia.compartir("prueba", ("a",), cargar))
+        await asyncio.sleep(0)
+        segunda = asyncio.create_task(coalescencia.compartir("prueba", ("a",), cargar))
+        await asyncio.sleep(0.01)
+        primera.cancel()
+        return await segunda
+
+    assert asyncio.run(escena()) == "filas"
+    assert len(llamadas) == 1
+
+
+def test_olvidar_no_se_suma_a_lecturas_anteriores():
+    cargar, llamadas = _cargador(espera=0.05)
+
+    async def escena():
+        antes = asyncio.create_task(coalescencia.compartir("prueba", ("a",), cargar))
+        await asyncio.sleep(0)
+        coalescencia.olvidar("prueba")
+        despues = await coalescencia.compartir("prueba", ("a",), cargar)
+        return await antes, despues
+
+    assert asyncio.run(escena()) == ("filas", "filas")
+    assert len(llamadas) == 2
+
+
+# -------------------- MICRO-CACHÉ --------------------
+def test_sin_ventana_no_reutiliza():
+    cargar, llamadas = _cargador(espera=0)
+    asyncio.run(coalescencia.compartir("prueba", ("a",), cargar))
+    asyncio.run(coalescencia.compartir("prueba", ("a",), cargar))
+    assert len(llamadas) == 2
+
+
+def test_ventana_reutiliza_hasta_vencer(monkeypatch):
+    monkeypatch.setattr(coalescencia, "COALESCENCIA_VENTANA_MS", 1000)
+    ahora = [100.0]
+    monkeypatch.setattr(coalescencia.time, "monotonic", lambda: ahora[0])
+    cargar, llamadas = _cargador(espera=0)
+
+    asyncio.run(coalescencia.compartir("prueba", ("a",), cargar))
+    asyncio.run(coalescencia.compartir("prueba", ("a",), cargar))
+    assert len(llamadas) == 1
+    assert coalescencia.estadisticas_coalescencia()["lecturas"]["prueba"]["micro_cache"] == 1
+
+    ahora[0] += 1.5
+    asyncio.run(coalescencia.compartir("prueba", ("a",), cargar))
+    assert len(llamadas) == 2
+
+
+def test_olvidar_vacia_la_ventana(monkeypatch):
+    monkeypatch.setattr(coalescencia, "COALESCENCIA_VENTANA_MS", 1000)
+    cargar, llamadas = _cargador(espera=0)
+    asyncio.run(coalescencia.compartir("prueba", ("a",), cargar))
+    coalescencia.olvidar("prueba")
+    asyncio.run(coalescencia.compartir("prueba", ("a",), cargar))
+    assert len(llamadas) == 2
+
+
+# -------------------- RUTAS --------------------
+def _pedir_simultaneas(rutas, rol="administrador"):
+    async def todas():
+        token = seguridad.crear_tokens(RUT, rol, EMAIL)["access_token"]
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba",
+                                     headers={"Authorization": f"Bearer {token}"}) as cliente:
+            return await asyncio.gather(*[cliente.get(ruta, params=params) for ruta, params in rutas])
+    return asyncio.run(todas())
+
+
+def test_lista_de_pagos_comparte_la_consulta(pool):
+    # Tantas peticiones como admite la clase "listas": ninguna espera en la cola
+    pool.latencia = 0.05
+    simultaneas = admision.CLASES["listas"].concurrencia
+    respuestas = _pedir_simultaneas([("/pagos/", {"limite": 5})] * simultaneas)
+    assert {respuesta.status_code for respuesta in respuestas} == {200}
+    assert len({respuesta.content for respuesta in respuestas}) == 1
+    assert pool.viajes == 1
+
+
+def test_lista_de_pagos_con_filtros_distintos(pool):
+    pool.latencia = 0.02
+    respuestas = _pedir_simultaneas([("/pagos/", {"limite": 5}), ("/pagos/", {"limite": 6})])
+    assert {respuesta.status_code for respuesta in respuestas} == {200}
+    assert pool.viajes == 2
+
+
+def test_registrar_pago_olvida_la_lista(pool, pedir, monkeypatch):
+    monkeypatch.setattr(coalescencia, "COALESCENCIA_VENTANA_MS", 60000)
+    pedir("GET", "/pagos/")
+    pool.viajes = 0
+    pedir("GET", "/pagos/")
+    assert pool.viajes == 0
+
+    ok = pedir("POST", "/pagos/", params={"rut_usuario": RUT, "id_tipo_pago": 1, "monto": 1000})
+    assert ok.status_code == 200
+    pool.viajes = 0
+    pedir("GET", "/pagos/")
+    assert pool.viajes == 1
@@ -0,0 +1,71 @@
+"""Compresión negociada: cuándo se comprime y cuándo va Vary: Accept-Encoding."""
+import asyncio
+
+import httpx
+import pytest
+
+from app import compresion
+from app.compresion import COMPRESION_MINIMO, MiddlewareCompresion
+
+GRANDE = b'{"x": "' + b"a" * COMPRESION_MINIMO + b'"}'
+
+
+def _app(status=200, tipo=b"application/json", cuerpo=b"{}", extra=()):
+    async def app(scope, receive, send):
+        cabeceras = [(b"content-length", str(len(cuerpo)).encode()), *extra]
+        if tipo:
+            cabeceras.append((b"content-type", tipo))
+        await send({"type": "http.response.start", "status": status, "headers": cabeceras})
+        await send({"type": "http.response.body", "body": cuerpo})
+    return MiddlewareCompresion(app)
+
+
+def _pedir(app, accept_encoding=None):
+    async def una():
+        cabeceras = {"Accept-Encoding": accept_encoding or ""}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://prueba") as cliente:
+            return await cliente.get("/", headers=cabeceras)
+    return asyncio.run(una())
+
+
+def test_comprime_json_grande_con_gzip():
+    respuesta = _pedir(_app(cuerpo=GRANDE), "gzip")
+    assert respuesta.headers["content-encoding"] == "gzip"
+    assert respuesta.headers["vary"] == "Accept-Encoding"
+    assert respuesta.content == GRANDE      # httpx descomprime
+    assert int(respuesta.headers["content-length"]) < len(GRANDE)
+
+
+@pytest.mark.parametrize("app, accept_encoding", [
+    (_app(cuerpo=GRANDE), None),                # el cliente no pidió compresión
+    (_app(cuerpo=b"{}"), "gzip"),               # bajo el mínimo
+    (_app(status=304, tipo=None, cuerpo=b""), "gzip"),
+])
+def test_vary_aunque_no_se_comprima(app, accept_encoding):
+    respuesta = _pedir(app, accept_encoding)
+    assert "content-encoding" not in respuesta.headers
+    assert respuesta.headers["vary"] == "Accept-Encoding"
+
+
+def test_tipo_no_comprimible_sin_vary():
+    respuesta = _pedir(_app(tipo=b"image/png", cuerpo=b"\x89PNG" * 500), "gzip")
+    assert "content-encoding" not in respuesta.headers
+    assert "vary" not in respuesta.headers
+
+
+def test_respeta_vary_existente():
+    respuesta = _pedir(_app(cuerpo=GRANDE, extra=[(b"vary", b"Origin")]), "gzip")
+    assert respuesta.headers["vary"] == "Origin, Accept-Encoding"
+
+
+def test_sin_brotli_se_usa_gzip(monkeypatch):
+    monkeypatch.setattr(compresion, "brotli", None)
+    assert compresion.elegir_codificacion("br, gzip") == "gzip"
+    assert compresion.elegir_codificacion("br") is None
+    respuesta = _pedir(_app(cuerpo=GRANDE), "br, gzip")
+    assert respuesta.headers["content-encoding"] == "gzip"
+
+
+def test_con_brotli_se_prefiere_br():
+    pytest.importorskip("brotli")
+    assert compresion.elegir_codificacion("gzip, br") == "br"
@@ -0,0 +1,87 @@
+"""ETag y 304: sondas de versión y lista de usuarios sin la tabla usuario_version."""
+import pytest
+
+from app.routers import usuarios
+from tests.conftest import RUT
+
+SONDA_USUARIOS = "FROM usuario_version"
+
+
+def _revalidar(pedir, ruta, etag, **opciones):
+    return pedir("GET", ruta, headers={"If-None-Match": etag}, **opciones)
+
+
+# -------------------- LISTA DE USUARIOS --------------------
+def test_lista_sin_cambios_responde_304_con_la_sonda(pool, pedir):
+    primera = pedir("GET", "/usuarios/usuarios")
+    assert primera.headers["cache-control"] == "private, no-cache"
+    pool.viajes = 0
+
+    segunda = _revalidar(pedir, "/usuarios/usuarios", primera.headers["etag"])
+    assert segunda.status_code == 304
+    assert segunda.headers["etag"] == primera.headers["etag"]
+    assert pool.viajes == 1
+
+
+def test_lista_cambia_con_la_version(pool, pedir):
+    pool.respuestas[SONDA_USUARIOS] = [(1,)]
+    etag = pedir("GET", "/usuarios/usuarios").headers["etag"]
+    pool.respuestas[SONDA_USUARIOS] = [(2,)]
+    respuesta = _revalidar(pedir, "/usuarios/usuarios", etag)
+    assert respuesta.status_code == 200
+    assert respuesta.headers["etag"] != etag
+
+
+def test_etag_depende_de_los_parametros(pool, pedir):
+    etag = pedir("GET", "/usuarios/usuarios").headers["etag"]
+    assert _revalidar(pedir, "/usuarios/usuarios", etag, params={"fields": "rut"}).status_code == 200
+
+
+@pytest.mark.parametrize("if_none_match", ["*", 'W/"otro", {etag}', "{sin_w}"])
+def test_comparacion_debil(pool, pedir, if_none_match):
+    etag = pedir("GET", "/usuarios/usuarios").headers["etag"]
+    valor = if_none_match.format(etag=etag, sin_w=etag.removeprefix("W/"))
+    assert _revalidar(pedir, "/usuarios/usuarios", valor).status_code == 304
+
+
+def test_lista_sin_tabla_de_version(pool, pedir, monkeypatch):
+    # Migración sin aplicar: la lista responde completa y sin ETag, y después
+    # ni siquiera se consulta la sonda
+    monkeypatch.setattr(usuarios, "_version_disponible", True)
+    pool.errores[SONDA_USUARIOS] = (942, "ORA-00942: table or view does not exist")
+    respuesta = pedir("GET", "/usuarios/usuarios")
+    assert respuesta.status_code == 200
+    assert "etag" not in respuesta.headers
+    assert respuesta.json()["items"]
+
+    pool.viajes = 0
+    assert pedir("GET", "/usuarios/usuarios").status_code == 200
+    assert pool.viajes == 1
+
+
+def test_lista_sin_fila_de_version(pool, pedir):
+    pool.respuestas[SONDA_USUARIOS] = []
+    respuesta = pedir("GET", "/usuarios/usuarios")
+    assert respuesta.status_code == 200
+    assert "etag" not in respuesta.headers
+
+
+# -------------------- PAGOS, DESPACHOS Y COMUNAS --------------------
+@pytest.mark.parametrize("ruta", [f"/pagos/{RUT}", f"/despacho/usuario/{RUT}"])
+def test_listas_por_usuario(pool, pedir, ruta):
+    etag = pedir("GET", ruta).headers["etag"]
+    pool.viajes = 0
+    assert _revalidar(pedir, ruta, etag).status_code == 304
+    assert pool.viajes == 1
+
+    # Un pago o despacho nuevo cambia COUNT(*) y MAX(id) de la sonda
+    pool.respuestas["MAX(ORA_ROWSCN)"] = [(5, 5, 123)]
+    assert _revalidar(pedir, ruta, etag).status_code == 200
+
+
+def test_comunas_desde_memoria(pool, pedir):
+    primera = pedir("GET", "/usuarios/comuna", rol=None)
+    assert primera.headers["cache-control"] == "public, max-age=300"
+    pool.viajes = 0
+    assert _revalidar(pedir, "/usuarios/comuna", primera.headers["etag"], rol=None).status_code == 304
+    assert pool.viajes == 0
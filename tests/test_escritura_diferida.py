@@ -0,0 +1,86 @@
+"""Escritura diferida: exige un único worker y traduce las filas rechazadas."""
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import escritura_diferida
+from app.database import ORA_PADRE_NO_EXISTE
+from app.escritura_diferida import ERROR, GUARDADO, EscrituraDiferida
+from app.routers import despacho
+
+
+@pytest.fixture
+def modo_diferido(monkeypatch, tmp_path):
+    # Modo diferido activo, con un candado propio de la prueba
+    monkeypatch.setattr(escritura_diferida, "ESCRITURAS", {"despacho": object()})
+    monkeypatch.setattr(escritura_diferida, "WEB_CONCURRENCY", 1)
+    monkeypatch.setattr(escritura_diferida, "DIFERIDA_CANDADO", str(tmp_path / "diferida.lock"))
+    monkeypatch.setattr(escritura_diferida, "_candado", None)
+    yield str(tmp_path / "diferida.lock")
+    escritura_diferida.liberar_worker()
+
+
+# -------------------- UN SOLO WORKER --------------------
+def test_modo_diferido_con_varios_workers_no_arranca(modo_diferido, monkeypatch):
+    monkeypatch.setattr(escritura_diferida, "WEB_CONCURRENCY", 2)
+    with pytest.raises(RuntimeError, match="un solo worker"):
+        escritura_diferida.verificar_un_worker()
+
+
+def test_sin_modo_diferido_admite_varios_workers(monkeypatch):
+    monkeypatch.setattr(escritura_diferida, "ESCRITURAS", {})
+    monkeypatch.setattr(escritura_diferida, "WEB_CONCURRENCY", 4)
+    escritura_diferida.verificar_un_worker()
+
+
+@pytest.mark.skipif(escritura_diferida.fcntl is None, reason="sin fcntl solo se revisa WEB_CONCURRENCY")
+def test_segundo_worker_sin_web_concurrency_no_arranca(modo_diferido):
+    # Como `uvicorn --workers 2`: otro proceso con el mismo candado no arranca
+    escritura_diferida.verificar_un_worker()
+    codigo = (
+        "from app import escritura_diferida as e\n"
+        "e.ESCRITURAS['despacho'] = object()\n"
+        "e.verificar_un_worker()\n"
+    )
+    otro = subprocess.run(
+        [sys.executable, "-c", codigo], capture_output=True, text=True, timeout=60,
+        env={**os.environ, "DIFERIDA_CANDADO": modo_diferido, "WEB_CONCURRENCY": "1"}
+    )
+    assert otro.returncode != 0
+    assert "más de un worker" in otro.stderr
+    assert str(os.getpid()) in otro.stderr
+
+
+@pytest.mark.skipif(escritura_diferida.fcntl is None, reason="sin fcntl solo se revisa WEB_CONCURRENCY")
+def test_candado_liberado_permite_otro_worker(modo_diferido, monkeypatch):
+    escritura_diferida.verificar_un_worker()
+    escritura_diferida.verificar_un_worker()    # el mismo worker puede volver a verificar
+    primero = escritura_diferida._candado
+
+    monkeypatch.setattr(escritura_diferida, "_candado", None)
+    with pytest.raises(RuntimeError, match="más de un worker"):
+        escritura_diferida.verificar_un_worker()
+
+    primero.close()
+    escritura_diferida.verificar_un_worker()
+
+
+# -------------------- FILAS RECHAZADAS --------------------
+def test_filas_rechazadas_con_detalle_traducido(pool):
+    diferida = EscrituraDiferida("despacho", despacho._SQL_INSERTAR, despacho._ERRORES_DESPACHO)
+    binds = {"rut": "11111111-1", "tipo": "retiro en tienda", "direccion": None, "sucursal": "Centro"}
+    ids = [diferida.encolar(binds, dueno="11111111-1") for _ in range(3)]
+    pool.errores_lote["INSERT INTO tipo_despacho"] = {
+        1: (ORA_PADRE_NO_EXISTE, "ORA-02291: integrity constraint (API_SITIOFERREMAS.FK_DESPACHO_USUARIO) violated"),
+        2: (12899, 'ORA-12899: value too large for column "API_SITIOFERREMAS"."TIPO_DESPACHO"."SUCURSAL"'),
+    }
+
+    assert asyncio.run(diferida._volcar()) == 3
+    estados = [diferida.estado(seguimiento) for seguimiento in ids]
+    assert [estado["estado"] for estado in estados] == [GUARDADO, ERROR, ERROR]
+    assert estados[1]["detalle"] == "Usuario no encontrado"
+    assert estados[2]["detalle"] == "Fila rechazada por la base de datos"
+    assert (diferida.guardadas, diferida.rechazadas) == (1, 2)
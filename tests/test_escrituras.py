@@ -0,0 +1,112 @@
+"""Escrituras de un solo viaje y traducción de errores de integridad a HTTP."""
+import asyncio
+
+import pytest
+
+import app.database as database
+from app.database import ORA_PADRE_NO_EXISTE, ORA_UNICA
+from benchmarks.fake_oracle import RESTRICCIONES
+from benchmarks.viajes_escritura import ESCRITURAS, USUARIO
+
+CLIENTE = {"params": {k: v for k, v in USUARIO.items() if k != "rol"}}
+PAGO = {"params": {"rut_usuario": "11111111-1", "id_tipo_pago": 1, "monto": 1000}}
+DESPACHO = {"params": {"rut_usuario": "11111111-1", "tipo": "retiro en tienda", "sucursal": "Centro"}}
+
+
+def _unica(restriccion):
+    return ORA_UNICA, f"ORA-00001: unique constraint (API_SITIOFERREMAS.{restriccion}) violated"
+
+
+def _padre(restriccion):
+    return ORA_PADRE_NO_EXISTE, f"ORA-02291: integrity constraint (API_SITIOFERREMAS.{restriccion}) violated - parent key not found"
+
+
+# -------------------- VIAJES --------------------
+@pytest.mark.parametrize("metodo, ruta, opciones", ESCRITURAS, ids=[f"{m} {r}" for m, r, _ in ESCRITURAS])
+def test_escritura_en_un_viaje(pool, pedir, metodo, ruta, opciones):
+    respuesta = pedir(metodo, ruta, **opciones)
+    assert respuesta.status_code == 200
+    assert pool.viajes == 1
+
+
+# -------------------- ERRORES DE INTEGRIDAD --------------------
+@pytest.mark.parametrize("metodo, ruta, opciones, fragmento, error, status, detalle", [
+    ("POST", "/usuarios/registro-cliente", CLIENTE, "INSERT INTO usuario",
+     _unica("UK_USUARIO_EMAIL"), 400, "Email ya registrado"),
+    ("POST", "/usuarios/registro-cliente", CLIENTE, "INSERT INTO usuario",
+     _unica("PK_USUARIO"), 400, "RUT ya registrado"),
+    ("POST", "/usuarios/registro-cliente", CLIENTE, "INSERT INTO usuario",
+     _padre("FK_USUARIO_COMUNA"), 400, "Comuna inválida"),
+    ("POST", "/usuarios/registro-trabajador", {"json": USUARIO}, "INSERT INTO usuario",
+     _unica("UK_USUARIO_EMAIL"), 400, "Email ya registrado"),
+    ("POST", "/usuarios/registro-administrador", {"json": USUARIO}, "INSERT INTO usuario",
+     _unica("PK_USUARIO"), 400, "RUT ya registrado"),
+    ("PATCH", "/usuarios/modificar/11111111-1", {"json": {"email": "otro@ferremas.cl"}}, "UPDATE usuario",
+     _unica("UK_USUARIO_EMAIL"), 400, "Email ya registrado"),
+    ("PATCH", "/usuarios/modificar/11111111-1", {"json": {"id_comuna": 99}}, "UPDATE usuario",
+     _padre("FK_USUARIO_COMUNA"), 400, "Comuna inválida"),
+    ("POST", "/pagos/", PAGO, "INSERT INTO pago", _padre("FK_PAGO_TIPO_PAGO"), 400, "ID de tipo de pago inválido"),
+    ("POST", "/pagos/", PAGO, "INSERT INTO pago", _padre("FK_PAGO_USUARIO"), 404, "Usuario no encontrado"),
+    ("POST", "/despacho/", DESPACHO, "INSERT INTO tipo_despacho",
+     _padre("FK_DESPACHO_USUARIO"), 404, "Usuario no encontrado"),
+])
+def test_error_de_integridad(pool, pedir, metodo, ruta, opciones, fragmento, error, status, detalle):
+    pool.errores[fragmento] = error
+    respuesta = pedir(metodo, ruta, **opciones)
+    assert (respuesta.status_code, respuesta.json()["detail"]) == (status, detalle)
+    assert pool.viajes == 1
+
+
+def test_restriccion_con_otro_nombre_se_reconoce_por_columnas(pool, pedir):
+    # Un UNIQUE(email) creado sin nombre (SYS_C...) no debe informarse como RUT duplicado
+    pool.respuestas["user_constraints"] = [
+        ("SYS_C0012345", "U", "USUARIO", "EMAIL") if nombre == "UK_USUARIO_EMAIL" else (nombre, *resto)
+        for nombre, *resto in RESTRICCIONES
+    ]
+    asyncio.run(database.cargar_restricciones())
+    pool.errores["INSERT INTO usuario"] = _unica("SYS_C0012345")
+    pool.viajes = 0
+
+    respuesta = pedir("POST", "/usuarios/registro-cliente", **CLIENTE)
+    assert (respuesta.status_code, respuesta.json()["detail"]) == (400, "Email ya registrado")
+    assert pool.viajes == 1
+
+
+def test_restriccion_desconocida_no_se_informa_como_rut(pool, pedir):
+    pool.errores["INSERT INTO usuario"] = _unica("SYS_C0099999")
+    respuesta = pedir("POST", "/usuarios/registro-cliente", **CLIENTE)
+    assert (respuesta.status_code, respuesta.json()["detail"]) == (400, "RUT o email ya registrado")
+
+
+# -------------------- ESQUEMA SIN UNIQUE(EMAIL) --------------------
+@pytest.fixture
+def sin_unica_email(pool):
+    pool.respuestas["user_constraints"] = [r for r in RESTRICCIONES if r[0] != "UK_USUARIO_EMAIL"]
+    asyncio.run(database.cargar_restricciones())
+    pool.viajes = 0
+    return pool
+
+
+@pytest.mark.parametrize("metodo, ruta, opciones", [
+    ("POST", "/usuarios/registro-cliente", CLIENTE),
+    ("POST", "/usuarios/registro-trabajador", {"json": USUARIO}),
+    ("POST", "/usuarios/registro-administrador", {"json": USUARIO}),
+    ("PATCH", "/usuarios/modificar/11111111-1", {"json": {"email": "otro@ferremas.cl"}}),
+])
+def test_sin_unica_email_se_consulta_antes(sin_unica_email, pedir, metodo, ruta, opciones):
+    # El driver falso encuentra una fila para el email: duplicado
+    respuesta = pedir(metodo, ruta, **opciones)
+    assert (respuesta.status_code, respuesta.json()["detail"]) == (400, "Email ya registrado")
+    assert sin_unica_email.viajes == 1
+
+    sin_unica_email.respuestas["rut <> :rut"] = []
+    sin_unica_email.viajes = 0
+    respuesta = pedir(metodo, ruta, **opciones)
+    assert respuesta.status_code == 200
+    assert sin_unica_email.viajes == 2
+
+
+def test_sin_unica_email_modificar_otros_campos_sigue_en_un_viaje(sin_unica_email, pedir):
+    respuesta = pedir("PATCH", "/usuarios/modificar/11111111-1", json={"nombre": "Ana María"})
+    assert respuesta.status_code == 200
+    assert sin_unica_email.viajes == 1
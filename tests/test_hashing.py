@@ -0,0 +1,112 @@
+"""Hashing: cupo de pendientes y reparto de las cargas masivas.
+
+El executor de procesos se reemplaza por uno de hilos y bcrypt usa costo 4,
+así las pruebas pueden observar el orden y los pendientes sin esperar.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import pytest
+
+from app import hashing
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    ejecutor = ThreadPoolExecutor(max_workers=2)
+    gensalt = bcrypt.gensalt
+    monkeypatch.setattr(hashing, "iniciar_executor", lambda: ejecutor)
+    monkeypatch.setattr(hashing.bcrypt, "gensalt", lambda rounds=4: gensalt(4))
+    monkeypatch.setattr(hashing, "HASH_WORKERS", 2)
+    monkeypatch.setattr(hashing, "HASH_MAX_PENDIENTES", 8)
+    monkeypatch.setattr(hashing, "HASH_LOTE_TROZO", 4)
+    monkeypatch.setattr(hashing, "HASH_LOTE_WORKERS", 1)
+    yield ejecutor
+    ejecutor.shutdown(wait=True)
+
+
+@pytest.fixture
+def trozos(monkeypatch, executor):
+    # (contraseñas, pendientes al empezar) de cada tarea de lote
+    vistos = []
+    hash_lote = hashing._hash_lote
+
+    def espiar(passwords):
+        vistos.append((len(passwords), hashing._pendientes))
+        time.sleep(0.01)
+        return hash_lote(passwords)
+
+    monkeypatch.setattr(hashing, "_hash_lote", espiar)
+    return vistos
+
+
+def test_lote_conserva_el_orden(trozos):
+    passwords = [f"clave-{i}" for i in range(11)]
+    hashes = asyncio.run(hashing.hash_passwords(passwords))
+    assert all(bcrypt.checkpw(p.encode(), h.encode()) for p, h in zip(passwords, hashes))
+    assert hashing._pendientes == 0
+
+
+def test_lote_en_trozos_chicos_y_mitad_del_cupo(trozos, monkeypatch):
+    monkeypatch.setattr(hashing, "HASH_LOTE_WORKERS", 2)
+    asyncio.run(hashing.hash_passwords([f"clave-{i}" for i in range(20)]))
+    # 2 carriles: trozos de 8 // 2 // 2 = 2 contraseñas; nunca más de 4 pendientes
+    assert {tamano for tamano, _ in trozos} == {2}
+    assert max(pendientes for _, pendientes in trozos) <= hashing.HASH_MAX_PENDIENTES // 2
+
+
+def test_login_no_espera_a_la_carga(trozos):
+    # Con un carril para la carga, el otro proceso queda libre para los logins
+    terminados = []
+
+    async def carga():
+        await hashing.hash_passwords([f"clave-{i}" for i in range(40)])
+        terminados.append("carga")
+
+    async def login():
+        await asyncio.sleep(0.02)
+        await hashing.hash_password("clave")
+        terminados.append("login")
+
+    async def ambos():
+        await asyncio.gather(carga(), login())
+
+    asyncio.run(ambos())
+    assert terminados == ["login", "carga"]
+
+
+def test_pendientes_cuentan_contrasenas(executor, monkeypatch):
+    # Un trozo de 4 ocupa 4 lugares: con 6 de 8 ocupados no entra
+    monkeypatch.setattr(hashing, "_pendientes", 6)
+    with pytest.raises(hashing.HTTPException) as error:
+        asyncio.run(hashing._ejecutar(hashing._hash_lote, ["a", "b", "c", "d"], costo=4))
+    assert (error.value.status_code, error.value.headers["Retry-After"]) == (503, hashing.HASH_RETRY_AFTER)
+    assert asyncio.run(hashing._ejecutar(hashing._hash, "a"))
+
+
+def test_carga_rechazada_detiene_sus_carriles(trozos, monkeypatch):
+    monkeypatch.setattr(hashing, "HASH_LOTE_WORKERS", 2)
+    monkeypatch.setattr(hashing, "HASH_MAX_PENDIENTES", 2)
+    ocupar = threading.Event()
+
+    async def saturada():
+        # Un login ocupa un lugar mientras la carga pide el suyo
+        login = asyncio.create_task(hashing._ejecutar(_bloquear, ocupar, costo=1))
+        await asyncio.sleep(0.01)
+        try:
+            await hashing.hash_passwords([f"clave-{i}" for i in range(8)])
+        finally:
+            ocupar.set()
+            await login
+
+    with pytest.raises(hashing.HTTPException):
+        asyncio.run(saturada())
+    assert hashing._pendientes == 0
+
+
+def _bloquear(evento):
+    evento.wait(5)
+    return True, 0.0
@@ -0,0 +1,114 @@
+"""Cargas masivas: un resultado por fila y errores de la base traducidos."""
+import pytest
+
+from app.database import ORA_PADRE_NO_EXISTE, ORA_UNICA
+
+RUT = "11111111-1"
+
+
+def _padre(restriccion):
+    return ORA_PADRE_NO_EXISTE, f"ORA-02291: integrity constraint (API_SITIOFERREMAS.{restriccion}) violated - parent key not found"
+
+
+def _detalles(respuesta) -> dict:
+    return {fila["indice"]: fila.get("detalle") for fila in respuesta.json()["resultados"]}
+
+
+# -------------------- PAGOS --------------------
+@pytest.fixture
+def pool_pagos(pool):
+    # Solo RUT existe en usuario
+    pool.respuestas["SELECT rut FROM usuario WHERE rut IN"] = [(RUT,)]
+    return pool
+
+
+def _pago(**cambios):
+    return {"rut_usuario": RUT, "id_tipo_pago": 1, "monto": 1000, **cambios}
+
+
+def test_lote_de_pagos_informa_cada_fila(pool_pagos, pedir):
+    respuesta = pedir("POST", "/pagos/batch", json=[
+        _pago(),
+        _pago(monto=0),
+        _pago(id_tipo_pago=99),
+        _pago(rut_usuario="99999999-9"),
+        {"rut_usuario": RUT},
+        _pago(),
+    ])
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.json()
+    assert (cuerpo["total"], cuerpo["insertados"], cuerpo["errores"]) == (6, 2, 4)
+    detalles = _detalles(respuesta)
+    assert detalles[0] is None and detalles[5] is None
+    assert detalles[1] == "El monto debe ser mayor a cero"
+    assert detalles[2] == "ID de tipo de pago inválido"
+    assert detalles[3] == "Usuario no encontrado"
+    assert "monto" in detalles[4]
+
+
+def test_lote_de_pagos_traduce_errores_de_la_base(pool_pagos, pedir):
+    # Las filas 1 y 2 llegan a la base y las rechaza; el detalle no expone el ORA
+    pool_pagos.errores_lote["INSERT INTO pago"] = {
+        0: _padre("FK_PAGO_USUARIO"),
+        1: (12899, 'ORA-12899: value too large for column "API_SITIOFERREMAS"."PAGO"."RUT_USUARIO"'),
+    }
+    respuesta = pedir("POST", "/pagos/batch", json=[_pago(), _pago(), _pago()])
+    assert respuesta.json()["insertados"] == 1
+    detalles = _detalles(respuesta)
+    assert detalles[0] == "Usuario no encontrado"
+    assert detalles[1] == "Fila rechazada por la base de datos"
+    assert "ORA-" not in respuesta.text and "API_SITIOFERREMAS" not in respuesta.text
+
+
+def test_lote_de_pagos_en_pocos_viajes(pool_pagos, pedir):
+    # Usuarios, inserción, resumen y commit: cuatro viajes para cualquier tamaño
+    respuesta = pedir("POST", "/pagos/batch", json=[_pago() for _ in range(200)])
+    assert respuesta.json()["insertados"] == 200
+    assert pool_pagos.viajes == 4
+
+
+@pytest.mark.parametrize("cuerpo, tipo, status", [
+    ("[]", "application/json", 400),
+    ("{", "application/json", 400),
+    ("rut_usuario", "text/plain", 415),
+])
+def test_lote_invalido(pool, pedir, cuerpo, tipo, status):
+    respuesta = pedir("POST", "/pagos/batch", content=cuerpo, headers={"Content-Type": tipo})
+    assert respuesta.status_code == status
+
+
+# -------------------- IMPORTACIÓN DE TRABAJADORES --------------------
+def _trabajador(i, **cambios):
+    return {"rut": f"2000000{i}-{i}", "nombre": "Nombre", "apellido": "Apellido", "email": f"t{i}@ferremas.cl",
+            "telefono": 912345678, "clave": "clave", "rol": "vendedor", "id_comuna": 1, **cambios}
+
+
+def test_importacion_informa_cada_fila(pool, pedir):
+    pool.respuestas["SELECT rut, email FROM usuario WHERE rut IN"] = [("19999999-9", "t5@ferremas.cl")]
+    pool.errores_lote["INSERT INTO usuario"] = {
+        1: (ORA_UNICA, "ORA-00001: unique constraint (API_SITIOFERREMAS.UK_USUARIO_EMAIL) violated"),
+        2: (1400, 'ORA-01400: cannot insert NULL into ("API_SITIOFERREMAS"."USUARIO"."NOMBRE")'),
+    }
+    respuesta = pedir("POST", "/usuarios/registro-trabajador/importar", json=[
+        _trabajador(0),
+        _trabajador(1, rol="cliente"),
+        _trabajador(2, telefono=123),
+        _trabajador(3, rut="20000000-0"),
+        _trabajador(4, email="t0@ferremas.cl"),
+        _trabajador(5),
+        _trabajador(6),
+        _trabajador(7),
+    ])
+    assert respuesta.status_code == 200
+    detalles = _detalles(respuesta)
+    assert detalles[0] is None
+    assert detalles[1] == "No puedes asignar rol cliente"
+    assert detalles[2] == "El teléfono debe tener 9 dígitos"
+    assert detalles[3] == "RUT repetido en el archivo"
+    assert detalles[4] == "Email repetido en el archivo"
+    assert detalles[5] == "Email ya registrado"
+    # Filas 6 y 7: la segunda y la tercera del executemany, rechazadas por la base
+    assert detalles[6] == "Email ya registrado"
+    assert detalles[7] == "Fila rechazada por la base de datos"
+    assert respuesta.json()["insertados"] == 1
+    assert "ORA-" not in respuesta.text
@@ -0,0 +1,69 @@
+"""Paginación por cursor: ida y vuelta del cursor y cursores alterados."""
+import base64
+import json
+
+import pytest
+
+from app.paginacion import decodificar_cursor, parsear_entero, parsear_fecha, parsear_texto
+
+def _cursor(valores) -> str:
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).rstrip(b"=").decode()
+
+
+@pytest.fixture
+def binds(pool):
+    # Binds de cada consulta, en orden
+    leidos = []
+    filas_para = pool.filas_para
+    pool.filas_para = lambda sql, b=None: (leidos.append(b), filas_para(sql, b))[1]
+    return leidos
+
+
+# -------------------- IDA Y VUELTA --------------------
+@pytest.mark.parametrize("ruta, convertir, clave", [
+    ("/pagos/", (parsear_fecha, parsear_entero), lambda fila: [parsear_fecha(fila["fecha_pago"]), fila["id_pago"]]),
+    ("/despacho/", (parsear_entero,), lambda fila: [fila["id"]]),
+    ("/usuarios/usuarios", (parsear_texto,), lambda fila: [fila["rut"]]),
+])
+def test_cursor_apunta_a_la_ultima_fila(pool, pedir, ruta, convertir, clave):
+    pool.filas = 10
+    pagina = pedir("GET", ruta, params={"limite": 3}).json()
+    assert len(pagina["items"]) == 3
+    assert decodificar_cursor(pagina["siguiente"], *convertir) == clave(pagina["items"][-1])
+
+
+def test_cursor_llega_a_los_binds(pool, pedir, binds):
+    pool.filas = 10
+    siguiente = pedir("GET", "/pagos/", params={"limite": 3}).json()["siguiente"]
+    binds.clear()
+    assert pedir("GET", "/pagos/", params={"limite": 3, "cursor": siguiente}).status_code == 200
+    assert [binds[0]["cursor_fecha"], binds[0]["cursor_id"]] == decodificar_cursor(
+        siguiente, parsear_fecha, parsear_entero
+    )
+
+
+def test_ultima_pagina_sin_siguiente(pool, pedir):
+    pool.filas = 2
+    assert pedir("GET", "/despacho/", params={"limite": 3}).json()["siguiente"] is None
+
+
+# -------------------- CURSORES INVÁLIDOS --------------------
+@pytest.mark.parametrize("ruta, cursor", [
+    ("/pagos/", "%%%"),
+    ("/pagos/", _cursor({"fecha": "2024-01-01"})),
+    ("/pagos/", _cursor(["2024-01-01T00:00:00"])),
+    ("/pagos/", _cursor(["2024-01-01T00:00:00", {"id": 1}])),
+    ("/pagos/", _cursor(["2024-01-01T00:00:00", "7"])),
+    ("/pagos/", _cursor(["2024-01-01T00:00:00", True])),
+    ("/pagos/", _cursor([123, 7])),
+    ("/pagos/", _cursor(["ayer", 7])),
+    ("/despacho/", _cursor([[1]])),
+    ("/despacho/", _cursor([1.5])),
+    ("/usuarios/usuarios", _cursor([{"rut": "1"}])),
+    ("/usuarios/usuarios", _cursor([11111111])),
+    ("/usuarios/usuarios", _cursor(["1", "2"])),
+])
+def test_cursor_invalido(pool, pedir, ruta, cursor):
+    respuesta = pedir("GET", ruta, params={"cursor": cursor})
+    assert (respuesta.status_code, respuesta.json()["detail"]) == (400, "Cursor de paginación inválido")
+    assert pool.viajes == 0
@@ -0,0 +1,39 @@
+"""Pool de conexiones: una espera agotada responde 503 con Retry-After."""
+import asyncio
+
+import httpx
+
+import app.database as database
+from app.main import app
+from app.seguridad import crear_tokens
+from benchmarks.fake_oracle import FakeAsyncPool
+from tests.conftest import EMAIL, RUT
+
+
+def test_pool_agotado_responde_503(pool, pedir, monkeypatch):
+    # Todas las conexiones ocupadas: la espera se agota y no se expone el DPY
+    monkeypatch.setattr(database, "_pool", FakeAsyncPool(latencia=0, filas=1, max=1, wait_timeout=10))
+
+    async def ocupada():
+        await database._pool.acquire()
+
+    asyncio.run(ocupada())
+    respuesta = pedir("GET", "/despacho/")
+    assert respuesta.status_code == 503
+    assert respuesta.headers["retry-after"] == database.POOL_RETRY_AFTER
+    assert "DPY" not in respuesta.text
+    assert database.estadisticas_pool()["agotadas"] >= 1
+
+
+def test_pool_con_espera_corta_atiende_en_orden(monkeypatch):
+    # Con conexiones que se liberan a tiempo nadie recibe 503
+    monkeypatch.setattr(database, "_pool", FakeAsyncPool(latencia=0.005, filas=1, max=2, wait_timeout=1000))
+    token = crear_tokens(RUT, "administrador", EMAIL)["access_token"]
+
+    async def varias():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba",
+                                     headers={"Authorization": f"Bearer {token}"}) as cliente:
+            return await asyncio.gather(*(cliente.get("/despacho/") for _ in range(10)))
+
+    assert {respuesta.status_code for respuesta in asyncio.run(varias())} == {200}
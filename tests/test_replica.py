@@ -0,0 +1,140 @@
+"""Réplica de lectura: reparto de lecturas, vuelta al primario y lectura de lo propio."""
+import asyncio
+import time
+from collections import OrderedDict
+
+import httpx
+import oracledb
+import pytest
+
+import app.database as database
+from app import lectura_propia, seguridad
+from app.main import app
+from benchmarks.fake_oracle import FakeAsyncPool, FakeError
+from tests.conftest import EMAIL, RUT
+
+PAGO = {"rut_usuario": RUT, "id_tipo_pago": 1, "monto": 1000}
+
+
+@pytest.fixture
+def replica(pool, monkeypatch):
+    # Segundo pool falso como réplica, disponible y al día
+    replica = FakeAsyncPool(latencia=0, filas=1)
+    monkeypatch.setattr(database, "_pool_lectura", replica)
+    monkeypatch.setattr(database, "_replica", {**database._replica, "disponible": True,
+                                               "lecturas": 0, "al_primario": 0, "errores": 0})
+    monkeypatch.setattr(database, "_escrituras_recientes", OrderedDict())
+    monkeypatch.setattr(lectura_propia, "DB_REPLICA_DSN", "replica")
+    return replica
+
+
+def _sesion(*pasos, token=None, cookies=None):
+    # Varias peticiones con el mismo token (la clave de la sesión) y las mismas cookies
+    async def todas():
+        clave = token or seguridad.crear_tokens(RUT, "administrador", EMAIL)["access_token"]
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba", cookies=cookies,
+                                     headers={"Authorization": f"Bearer {clave}"}) as cliente:
+            return [await cliente.request(metodo, ruta, **opciones) for metodo, ruta, opciones in pasos]
+    return asyncio.run(todas())
+
+
+def _viajes(pool, replica):
+    viajes = (pool.viajes, replica.viajes)
+    pool.viajes = replica.viajes = 0
+    return viajes
+
+
+# -------------------- REPARTO --------------------
+def test_lecturas_van_a_la_replica(pool, replica, pedir):
+    assert pedir("GET", "/pagos/").status_code == 200
+    assert _viajes(pool, replica) == (0, 1)
+    assert database._replica["lecturas"] == 1
+
+
+def test_escrituras_van_al_primario(pool, replica, pedir):
+    assert pedir("POST", "/pagos/", params=PAGO).status_code == 200
+    assert _viajes(pool, replica) == (1, 0)
+
+
+def test_replica_atrasada_lee_del_primario(pool, replica, pedir):
+    database._replica["disponible"] = False
+    assert pedir("GET", "/pagos/").status_code == 200
+    assert _viajes(pool, replica) == (1, 0)
+    assert database._replica["al_primario"] == 1
+
+
+def test_replica_caida_vuelve_al_primario(pool, replica, pedir, monkeypatch):
+    async def caida():
+        replica.viajes += 1
+        raise oracledb.DatabaseError(FakeError(12541, "ORA-12541: TNS:no listener"))
+
+    monkeypatch.setattr(replica, "acquire", caida)
+    respuesta = pedir("GET", "/pagos/")
+    assert respuesta.status_code == 200
+    assert _viajes(pool, replica) == (1, 1)
+    assert database._replica["disponible"] is False
+    assert (database._replica["errores"], database._replica["al_primario"]) == (1, 1)
+
+    # Hasta el próximo chequeo ni se intenta la réplica
+    assert pedir("GET", "/pagos/").status_code == 200
+    assert _viajes(pool, replica) == (1, 0)
+
+
+def test_chequeo_marca_la_replica_atrasada(pool, replica):
+    replica.respuestas["apply lag"] = [(database.REPLICA_RETRASO_MAX + 1,)]
+    asyncio.run(database._medir_retraso())
+    assert database._replica["disponible"] is False
+    assert database.lee_del_primario()
+
+    replica.respuestas["apply lag"] = [(0,)]
+    asyncio.run(database._medir_retraso())
+    assert database._replica["disponible"] is True
+    assert not database.lee_del_primario()
+
+
+# -------------------- LECTURA DE LO PROPIO --------------------
+def test_sesion_que_escribio_lee_del_primario(pool, replica):
+    escritura, lectura = _sesion(("POST", "/pagos/", {"params": PAGO}), ("GET", "/pagos/", {}))
+    assert (escritura.status_code, lectura.status_code) == (200, 200)
+    assert _viajes(pool, replica) == (2, 0)
+
+
+def test_el_token_basta_sin_la_cookie(pool, replica):
+    token = seguridad.crear_tokens(RUT, "administrador", EMAIL)["access_token"]
+    _sesion(("POST", "/pagos/", {"params": PAGO}), token=token)
+    _viajes(pool, replica)
+    _sesion(("GET", "/pagos/", {}), token=token)
+    assert _viajes(pool, replica) == (1, 0)
+
+
+def test_la_cookie_sirve_en_otro_worker(pool, replica):
+    # Otro worker no conoce el token, pero la cookie lleva el instante límite
+    cookie = _sesion(("POST", "/pagos/", {"params": PAGO}))[0].cookies[lectura_propia.COOKIE_LECTURA]
+    database._escrituras_recientes.clear()
+    _viajes(pool, replica)
+    _sesion(("GET", "/pagos/", {}), cookies={lectura_propia.COOKIE_LECTURA: cookie})
+    assert _viajes(pool, replica) == (1, 0)
+
+
+def test_otras_sesiones_siguen_en_la_replica(pool, replica):
+    _sesion(("POST", "/pagos/", {"params": PAGO}))
+    _viajes(pool, replica)
+    otra = seguridad.crear_tokens("22222222-2", "administrador", EMAIL)["access_token"]
+    _sesion(("GET", "/pagos/", {}), token=otra)
+    assert _viajes(pool, replica) == (0, 1)
+
+
+def test_escritura_rechazada_no_marca_la_sesion(pool, replica):
+    rechazada, lectura = _sesion(("POST", "/pagos/", {"params": {**PAGO, "monto": 0}}), ("GET", "/pagos/", {}))
+    assert rechazada.status_code == 400
+    assert lectura_propia.COOKIE_LECTURA not in rechazada.cookies
+    assert _viajes(pool, replica) == (0, 1)
+
+
+def test_ventana_vencida_vuelve_a_la_replica(pool, replica):
+    token = seguridad.crear_tokens(RUT, "administrador", EMAIL)["access_token"]
+    database._escrituras_recientes[token] = time.monotonic() - database.LECTURA_PROPIA_S - 1
+    vencida = str(int(time.time()) - 1)
+    _sesion(("GET", "/pagos/", {}), token=token, cookies={lectura_propia.COOKIE_LECTURA: vencida})
+    assert _viajes(pool, replica) == (0, 1)
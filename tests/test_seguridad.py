@@ -0,0 +1,191 @@
+"""JWT (firma, rotación de claves y refresco), primer administrador y permisos
+sobre cuentas ajenas."""
+import itertools
+import json
+
+import pytest
+
+from app import seguridad
+from tests.conftest import EMAIL, RUT
+
+OTRO_RUT = "22222222-2"
+
+MODIFICACIONES = [
+    ("PATCH", f"/usuarios/modificar-clave/{OTRO_RUT}", {"json": {"clave": "nueva-clave"}}),
+    ("PATCH", f"/usuarios/modificar/{OTRO_RUT}", {"json": {"email": "otro@ferremas.cl"}}),
+]
+
+
+# -------------------- ESCRITURA SOBRE OTRA CUENTA --------------------
+@pytest.mark.parametrize("metodo, ruta, opciones", MODIFICACIONES, ids=["modificar-clave", "modificar"])
+@pytest.mark.parametrize("rol", ["vendedor", "contador", "bodeguero", "cliente"])
+def test_solo_dueno_o_administrador_modifica(pool, pedir, rol, metodo, ruta, opciones):
+    respuesta = pedir(metodo, ruta, rol=rol, **opciones)
+    assert respuesta.status_code == 403
+    assert pool.viajes == 0
+
+
+@pytest.mark.parametrize("metodo, ruta, opciones", MODIFICACIONES, ids=["modificar-clave", "modificar"])
+def test_administrador_modifica_otra_cuenta(pool, pedir, metodo, ruta, opciones):
+    assert pedir(metodo, ruta, **opciones).status_code == 200
+
+
+def test_dueno_modifica_su_clave(pool, pedir):
+    respuesta = pedir("PATCH", "/usuarios/modificar-clave/11111111-1", rol="vendedor", json={"clave": "nueva-clave"})
+    assert respuesta.status_code == 200
+
+
+def test_personal_sigue_leyendo_otra_cuenta(pool, pedir):
+    assert pedir("GET", f"/usuarios/usuario/{OTRO_RUT}", rol="vendedor").status_code == 200
+
+
+# -------------------- FIRMA Y VALIDACIÓN --------------------
+def _reemplazar_parte(token, posicion, datos):
+    partes = token.split(".")
+    partes[posicion] = seguridad._b64(json.dumps(datos).encode())
+    return ".".join(partes)
+
+
+def test_token_firmado_se_valida():
+    payload = seguridad.decodificar_token(seguridad.crear_tokens(RUT, "contador", EMAIL)["access_token"])
+    assert (payload["sub"], payload["rol"], payload["email"]) == (RUT, "contador", EMAIL)
+
+
+@pytest.mark.parametrize("alterar", [
+    lambda token: _reemplazar_parte(token, 1, {**seguridad.decodificar_token(token), "rol": "administrador"}),
+    lambda token: _reemplazar_parte(token, 0, {"alg": "none", "typ": "JWT", "kid": "temporal"}),
+    lambda token: _reemplazar_parte(token, 0, {"alg": "HS256", "typ": "JWT", "kid": "desconocida"}),
+    lambda token: token[:-4] + "AAAA",
+    lambda token: "no-es-un-token",
+], ids=["payload", "alg", "kid", "firma", "formato"])
+def test_token_alterado_se_rechaza(alterar):
+    token = seguridad.crear_tokens(RUT, "cliente", EMAIL)["access_token"]
+    with pytest.raises(seguridad.HTTPException) as error:
+        seguridad.decodificar_token(alterar(token))
+    assert (error.value.status_code, error.value.detail) == (401, "Token inválido")
+
+
+def test_token_expirado(monkeypatch):
+    monkeypatch.setattr(seguridad, "JWT_ACCESO_TTL", -1)
+    token = seguridad.crear_tokens(RUT, "cliente", EMAIL)["access_token"]
+    with pytest.raises(seguridad.HTTPException) as error:
+        seguridad.decodificar_token(token)
+    assert error.value.detail == "Token expirado"
+
+
+def test_tipos_de_token_no_se_intercambian():
+    tokens = seguridad.crear_tokens(RUT, "cliente", EMAIL)
+    with pytest.raises(seguridad.HTTPException):
+        seguridad.decodificar_token(tokens["refresh_token"])
+    with pytest.raises(seguridad.HTTPException):
+        seguridad.decodificar_token(tokens["access_token"], tipo="refresh")
+
+
+def test_ruta_protegida_sin_token(pool, pedir):
+    respuesta = pedir("GET", f"/usuarios/usuario/{RUT}", rol=None)
+    assert respuesta.status_code == 401
+    assert respuesta.headers["www-authenticate"] == "Bearer"
+
+
+# -------------------- ROTACIÓN DE CLAVES --------------------
+@pytest.fixture
+def archivo_claves(monkeypatch, tmp_path):
+    # Conjunto de claves propio leído de un archivo; kids distintos aunque
+    # se roten varias en el mismo segundo
+    ruta = tmp_path / "claves.json"
+    kids = itertools.count(1)
+    monkeypatch.setattr(seguridad, "JWT_CLAVES_ARCHIVO", str(ruta))
+    monkeypatch.setattr(seguridad, "claves", seguridad.ConjuntoClaves())
+    monkeypatch.setattr(seguridad.time, "strftime", lambda formato: f"k{next(kids)}")
+    return str(ruta)
+
+
+def test_rotacion_conserva_claves_anteriores(archivo_claves):
+    seguridad.rotar_claves(archivo_claves)
+    anterior = seguridad.crear_tokens(RUT, "cliente", EMAIL)["access_token"]
+
+    assert seguridad.rotar_claves(archivo_claves) == "k2"
+    seguridad.claves.invalidar()
+    nuevo = seguridad.crear_tokens(RUT, "cliente", EMAIL)["access_token"]
+
+    assert json.loads(seguridad._b64_decode(nuevo.split(".")[0]))["kid"] == "k2"
+    assert seguridad.decodificar_token(anterior)["sub"] == RUT
+    assert seguridad.decodificar_token(nuevo)["sub"] == RUT
+
+
+def test_rotacion_descarta_claves_viejas(archivo_claves, monkeypatch):
+    monkeypatch.setattr(seguridad, "JWT_CLAVES_RETENIDAS", 2)
+    seguridad.rotar_claves(archivo_claves)
+    viejo = seguridad.crear_tokens(RUT, "cliente", EMAIL)["access_token"]
+    seguridad.rotar_claves(archivo_claves)
+    seguridad.rotar_claves(archivo_claves)
+    seguridad.claves.invalidar()
+
+    with open(archivo_claves, encoding="utf-8") as archivo:
+        assert list(json.load(archivo)["claves"]) == ["k2", "k3"]
+    with pytest.raises(seguridad.HTTPException):
+        seguridad.decodificar_token(viejo)
+
+
+def test_archivo_ilegible_mantiene_las_claves_cargadas(archivo_claves):
+    seguridad.rotar_claves(archivo_claves)
+    token = seguridad.crear_tokens(RUT, "cliente", EMAIL)["access_token"]
+    with open(archivo_claves, "w", encoding="utf-8") as archivo:
+        archivo.write("{")
+    seguridad.claves.invalidar()
+    assert seguridad.decodificar_token(token)["sub"] == RUT
+
+
+def test_sin_claves_configuradas_no_arranca(monkeypatch):
+    monkeypatch.setattr(seguridad, "JWT_CLAVE_TEMPORAL", False)
+    monkeypatch.setattr(seguridad, "claves", seguridad.ConjuntoClaves())
+    with pytest.raises(RuntimeError):
+        seguridad.verificar_claves()
+
+
+# -------------------- REFRESCO --------------------
+def _refrescar(pedir, token):
+    return pedir("POST", "/usuarios/token/refrescar", rol=None, json={"refresh_token": token})
+
+
+def test_refresco_usa_el_rol_actual(pool, pedir):
+    pool.respuestas["SELECT rol, email"] = [("contador", EMAIL)]
+    respuesta = _refrescar(pedir, seguridad.crear_tokens(RUT, "cliente", EMAIL)["refresh_token"])
+    assert respuesta.status_code == 200
+    assert seguridad.decodificar_token(respuesta.json()["access_token"])["rol"] == "contador"
+    assert pool.viajes == 1
+
+
+def test_refresco_de_usuario_eliminado(pool, pedir):
+    pool.respuestas["SELECT rol, email"] = []
+    respuesta = _refrescar(pedir, seguridad.crear_tokens(RUT, "cliente", EMAIL)["refresh_token"])
+    assert respuesta.status_code == 401
+
+
+def test_refresco_no_acepta_token_de_acceso(pool, pedir):
+    respuesta = _refrescar(pedir, seguridad.crear_tokens(RUT, "cliente", EMAIL)["access_token"])
+    assert respuesta.status_code == 401
+    assert pool.viajes == 0
+
+
+# -------------------- PRIMER ADMINISTRADOR --------------------
+ADMINISTRADOR = {"json": {"rut": "33333333-3", "nombre": "Admin", "email": "admin@ferremas.cl", "clave": "clave"}}
+HAY_ADMINISTRADOR = "usuario WHERE LOWER(rol) = 'administrador' FETCH"
+
+
+def test_primer_administrador_sin_sesion(pool, pedir):
+    pool.respuestas[HAY_ADMINISTRADOR] = []
+    respuesta = pedir("POST", "/usuarios/registro-administrador", rol=None, **ADMINISTRADOR)
+    assert respuesta.status_code == 200
+
+
+def test_sin_sesion_con_administradores_existentes(pool, pedir):
+    # Se rechaza con la consulta previa, antes de gastar bcrypt
+    respuesta = pedir("POST", "/usuarios/registro-administrador", rol=None, **ADMINISTRADOR)
+    assert respuesta.status_code == 401
+    assert pool.viajes == 1
+
+
+@pytest.mark.parametrize("rol, status", [("administrador", 200), ("vendedor", 403), ("cliente", 403)])
+def test_registro_administrador_con_sesion(pool, pedir, rol, status):
+    assert pedir("POST", "/usuarios/registro-administrador", rol=rol, **ADMINISTRADOR).status_code == status